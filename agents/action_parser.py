@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import json
+from typing import Dict, Any, Optional
+
+
+class StreamingActionParser:
+    """
+    增量式 JSON 行动解析器。
+    随着 LLM 流式响应不断喂入文本，一旦出现第一个完整的
+    {"thought": ..., "action": {...}} (或 {"thought": ..., "actions": [...]}) 对象就立即返回，无需等待整个响应结束。
+    已扫描过的字符不会被重复扫描，因此总开销与响应长度成线性关系。
+    """
+    def __init__(self):
+        self.buffer = ""
+        self.action: Optional[Dict[str, Any]] = None
+        self._pos = 0          # 下一个待扫描字符的位置
+        self._depth = 0        # 当前花括号嵌套深度
+        self._start = -1       # 当前顶层对象的起始位置
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        喂入一段新的文本增量。
+
+        参数:
+            text (str): 流式响应中新到达的文本片段
+
+        返回:
+            Optional[Dict[str, Any]]: 若已解析出完整的行动对象则返回它，否则返回 None
+        """
+        if self.action is not None:
+            return self.action
+
+        self.buffer += text
+        buffer = self.buffer
+        for i in range(self._pos, len(buffer)):
+            ch = buffer[i]
+            if self._depth == 0:
+                # 对象外部的文字 (例如说明性内容或 ```json 围栏) 直接跳过
+                if ch == "{":
+                    self._start = i
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = self._try_parse(buffer[self._start:i + 1])
+                    self._start = -1
+                    if candidate is not None:
+                        self._pos = i + 1
+                        self.action = candidate
+                        return candidate
+
+        self._pos = len(buffer)
+        return None
+
+    @staticmethod
+    def _try_parse(json_str: str) -> Optional[Dict[str, Any]]:
+        """尝试将一个花括号平衡的片段解析为行动对象"""
+        try:
+            obj = json.loads(json_str)
+        except json.JSONDecodeError:
+            return None
+        if isinstance(obj, dict) and "thought" in obj and (
+                isinstance(obj.get("action"), dict) or isinstance(obj.get("actions"), list)):
+            return obj
+        return None
@@ -1,40 +1,55 @@
 # -*- coding: utf-8 -*-
+import contextvars
 import json
 import logging
 import re
-from typing import List, Dict, Any, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Tuple, Optional
 
-from core.llm import call_llm
-from agents.prompts import MANUS_INSTRUCTIONS, MANUS_PROMPT_TEMPLATE
-from tools.base_tool import BaseTool
+from config import AppConfig
+from core import replay, routing, tracing
+from core.artifacts import get_artifact_store
+from core.llm import call_llm, call_llm_with_tools, stream_llm, is_llm_error, router
+from agents.action_parser import StreamingActionParser
+from agents.plan import PlanStep
+from agents.prompt_builder import PromptBuilder
+from core.checkpoint import Checkpointer
+from core.history import History
+from core.log_setup import log_event, log_verbose
+from tools.base_tool import BaseTool, ToolResult
+from tools.registry import ARTIFACT_TOOL, render_toolset
+
+# 结束当前步骤或整个任务的工具；一次回应中它们之后的行动不再执行
+STEP_COMPLETE = "step_complete"
+FINISH = "finish"
 
 class ManusAgent:
     """
     核心执行智能体(基于ReAct机制)。
     通过思考-行动的循环流程按照计划执行任务步骤。
     """
-    def __init__(self, tools: List[BaseTool]):
+    def __init__(self, tools: List[BaseTool], workspace: Optional[str] = None):
         """
         初始化ManusAgent
 
         参数:
             tools (List[BaseTool]): 所有可用工具实例的列表
+            workspace (Optional[str]): 工具操作的工作区目录 (大段观察保存为其中的工件)，默认使用全局配置的工作区
         """
         self.tools = tools
+        self.artifacts = get_artifact_store(workspace)
         self.tool_map = {tool.name: tool for tool in tools}
-        self.tools_description = self._get_tools_description()
-        self.tools_list = self._get_tools_list()
-
-    def _get_tools_description(self) -> str:
-        """生成所有工具的描述字符串，用于系统提示"""
-        return "\n".join([f"- {tool.name}: {tool.description}" for tool in self.tools])
-
-    def _get_tools_list(self) -> str:
-        """生成包含工具名称和参数的用户提示列表"""
-        return "\n".join([
-            f"  - {tool.name}({tool.get_args_str()}): {tool.description}"
-            for tool in self.tools
-        ])
+        # 工具描述、工具列表和函数调用定义按工具集指纹缓存，同一组工具的智能体共享
+        self.toolset = render_toolset(tools)
+        self.tool_schemas = self.toolset.schemas
+        # "tools" 为原生函数调用，服务端不支持时自动回退到 "text" (JSON 文本协议)
+        self.action_protocol = AppConfig.LLM_ACTION_PROTOCOL
+        # 系统提示和工具列表只格式化一次，在所有循环中复用
+        self.prompt_builders = {
+            protocol: PromptBuilder(self.toolset.description, self.toolset.tools_list, protocol=protocol,
+                                    multi_action=AppConfig.LLM_MULTI_ACTION, fingerprint=self.toolset.fingerprint)
+            for protocol in ("text", "tools")
+        }
 
     def _find_json_block(self, text: str) -> Dict[str, Any]:
         """从LLM响应中提取第一个有效的JSON块"""
@@ -55,72 +70,337 @@ class ManusAgent:
             print(f"❌ 无法从LLM响应解析JSON: {text}")
             return None
 
-    def run_step(self, task: str, plan: List[str], current_step_index: int, previous_steps_history: str) -> Tuple[str, bool, str]:
-
-        current_step = plan[current_step_index - 1]
-        plan_str = "\n".join(f"{i}. {s}" for i, s in enumerate(plan, 1))
+    def _request_action(self, prompt: str, instructions: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        向LLM请求下一步行动。
 
-        local_history = ""
-        max_loops = 10
+        启用流式模式时，一边接收一边增量解析，一旦得到第一个完整的
+        thought/action 对象就取消剩余的流并立即返回。
 
-        for i in range(max_loops):
-            print(f"\n🔄 ManusAgent思考循环 {i+1}/{max_loops}，当前步骤 {current_step_index}...")
+        返回:
+            Tuple[str, Optional[Dict[str, Any]]]: (已收到的响应文本, 流式解析出的行动；未解析出则为 None)；
+                调用失败或流式响应中断时响应文本为错误消息
+        """
+        if not AppConfig.LLM_STREAM:
+            return call_llm(prompt, instructions=instructions), None
 
-            prompt = MANUS_PROMPT_TEMPLATE.format(
-                task=task,
-                plan=plan_str,
-                history=previous_steps_history + local_history,
-                current_step=f"{current_step_index}. {current_step}",
-                tools_list=self.tools_list
-            )
+        parser = StreamingActionParser()
+        chunks = stream_llm(prompt, instructions=instructions)
+        try:
+            for delta in chunks:
+                if is_llm_error(delta):
+                    return delta, None  # 流式响应中断，已收到的部分内容不完整
+                action_json = parser.feed(delta)
+                if action_json is not None:
+                    logging.info("⚡ 已解析出完整行动，取消剩余的流式输出。")
+                    return parser.buffer.strip(), action_json
+        finally:
+            chunks.close()
+        return parser.buffer.strip(), None
 
-            # 从LLM获取下一步行动
-            llm_response = call_llm(prompt, instructions=MANUS_INSTRUCTIONS.format(tools_description=self.tools_description))
+    @staticmethod
+    def _actions_from_json(action_json: Any) -> List[Dict[str, Any]]:
+        """从 JSON 文本协议的响应对象中取出行动列表 (支持单个 action 或 actions 列表)"""
+        if not isinstance(action_json, dict):
+            return []
+        if isinstance(action_json.get("actions"), list):
+            return [action for action in action_json["actions"] if isinstance(action, dict)]
+        if isinstance(action_json.get("action"), dict):
+            return [action_json["action"]]
+        return []
 
-            if "Error:" in llm_response:
-                observation = f"LLM调用失败。详情: {llm_response}"
-                local_history += f"\nObservation: {observation}"
-                continue
+    def _request_text_action(self, prompt: str, instructions: str) -> Tuple[Optional[str], List[Dict[str, Any]], Optional[str]]:
+        """
+        使用 JSON 文本协议请求下一步行动。
 
+        返回:
+            Tuple[Optional[str], List[Dict[str, Any]], Optional[str]]:
+                (思考, 行动列表, LLM 调用失败时的错误消息)；响应格式无效时行动列表为空
+        """
+        llm_response, action_json = self._request_action(prompt, instructions=instructions)
+        if action_json is None and is_llm_error(llm_response):
+            return None, [], llm_response
+        if action_json is None:
             action_json = self._find_json_block(llm_response)
+        actions = self._actions_from_json(action_json)
+        if not actions:
+            return None, [], None
+        return action_json.get("thought", "[未提供思考内容]"), actions, None
 
-            if not action_json:
-                observation = "无效操作格式。请严格使用指定JSON格式响应，包含`thought`和`action`键。"
-                local_history += f"\nObservation: {observation}"
-                continue
+    def _request_tool_calls(self, prompt: str, instructions: str) -> Tuple[Optional[str], List[Dict[str, Any]], Optional[str]]:
+        """
+        使用原生函数调用请求下一步行动，一次响应中可以包含多个工具调用。
+        模型没有发起工具调用时，尝试按 JSON 文本协议解析响应正文。
+        服务端拒绝 tools 参数 (400/404/422) 时，本智能体之后改用 JSON 文本协议。
 
-            thought = action_json.get("thought", "[未提供思考内容]")
-            action = action_json.get("action", {})
-            tool_name = action.get("name")
-            tool_args = action.get("args", {})
+        返回:
+            与 `_request_text_action` 相同
+        """
+        response = call_llm_with_tools(prompt, instructions=instructions, tools=self.tool_schemas)
+        if is_llm_error(response.content):
+            if response.status_code in (400, 404, 422):
+                logging.warning("⚠️ 服务端似乎不支持原生函数调用，之后改用 JSON 文本协议。")
+                self.action_protocol = "text"
+            return None, [], response.content
 
-            logging.info(f"🤔 思考: {thought}")
-            logging.info(f"🎬 行动: 调用工具`{tool_name}`，参数: {tool_args}")
+        if not response.tool_calls:
+            action_json = self._find_json_block(response.content)
+            actions = self._actions_from_json(action_json)
+            if actions:
+                return action_json.get("thought", "[未提供思考内容]"), actions, None
+            return None, [], None
 
-            local_history += f"\nThought: {thought}\nAction: {json.dumps(action_json, indent=2, ensure_ascii=False)}"
-            logging.info(f"当前对话历史: {local_history}")
+        actions = []
+        for call in response.tool_calls:
+            try:
+                args = json.loads(call.arguments) if call.arguments.strip() else {}
+            except json.JSONDecodeError as e:
+                args = None
+                logging.warning(f"⚠️ 工具`{call.name}`的参数不是有效的 JSON: {e}")
+            actions.append({"name": call.name, "args": args})
+        return response.content or "[未提供思考内容]", actions, None
 
-            if tool_name in self.tool_map:
-                tool = self.tool_map[tool_name]
+    def _execute_action(self, action: Dict[str, Any]) -> ToolResult:
+        """执行单个行动并返回结果。不修改历史，可以在工作线程中调用。"""
+        tool_name = action.get("name")
+        tool_args = action.get("args", {})
+        if not isinstance(tool_args, dict):
+            result = ToolResult.error(f"工具'{tool_name}'的参数无效，必须是一个JSON对象。")
+            logging.info(f"❌ {result}")
+            return result
+        tool = self.tool_map.get(tool_name)
+        if tool is None:
+            result = ToolResult.error(f"未找到工具'{tool_name}'。请从可用工具列表中选择。")
+            logging.info(f"❌ {result}")
+            return result
+        result = replay.lookup_tool(tool_name, tool_args)
+        if result is not None:
+            log_event("tool.observation", f"⏪ 回放观察 ({tool_name}):", payload={"observation": result.output},
+                      tool=tool_name, status=result.status, chars=len(result.output), replayed=True)
+        else:
+            with tracing.span(f"tool.{tool_name}", tracing.TOOL, tool=tool_name) as tool_span:
                 try:
-                    observation = tool.execute(**tool_args)
-                    logging.info(f"👀 观察: {observation}")
+                    result = tool.run(**tool_args)
+                    log_event("tool.observation", f"{'❌' if result.failed else '👀'} 观察 ({tool_name}):",
+                              payload={"observation": result.output}, tool=tool_name, status=result.status,
+                              chars=len(result.output))
                 except Exception as e:
-                    observation = f"执行工具'{tool_name}'出错: {e}"
-                    logging.info(f"❌ {observation}")
+                    result = ToolResult.error(f"执行工具'{tool_name}'出错: {e}")
+                    logging.info(f"❌ {result}")
+                    tool_span.set(error=f"{e.__class__.__name__}: {e}")
+                tool_span.set(status=result.status, output_bytes=len(result.output.encode("utf-8")))
+        replay.record_tool(tool_name, tool_args, result)
+        return result
 
-                local_history += f"\nObservation: {observation}"
+    def _is_parallel_safe(self, action: Dict[str, Any]) -> bool:
+        tool = self.tool_map.get(action.get("name"))
+        args = action.get("args", {})
+        return tool is not None and isinstance(args, dict) and tool.is_read_only(args)
 
-                if tool.name == "finish":
-                    return local_history, True, tool_args.get("summary", "未提供摘要")
+    def _execute_actions(self, actions: List[Dict[str, Any]]) -> List[ToolResult]:
+        """
+        执行一次回应中的所有行动，返回与之一一对应的结果。
+
+        相邻的只读行动组成一批，在线程池中并发执行；有副作用的行动单独执行，
+        作为批次之间的屏障，因此写操作与其前后行动的先后关系保持不变。
+        """
+        results: List[ToolResult] = []
+        i = 0
+        while i < len(actions):
+            j = i
+            while j < len(actions) and self._is_parallel_safe(actions[j]):
+                j += 1
+            if j - i > 1:
+                logging.info(f"⚡ 并发执行 {j - i} 个只读行动。")
+                workers = min(AppConfig.MAX_PARALLEL_TOOLS, j - i)
+                # 线程池不会传递 contextvars，按行动复制当前上下文，工具 span 才能挂在本次循环之下
+                contexts = [contextvars.copy_context() for _ in range(j - i)]
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tool") as pool:
+                    results.extend(pool.map(
+                        lambda ctx, action: ctx.run(self._execute_action, action), contexts, actions[i:j]
+                    ))
+                i = j
             else:
-                observation = f"未找到工具'{tool_name}'。请从可用工具列表中选择。"
-                logging.info(f"❌ {observation}")
-                local_history += f"\nObservation: {observation}"
+                results.append(self._execute_action(actions[i]))
+                i += 1
+        return results
+
+    def _externalize(self, tool_name: Optional[str], output: str) -> str:
+        """
+        大段观察保存为工件，历史中只保留句柄和预览 (见 core.artifacts)。
+        read_artifact 的输出本身就是工件的一页，不再保存 (阈值很小时其输出可能超过阈值)。
+        """
+        if self.artifacts is None or tool_name == ARTIFACT_TOOL:
+            return output
+        try:
+            return self.artifacts.externalize(output, AppConfig.ARTIFACTS_THRESHOLD_CHARS,
+                                              AppConfig.ARTIFACTS_PREVIEW_CHARS)
+        except OSError as e:
+            logging.warning(f"⚠️ 保存工件失败，观察将被截断后写入历史：{e}")
+            return output
+
+    @staticmethod
+    def _render_current_step(index: int, description: str, plan_step: Optional[PlanStep]) -> str:
+        """当前步骤的描述，附带规划时给出的预期产出和工具提示"""
+        text = f"{index}. {description}"
+        if plan_step and plan_step.expected_output:
+            text += f"\n预期产出：{plan_step.expected_output}"
+        if plan_step and plan_step.tools:
+            text += f"\n建议工具：{', '.join(plan_step.tools)}"
+        return text
+
+    @staticmethod
+    def _initial_model_level(plan_step: Optional[PlanStep], top_level: int) -> int:
+        """规划时估计的循环预算不少于 hard_step_iterations 的步骤直接从第二档模型开始"""
+        threshold = AppConfig.ROUTING_HARD_STEP_ITERATIONS
+        if top_level and threshold and plan_step and plan_step.max_iterations and plan_step.max_iterations >= threshold:
+            return 1
+        return 0
+
+    def run_step(self, task: str, plan: List[str], current_step_index: int, history: History,
+                 checkpoint: Optional[Checkpointer] = None,
+                 plan_step: Optional[PlanStep] = None) -> Tuple[str, bool, str]:
+        """
+        执行计划中的一个步骤。
+
+        参数:
+            task (str): 总体任务
+            plan (List[str]): 完整计划的步骤描述列表
+            current_step_index (int): 当前步骤编号 (从 1 开始)
+            history (History): 执行历史；本步骤的思考、行动和观察会被追加到其中
+            checkpoint (Optional[Checkpointer]): 每次循环开始前把上一次循环新增的历史记录写入该检查点
+            plan_step (Optional[PlanStep]): 当前步骤的结构化定义；其预期产出和工具提示会写入提示，
+                max_iterations 作为本步骤初始的循环预算 (并决定从哪一档模型开始)
+
+        返回:
+            Tuple[str, bool, str]: (本步骤渲染后的历史, 是否调用了 finish, 最终摘要)
+        """
+        current_step = self._render_current_step(current_step_index, plan[current_step_index - 1], plan_step)
+        plan_str = "\n".join(f"{i}. {s}" for i, s in enumerate(plan, 1))
+
+        step = current_step_index
+        # 循环预算：先给规划时估计的次数 (没有估计时为 step_iterations)，
+        # 用完时只要最近一次循环仍有进展就逐次追加，直到硬上限
+        limit = AppConfig.AGENT_MAX_STEP_ITERATIONS
+        initial = plan_step.max_iterations if plan_step and plan_step.max_iterations else AppConfig.AGENT_STEP_ITERATIONS
+        budget = min(initial, limit)
+        # 从检查点恢复时，接着该步骤已完成的循环次数继续计数
+        loop = checkpoint.state.iterations.get(step, 0) if checkpoint else 0
+        budget = max(budget, min(loop + 1, limit))
+        stalled = 0  # 连续没有任何成功行动的循环次数
+        # 模型档位 (见 core.routing)：同一步骤中连续没有进展或 LLM 调用出错时升级到下一档
+        top_level = router.get().levels(routing.EXECUTOR) - 1
+        level = self._initial_model_level(plan_step, top_level)
+
+        def escalate(reason: str) -> bool:
+            nonlocal level, stalled
+            if level >= top_level:
+                return False
+            level += 1
+            stalled = 0
+            logging.warning(f"⬆️ 步骤 {step} {reason}，升级到第 {level + 1} 档模型。")
+            return True
+
+        while loop < budget:
+            print(f"\n🔄 ManusAgent思考循环 {loop+1}/{budget}，当前步骤 {current_step_index}...")
+            if checkpoint:
+                checkpoint.save_records(step, history, iteration=loop)
+            loop += 1
+
+            with tracing.span("iteration", tracing.ITERATION, step=step, iteration=loop) as iteration_span:
+                # 超出令牌预算时先压缩较早步骤的历史，使提示大小保持平稳
+                history.compact(current_step=step)
+                rendered_history = history.render()
+
+                # 从LLM获取下一步行动 (函数调用协议下可能有多个)。
+                # 函数调用协议下模型没有发起工具调用，或服务端不支持 tools 参数时，
+                # 在同一次循环中改用 JSON 文本协议重新请求，回退不消耗循环预算，也不计为没有进展
+                protocols = ["tools", "text"] if self.action_protocol == "tools" else ["text"]
+                for protocol in protocols:
+                    built = self.prompt_builders[protocol].build(
+                        task=task,
+                        plan=plan_str,
+                        history=rendered_history,
+                        current_step=current_step,
+                    )
+                    with routing.route(routing.EXECUTOR, level) as model_route:
+                        if protocol == "tools":
+                            thought, actions, error = self._request_tool_calls(built.prompt, built.instructions)
+                        else:
+                            thought, actions, error = self._request_text_action(built.prompt, built.instructions)
+                    if actions or protocol == "text":
+                        break
+                    if error is None:
+                        router.get().report_invalid(model_route)
+                        logging.warning("⚠️ 模型没有发起工具调用，本次循环改用 JSON 文本协议重新请求。")
+                    elif self.action_protocol == "tools":
+                        break  # 调用出错，但服务端支持函数调用，不回退
+                iteration_span.set(protocol=protocol, actions=len(actions), profile=model_route.profile)
+
+                if error is not None:
+                    if escalate("的 LLM 调用失败"):
+                        continue
+                    # 客户端已对可重试的错误做过退避重试，仍然失败时继续循环也只会浪费迭代次数
+                    observation = f"LLM调用失败。详情: {error}"
+                    logging.error(f"❌ {observation}，结束当前步骤。")
+                    history.add_observation(observation, step)
+                    break
+
+                if not actions:
+                    # 函数调用协议下没有行动时已经用 JSON 文本协议重新请求过，这里总是文本协议的无效响应
+                    observation = "无效操作格式。请严格使用指定JSON格式响应，包含`thought`和`action`键。"
+                    history.add_observation(observation, step)
+                    # 无法解析出行动的响应计为该档位的一次失败
+                    router.get().report_invalid(model_route)
+                    stalled += 1
+                    if stalled >= AppConfig.ROUTING_ESCALATE_AFTER and escalate(f"连续 {stalled} 次收到无效响应"):
+                        continue
+                    if stalled >= AppConfig.AGENT_MAX_STALLED_ITERATIONS:
+                        logging.warning(f"⚠️ 连续 {stalled} 次循环没有有效的进展，放弃当前步骤。")
+                        break
+                    continue
+
+                logging.info(f"🤔 思考: {thought}")
+                history.add_thought(thought, step)
+
+                # finish 或 step_complete 之后的行动不再执行
+                end_index = next((k for k, a in enumerate(actions) if a.get("name") in (FINISH, STEP_COMPLETE)), None)
+                if end_index is not None:
+                    actions = actions[:end_index + 1]
+                for action in actions:
+                    log_event("agent.action", f"🎬 行动: 调用工具`{action.get('name')}`，参数:",
+                              payload={"args": action.get("args", {})}, tool=action.get("name"))
+
+                results = self._execute_actions(actions)
+                # 按行动的原始顺序写入历史，与执行时的完成顺序无关
+                for action, result in zip(actions, results):
+                    history.add_action(json.dumps(action, indent=2, ensure_ascii=False), step)
+                    history.add_observation(self._externalize(action.get("name"), result.output), step)
+
+                finish_args = actions[-1].get("args") if actions[-1].get("name") == FINISH else None
+                if isinstance(finish_args, dict):
+                    return history.render([step]), True, finish_args.get("summary", "未提供摘要")
+
+                # 完整的步骤历史随循环次数增长，只按采样率记录
+                log_verbose("agent.history", f"🧾 步骤 {step} 第 {loop} 次循环后的历史记录:",
+                            lambda: history.render([step]), iteration=loop)
+
+                if any(result.step_complete for result in results):
+                    logging.info(f"✅ 步骤 {step} 已完成 (用了 {loop} 次循环)。继续执行计划中的下一步。")
+                    break
 
-            # 简单的启发式规则，当观察表明步骤完成时跳出循环
-            if "successfully" in observation.lower() or "done" in observation.lower() or "complete" in observation.lower():
-                logging.info(f"✅ 观察表明步骤已完成。继续执行计划中的下一步。")
-                break
+                progressed = any(not result.failed for result in results)
+                stalled = 0 if progressed else stalled + 1
+                iteration_span.set(progressed=progressed)
+                if stalled >= AppConfig.ROUTING_ESCALATE_AFTER and escalate(f"连续 {stalled} 次循环的行动全部失败"):
+                    continue
+                if stalled >= AppConfig.AGENT_MAX_STALLED_ITERATIONS:
+                    logging.warning(f"⚠️ 连续 {stalled} 次循环的行动全部失败，放弃当前步骤。")
+                    break
+                if loop == budget and progressed and budget < limit:
+                    budget += 1
+                    logging.info(f"⏳ 步骤 {step} 的循环预算已用完但仍有进展，追加到 {budget} 次。")
+        else:
+            logging.warning(f"⚠️ 步骤 {step} 用完了 {budget} 次循环仍未调用 step_complete。")
 
-        return local_history, False, ""
\ No newline at end of file
+        return history.render([step]), False, ""
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import re
+from dataclasses import dataclass, field, fields, replace
+from typing import List, Dict, Any, Optional, Tuple
+
+from core.llm import is_llm_error
+
+
+@dataclass
+class PlanStep:
+    """
+    计划依赖图 (DAG) 中的一个步骤。
+
+    属性:
+        id (int): 步骤编号，从 1 开始，与拓扑顺序一致
+        description (str): 步骤描述
+        depends_on (List[int]): 该步骤依赖的前置步骤编号
+        expected_output (str): 步骤完成时应得到的结果 (文件、数值、结论等)
+        tools (List[str]): 规划时建议该步骤使用的工具
+        max_iterations (Optional[int]): 该步骤初始的 ReAct 循环预算；None 表示使用配置的默认值
+    """
+    id: int
+    description: str
+    depends_on: List[int] = field(default_factory=list)
+    expected_output: str = ""
+    tools: List[str] = field(default_factory=list)
+    max_iterations: Optional[int] = None
+
+
+# 列表项：缩进、"1." / "1)" / "1、" / "步骤 1:" 等编号或 "-" / "*" / "•" 项目符号，以及项目内容。
+# 编号后的半角标点必须跟空白，因此 "1.5 公斤" 或 "lyrics.docx" 中的点不会被当作编号。
+_LIST_ITEM_RE = re.compile(r"^(\s*)(?:(?:步骤|step)?\s*(\d+)\s*(?:[.):]\s+|[、：]\s*)|([-*•])\s+)(.+)$", re.IGNORECASE)
+
+
+def _extract_json(text: str) -> Optional[Any]:
+    """从LLM响应中提取 JSON 内容 (支持 ```json 代码块或纯 JSON)"""
+    match = re.search(r"```(?:json)?\s*([\[{].*?[\]}])\s*```", text, re.DOTALL)
+    candidates = [match.group(1)] if match else []
+    candidates.append(text.strip())
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def _repair_json(text: str) -> Optional[Any]:
+    """
+    修复 LLM 常见的 JSON 格式错误后再解析：JSON 前后的说明文字、未闭合的代码块、
+    中文引号、注释、多余的尾逗号，以及 Python 风格的 True/False/None。
+    """
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    end = max(text.rfind("}"), text.rfind("]"))
+    if start < 0 or end <= start:
+        return None
+    candidate = text[start:end + 1]
+    candidate = candidate.replace("\u201c", '"').replace("\u201d", '"')
+    candidate = re.sub(r"^\s*//.*$", "", candidate, flags=re.MULTILINE)
+    candidate = re.sub(r",\s*([}\]])", r"\1", candidate)
+    candidate = re.sub(r"\bTrue\b", "true", re.sub(r"\bFalse\b", "false", re.sub(r"\bNone\b", "null", candidate)))
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        return None
+
+
+def parse_plan_text(plan_str: str) -> List[str]:
+    """
+    解析编号列表或项目符号列表形式的文本计划，返回步骤描述列表。
+
+    只有顶层列表项是步骤：缩进更深的项，以及与第一项类型不同的项 (例如编号步骤下的 "-" 子项)
+    会作为细节并入上一个步骤。没有任何列表项时返回空列表。
+    """
+    if not plan_str or is_llm_error(plan_str):
+        return []
+
+    steps: List[str] = []
+    top: Optional[Tuple[int, bool]] = None  # 顶层列表项的 (缩进, 是否为编号)
+    for line in plan_str.splitlines():
+        match = _LIST_ITEM_RE.match(line.rstrip())
+        if not match:
+            continue
+        indent, numbered = len(match.group(1).expandtabs(4)), match.group(2) is not None
+        text = match.group(4).strip().replace("**", "").strip()
+        if not text:
+            continue
+        if top is None:
+            top = (indent, numbered)
+        if steps and (indent > top[0] or numbered != top[1]):
+            steps[-1] = f"{steps[-1]}；{text}"
+        else:
+            steps.append(text)
+    return steps
+
+
+def linear_plan(descriptions: List[str]) -> List[PlanStep]:
+    """将扁平的步骤列表转换为链式依赖图，每一步都依赖上一步"""
+    return [
+        PlanStep(id=i, description=d, depends_on=[i - 1] if i > 1 else [])
+        for i, d in enumerate(descriptions, 1)
+    ]
+
+
+def _topological_order(steps: Dict[int, PlanStep]) -> List[PlanStep]:
+    """按拓扑顺序排列步骤，同层内按原编号排序以保证结果确定；成环的依赖会被丢弃"""
+    ordered: List[PlanStep] = []
+    done = set()
+    remaining = sorted(steps)
+    while remaining:
+        ready = [sid for sid in remaining if all(d in done for d in steps[sid].depends_on)]
+        if not ready:
+            # 存在环：丢弃编号最小的剩余步骤中尚未满足的依赖，打破循环
+            sid = remaining[0]
+            logging.warning(f"⚠️ 步骤 {sid} 的依赖存在循环，已忽略未满足的依赖。")
+            steps[sid].depends_on = [d for d in steps[sid].depends_on if d in done]
+            ready = [sid]
+        for sid in ready:
+            ordered.append(steps[sid])
+            done.add(sid)
+        remaining = [sid for sid in remaining if sid not in done]
+    return ordered
+
+
+def _as_list(value: Any) -> list:
+    if value is None or value == "":
+        return []
+    if isinstance(value, str):
+        return [v.strip() for v in value.split(",") if v.strip()]
+    return value if isinstance(value, list) else [value]
+
+
+def validate_plan(data: Any, known_tools: Optional[List[str]] = None,
+                  max_iterations: Optional[int] = None) -> Tuple[List[PlanStep], List[str]]:
+    """
+    校验并规整 JSON 计划，能就地修正的问题直接修正。
+
+    接受 {"steps": [...]} 或直接的步骤数组，每个步骤包含 `id`、`description`，以及可选的
+    `depends_on`、`expected_output`、`tools` 和 `max_iterations`。
+    缺少描述的步骤被丢弃，重复的编号重新分配，指向不存在步骤的依赖、未知的工具和无效的循环预算被去掉，
+    成环的依赖被打断。步骤按拓扑顺序重新编号为 1..n，依赖关系随之映射。
+
+    参数:
+        data (Any): 解析出的 JSON 内容
+        known_tools (Optional[List[str]]): 可用的工具名称；为 None 时不检查工具提示
+        max_iterations (Optional[int]): 步骤循环预算的上限；为 None 时不限制
+
+    返回:
+        Tuple[List[PlanStep], List[str]]: (按拓扑顺序排列的步骤, 发现的问题)；没有有效步骤时步骤列表为空
+    """
+    problems: List[str] = []
+    if isinstance(data, dict):
+        data = data.get("steps")
+    if not isinstance(data, list):
+        return [], ["计划必须是包含 steps 数组的 JSON 对象"]
+
+    steps: Dict[int, PlanStep] = {}
+    for position, item in enumerate(data, 1):
+        if isinstance(item, str) and item.strip():
+            item = {"description": item}
+        if not isinstance(item, dict):
+            problems.append(f"第 {position} 项不是对象，已忽略")
+            continue
+        description = str(item.get("description", "")).strip()
+        if not description:
+            problems.append(f"第 {position} 项缺少 description，已忽略")
+            continue
+        try:
+            sid = int(item.get("id", position))
+        except (TypeError, ValueError):
+            sid = position
+        if sid in steps:
+            problems.append(f"步骤编号 {sid} 重复，已重新编号")
+            sid = max(steps) + 1
+        deps = []
+        for d in _as_list(item.get("depends_on")):
+            try:
+                deps.append(int(d))
+            except (TypeError, ValueError):
+                problems.append(f"步骤 {sid} 的依赖 {d!r} 不是步骤编号，已忽略")
+        tools = [str(t).strip() for t in _as_list(item.get("tools")) if str(t).strip()]
+        if known_tools is not None:
+            unknown = [t for t in tools if t not in known_tools]
+            if unknown:
+                problems.append(f"步骤 {sid} 的工具 {', '.join(unknown)} 不存在，已忽略")
+                tools = [t for t in tools if t in known_tools]
+        budget = item.get("max_iterations")
+        if budget is not None:
+            try:
+                budget = max(int(budget), 1)
+                if max_iterations:
+                    budget = min(budget, max_iterations)
+            except (TypeError, ValueError):
+                problems.append(f"步骤 {sid} 的 max_iterations {budget!r} 无效，使用默认值")
+                budget = None
+        steps[sid] = PlanStep(id=sid, description=description, depends_on=deps,
+                              expected_output=str(item.get("expected_output") or "").strip(),
+                              tools=tools, max_iterations=budget)
+
+    # 丢弃指向不存在步骤或自身的依赖
+    for step in steps.values():
+        valid = sorted({d for d in step.depends_on if d in steps and d != step.id})
+        if len(valid) != len(set(step.depends_on)):
+            problems.append(f"步骤 {step.id} 依赖了不存在的步骤或自身，已忽略")
+        step.depends_on = valid
+
+    ordered = _topological_order(steps)
+    renumber = {step.id: i for i, step in enumerate(ordered, 1)}
+    return [
+        replace(s, id=renumber[s.id], depends_on=sorted(renumber[d] for d in s.depends_on)) for s in ordered
+    ], problems
+
+
+def parse_plan(plan_str: str, known_tools: Optional[List[str]] = None,
+               max_iterations: Optional[int] = None) -> Tuple[List[PlanStep], List[str]]:
+    """
+    解析 LLM 输出的 JSON 计划；JSON 格式有误时先尝试自动修复。
+
+    参数:
+        plan_str (str): LLM 的响应
+        known_tools (Optional[List[str]]): 可用的工具名称，见 `validate_plan`
+        max_iterations (Optional[int]): 步骤循环预算的上限，见 `validate_plan`
+
+    返回:
+        Tuple[List[PlanStep], List[str]]: (按拓扑顺序排列的步骤, 发现的问题)；解析失败时步骤列表为空
+    """
+    if not plan_str or is_llm_error(plan_str):
+        return [], [plan_str or "LLM 没有返回计划"]
+
+    data = _extract_json(plan_str)
+    problems = []
+    if data is None:
+        data = _repair_json(plan_str)
+        if data is None:
+            return [], ["响应中没有可以解析的 JSON 计划"]
+        problems.append("JSON 格式有误，已自动修复")
+    steps, issues = validate_plan(data, known_tools, max_iterations)
+    return steps, problems + issues
+
+
+def load_plan(items: List[Any]) -> List[PlanStep]:
+    """
+    从检查点或计划缓存中保存的计划恢复步骤。
+    兼容只保存了步骤描述列表的旧格式 (转换为链式依赖)。
+    """
+    if all(isinstance(item, str) for item in items):
+        return linear_plan(items)
+    names = {f.name for f in fields(PlanStep)}
+    return [PlanStep(**{k: v for k, v in item.items() if k in names}) for item in items]
+
+
+def ancestors(steps: List[PlanStep], step_id: int) -> List[int]:
+    """返回某一步骤的全部 (传递) 前置步骤编号，按编号升序排列"""
+    by_id = {s.id: s for s in steps}
+    seen = set()
+    stack = list(by_id[step_id].depends_on)
+    while stack:
+        sid = stack.pop()
+        if sid not in seen:
+            seen.add(sid)
+            stack.extend(by_id[sid].depends_on)
+    return sorted(seen)
+
+
+class StreamingPlanParser:
+    """
+    增量式计划解析器。
+    随着计划的流式响应不断喂入文本，每当 steps 数组中出现一个完整的步骤对象就将其解析出来，
+    无需等待整个计划结束。与 `StreamingActionParser` 一样，已扫描过的字符不会被重复扫描。
+    """
+    def __init__(self):
+        self.buffer = ""
+        self.items: List[Dict[str, Any]] = []
+        self._pos = 0
+        self._stack: List[Tuple[str, int]] = []   # 尚未闭合的括号及其位置
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """
+        喂入一段新的文本增量。
+
+        参数:
+            text (str): 流式响应中新到达的文本片段
+
+        返回:
+            List[Dict[str, Any]]: 本次新解析出的步骤对象 (可能为空)；全部步骤累积在 items 中
+        """
+        self.buffer += text
+        buffer = self.buffer
+        new = []
+        for i in range(self._pos, len(buffer)):
+            ch = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                # 对象外部的说明文字中也可能出现引号，只在 JSON 内部跟踪字符串
+                self._in_string = bool(self._stack)
+            elif ch in "{[":
+                self._stack.append((ch, i))
+            elif ch in "}]" and self._stack:
+                opener, start = self._stack.pop()
+                # 只有数组元素才可能是步骤，步骤内部嵌套的对象不单独解析
+                if ch == "}" and opener == "{" and self._stack and self._stack[-1][0] == "[":
+                    item = self._try_parse(buffer[start:i + 1])
+                    if item is not None:
+                        new.append(item)
+        self._pos = len(buffer)
+        self.items.extend(new)
+        return new
+
+    @staticmethod
+    def _try_parse(json_str: str) -> Optional[Dict[str, Any]]:
+        try:
+            obj = json.loads(json_str)
+        except json.JSONDecodeError:
+            return None
+        return obj if isinstance(obj, dict) and "description" in obj else None
@@ -1,28 +1,143 @@
 # -*- coding: utf-8 -*-
-from core.llm import call_llm
-from agents.prompts import PLANNING_INSTRUCTIONS
+import logging
+from typing import Callable, List, Optional, Tuple
+
+from config import AppConfig
+from core import routing
+from core.llm import call_llm, acall_llm, stream_llm, is_llm_error, router
+from agents.plan import PlanStep, StreamingPlanParser, parse_plan, parse_plan_text, linear_plan, validate_plan
+from agents.prompts import PLANNING_INSTRUCTIONS, PLANNING_GRAPH_INSTRUCTIONS, PLAN_REPAIR_INSTRUCTIONS
 
 class PlanningAgent:
     """
     计划智能体。
     负责接收用户任务并创建可执行的步骤序列。
+    计划以 JSON 格式请求，经过校验和规整；无法解析时请 LLM 修正格式，仍然失败时退回到按编号列表解析。
+    规划使用 planner 角色的模型档位，每次修正格式升级到下一档。
     """
-    def create_plan(self, task: str) -> str:
+    def _plan_prompt(self, task: str, tools: Optional[List[str]], graph: bool) -> str:
+        prompt = f"这是我的任务需求: '{task}'\n\n"
+        if tools:
+            prompt += f"可用工具: {', '.join(tools)}\n"
+        prompt += f"每个步骤的 max_iterations 不超过 {AppConfig.AGENT_MAX_STEP_ITERATIONS}。\n\n"
+        if graph:
+            return prompt + "请为我创建一个分步骤计划，并标明步骤之间的依赖关系。"
+        return prompt + "请为我创建一个详细的分步骤计划。"
+
+    @staticmethod
+    def _repair_prompt(task: str, plan_str: str, problems: List[str]) -> str:
+        issues = "\n".join(f"- {p}" for p in problems)
+        return f"任务: '{task}'\n\n原始计划:\n{plan_str}\n\n存在的问题:\n{issues}\n\n请输出修正后的 JSON 计划。"
+
+    @staticmethod
+    def _parse(plan_str: str, tools: Optional[List[str]]) -> Tuple[List[PlanStep], List[str]]:
+        steps, problems = parse_plan(plan_str, known_tools=tools, max_iterations=AppConfig.AGENT_MAX_STEP_ITERATIONS)
+        if steps and problems:
+            logging.warning(f"⚠️ 计划存在问题，已自动修正: {'；'.join(problems)}")
+        return steps, problems
+
+    @staticmethod
+    def _fallback(task: str, plan_str: str) -> List[PlanStep]:
+        """JSON 计划无法修复时，按编号列表解析原始响应；仍然失败时把整个任务作为单个步骤"""
+        if is_llm_error(plan_str):
+            return []
+        descriptions = parse_plan_text(plan_str)
+        if descriptions:
+            logging.warning(f"⚠️ 未能解析 JSON 计划，已按编号列表解析出 {len(descriptions)} 个步骤。")
+            return linear_plan(descriptions)
+        logging.warning("⚠️ 未能解析计划，将整个任务作为单个步骤执行。")
+        return linear_plan([task])
+
+    @staticmethod
+    def _stream_plan(prompt: str, instructions: str, tools: Optional[List[str]],
+                     on_step: Callable[[List[PlanStep]], None]) -> str:
+        """
+        以流式方式请求计划，每解析出一个完整的步骤就用目前为止的全部步骤回调 on_step，返回完整响应；
+        流式响应中断时返回错误消息 (不完整的计划不可用)
+        """
+        parser = StreamingPlanParser()
+        chunks = []
+        for chunk in stream_llm(prompt, instructions=instructions):
+            if is_llm_error(chunk):
+                return chunk
+            chunks.append(chunk)
+            if parser.feed(chunk):
+                steps, _ = validate_plan(parser.items, known_tools=tools,
+                                         max_iterations=AppConfig.AGENT_MAX_STEP_ITERATIONS)
+                if steps:
+                    on_step(steps)
+        return "".join(chunks)
+
+    def create_plan(self, task: str, tools: Optional[List[str]] = None, graph: bool = False,
+                    on_step: Optional[Callable[[List[PlanStep]], None]] = None) -> List[PlanStep]:
         """
         根据用户任务生成执行计划
 
         参数:
             task (str): 用户定义的任务描述
+            tools (Optional[List[str]]): 执行智能体可用的工具名称，供规划时为每个步骤给出工具提示
+            graph (bool): 是否请求依赖图 (DAG) 形式的计划；为 False 时步骤按编号顺序执行
+            on_step (Optional[Callable[[List[PlanStep]], None]]): 给出时以流式方式请求计划，
+                每解析出一个完整的步骤就用目前为止校验过的全部步骤调用它 (在调用线程中)；
+                这些步骤只是推测，以返回的完整计划为准
 
         返回:
-            str: 由LLM生成的计划字符串，每行表示一个步骤
+            List[PlanStep]: 按拓扑顺序排列的步骤；LLM 调用失败时返回空列表
         """
         print("🤔 PlanningAgent正在规划任务执行方案...")
 
-        # 构建计划提示
-        prompt = f"这是我的任务需求: '{task}'\n\n请为我创建一个详细的分步骤计划。"
+        instructions = PLANNING_GRAPH_INSTRUCTIONS if graph else PLANNING_INSTRUCTIONS
+        prompt = self._plan_prompt(task, tools, graph)
+        with routing.route(routing.PLANNER) as model_route:
+            if on_step is None:
+                plan_str = call_llm(prompt, instructions=instructions)
+            else:
+                plan_str = self._stream_plan(prompt, instructions, tools, on_step)
+        steps, problems = self._parse(plan_str, tools)
+
+        response = plan_str
+        for attempt in range(1, AppConfig.PLANNING_REPAIR_ATTEMPTS + 1):
+            if steps or is_llm_error(response):
+                break
+            router.get().report_invalid(model_route)
+            logging.warning(f"⚠️ 计划无法解析 ({'；'.join(problems)})，请求 LLM 修正格式。")
+            with routing.route(routing.PLANNER, attempt) as model_route:
+                response = call_llm(self._repair_prompt(task, response, problems),
+                                    instructions=PLAN_REPAIR_INSTRUCTIONS)
+            steps, problems = self._parse(response, tools)
+        if not steps:
+            router.get().report_invalid(model_route)
+
+        return steps or self._fallback(task, plan_str)
+
+    async def acreate_plan(self, task: str, tools: Optional[List[str]] = None, graph: bool = True) -> List[PlanStep]:
+        """
+        异步生成执行计划，默认为依赖图 (DAG) 形式
+
+        参数:
+            与 `create_plan` 相同
+
+        返回:
+            List[PlanStep]: 按拓扑顺序排列的步骤；LLM 调用失败时返回空列表
+        """
+        print("🤔 PlanningAgent正在规划任务依赖图...")
+
+        instructions = PLANNING_GRAPH_INSTRUCTIONS if graph else PLANNING_INSTRUCTIONS
+        with routing.route(routing.PLANNER) as model_route:
+            plan_str = await acall_llm(self._plan_prompt(task, tools, graph), instructions=instructions)
+        steps, problems = self._parse(plan_str, tools)
 
-        # 调用LLM生成计划
-        plan_str = call_llm(prompt, instructions=PLANNING_INSTRUCTIONS)
+        response = plan_str
+        for attempt in range(1, AppConfig.PLANNING_REPAIR_ATTEMPTS + 1):
+            if steps or is_llm_error(response):
+                break
+            router.get().report_invalid(model_route)
+            logging.warning(f"⚠️ 计划无法解析 ({'；'.join(problems)})，请求 LLM 修正格式。")
+            with routing.route(routing.PLANNER, attempt) as model_route:
+                response = await acall_llm(self._repair_prompt(task, response, problems),
+                                           instructions=PLAN_REPAIR_INSTRUCTIONS)
+            steps, problems = self._parse(response, tools)
+        if not steps:
+            router.get().report_invalid(model_route)
 
-        return plan_str
\ No newline at end of file
+        return steps or self._fallback(task, plan_str)
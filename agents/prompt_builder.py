@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from agents.prompts import (
+    MANUS_INSTRUCTIONS, MANUS_PROMPT_TOOLS, MANUS_PROMPT_CONTEXT, MANUS_PROMPT_DYNAMIC,
+    MANUS_TOOLS_INSTRUCTIONS, MANUS_TOOLS_PROMPT_DYNAMIC, MANUS_SINGLE_ACTION_RULE, MANUS_MULTI_ACTION_RULE,
+)
+from core.tokens import count_tokens
+
+# 静态部分 (系统提示和工具列表) 的令牌数，按 (工具集指纹, 协议, 是否允许多个行动) 缓存
+_static_tokens_cache: Dict[Tuple[str, str, bool], int] = {}
+
+
+@dataclass
+class BuiltPrompt:
+    """
+    一次 LLM 调用所需的提示及其令牌统计。
+
+    属性:
+        instructions (str): 系统提示
+        prompt (str): 用户提示
+        total_tokens (int): 系统提示与用户提示的令牌总数
+        cacheable_tokens (int): 在多次调用之间保持不变、可被服务端前缀缓存复用的令牌数
+    """
+    instructions: str
+    prompt: str
+    total_tokens: int
+    cacheable_tokens: int
+
+
+class PromptBuilder:
+    """
+    ManusAgent 的提示组装器。
+
+    系统提示和工具列表在创建时格式化一次并缓存；任务与计划部分按
+    (task, plan) 缓存；每次循环只需拼接并计数动态部分 (历史和当前步骤)。
+    内容按“静态在前、动态在后”排列，使服务端的前缀缓存能够命中。
+    """
+    def __init__(self, tools_description: str, tools_list: str, protocol: str = "text", multi_action: bool = False,
+                 fingerprint: Optional[str] = None):
+        """
+        参数:
+            tools_description (str): 系统提示中的工具描述
+            tools_list (str): 用户提示中包含参数的工具列表
+            protocol (str): 行动协议，"text" (JSON 文本) 或 "tools" (原生函数调用)
+            multi_action (bool): JSON 文本协议下是否允许一次回应包含多个行动
+            fingerprint (Optional[str]): 工具集指纹；给出时静态部分的令牌数在同一组工具的所有智能体之间共享
+        """
+        if protocol == "tools":
+            # 工具定义随请求的 tools 参数发送，提示中不再重复
+            self.instructions = MANUS_TOOLS_INSTRUCTIONS
+            self.tools_block = ""
+            self.dynamic_template = MANUS_TOOLS_PROMPT_DYNAMIC
+        else:
+            self.instructions = MANUS_INSTRUCTIONS.format(
+                tools_description=tools_description,
+                action_rule=MANUS_MULTI_ACTION_RULE if multi_action else MANUS_SINGLE_ACTION_RULE,
+            )
+            self.tools_block = MANUS_PROMPT_TOOLS.format(tools_list=tools_list)
+            self.dynamic_template = MANUS_PROMPT_DYNAMIC
+        self._static_key = (fingerprint, protocol, multi_action) if fingerprint else None
+        self._static_tokens = None  # 第一次组装提示时才计数，创建智能体时不加载分词器
+        self._context_key = None
+        self._context_block = ""
+        self._context_tokens = 0
+
+    def _context(self, task: str, plan: str):
+        """返回任务与计划部分；同一次运行中只格式化和计数一次"""
+        if self._context_key != (task, plan):
+            self._context_key = (task, plan)
+            self._context_block = MANUS_PROMPT_CONTEXT.format(task=task, plan=plan)
+            self._context_tokens = count_tokens(self._context_block)
+        return self._context_block, self._context_tokens
+
+    def build(self, task: str, plan: str, history: str, current_step: str) -> BuiltPrompt:
+        """
+        组装一次 ReAct 循环的提示。
+
+        参数:
+            task (str): 总体任务
+            plan (str): 已编号的完整计划文本
+            history (str): 渲染后的历史记录
+            current_step (str): 当前步骤
+
+        返回:
+            BuiltPrompt: 系统提示、用户提示及令牌统计
+        """
+        if self._static_tokens is None:
+            self._static_tokens = _static_tokens_cache.get(self._static_key)
+            if self._static_tokens is None:
+                self._static_tokens = count_tokens(self.instructions) + count_tokens(self.tools_block)
+                if self._static_key:
+                    _static_tokens_cache[self._static_key] = self._static_tokens
+        context_block, context_tokens = self._context(task, plan)
+        dynamic_block = self.dynamic_template.format(history=history, current_step=current_step)
+        cacheable = self._static_tokens + context_tokens
+        built = BuiltPrompt(
+            instructions=self.instructions,
+            prompt=self.tools_block + context_block + dynamic_block,
+            total_tokens=cacheable + count_tokens(dynamic_block),
+            cacheable_tokens=cacheable,
+        )
+        logging.info(
+            f"📐 提示令牌: 共 {built.total_tokens}，其中可缓存前缀 {built.cacheable_tokens} "
+            f"({built.cacheable_tokens * 100 // max(built.total_tokens, 1)}%)"
+        )
+        return built
@@ -0,0 +1,46 @@
+import sys
+import json
+import argparse
+import logging
+from config import AppConfig
+from core.log_setup import setup_logging
+from core.batch_runner import BatchRunner
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="OpenManus-Lite 批量任务运行器")
+    parser.add_argument("input", help="任务 JSONL 文件，每行包含 task (或 title/body) 以及可选的 task_id/id")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="结果 JSONL 文件；已完成的任务在重新运行时会被跳过")
+    parser.add_argument("-j", "--workers", type=int, help="同时执行的任务数 (默认取自 config.toml)")
+    parser.add_argument("--workspace-root", help="各任务独立工作区的根目录 (默认取自 config.toml)")
+    parser.add_argument("--async", dest="async_mode", action="store_true", help="在每个任务内部并发执行彼此独立的计划步骤")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    if not AppConfig:
+        print("❌ 致命错误：无法加载配置。程序退出。")
+        sys.exit(1)
+
+    setup_logging()
+
+    if not AppConfig.check_config():
+        print("错误：无法加载大模型配置。程序退出。")
+        sys.exit(1)
+
+    runner = BatchRunner(
+        input_path=args.input,
+        output_path=args.output,
+        workers=args.workers,
+        workspace_root=args.workspace_root,
+        async_mode=args.async_mode,
+    )
+    stats = runner.run()
+
+    logging.info("\n\n" + "#"*20 + " Batch Summary " + "#"*20)
+    logging.info(json.dumps(stats, ensure_ascii=False, indent=2))
+    logging.info("#"*55)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional, Tuple
+
+# 根据请求体 (OpenAI chat.completions 的 JSON) 返回回复文本
+Responder = Callable[[dict], str]
+
+
+class ReplayResponder:
+    """
+    按顺序回放录制的回复。
+    文件为 JSONL，每行形如 {"response": "..."}；回复用完后返回 finish 行动结束任务。
+    多个请求并发时回放顺序取决于到达顺序，因此只适合顺序执行的场景。
+    """
+    def __init__(self, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            self.responses = [json.loads(line)["response"] for line in f if line.strip()]
+        self._index = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, body: dict) -> str:
+        with self._lock:
+            index, self._index = self._index, self._index + 1
+        if index < len(self.responses):
+            return self.responses[index]
+        return json.dumps({"thought": "录制的回复已用完。", "action": {"name": "finish", "args": {"summary": "回放结束"}}},
+                          ensure_ascii=False)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 客户端提前断开 (取消的流、被终止的子进程) 是正常情况，不打印异常
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class MockLLMServer:
+    """
+    本地的 OpenAI 兼容 LLM 服务，用于离线基准测试。
+    支持流式 (SSE) 和非流式的 /v1/chat/completions 请求，按固定延迟返回 responder 生成的回复，
+    并记录每次请求发送的提示字节数和服务端处理区间 (perf_counter 纳秒，与调用方在同一进程时可直接比较)。
+    """
+    def __init__(self, responder: Responder, latency: float = 0.05, chunk_delay: float = 0.0, chunk_size: int = 16):
+        """
+        参数:
+            responder (Responder): 根据请求体生成回复文本的函数
+            latency (float): 每次请求返回首个令牌前的延迟 (秒)
+            chunk_delay (float): 流式响应中相邻分块之间的延迟 (秒)
+            chunk_size (int): 流式响应每个分块的字符数
+        """
+        self.responder = responder
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.chunk_size = chunk_size
+        self.prompt_bytes: List[int] = []
+        self.intervals: List[Tuple[int, int]] = []
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _record(self, body: dict) -> int:
+        size = sum(len(str(m.get("content") or "").encode("utf-8")) for m in body.get("messages", []))
+        if body.get("tools"):
+            size += len(json.dumps(body["tools"], ensure_ascii=False).encode("utf-8"))
+        with self._lock:
+            self.prompt_bytes.append(size)
+        return size
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # 支持长连接，与真实服务一样复用连接池
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                start = time.perf_counter_ns()
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                prompt_bytes = server._record(body)
+                content = server.responder(body)
+                time.sleep(server.latency)
+                if body.get("stream"):
+                    self._stream(content)
+                else:
+                    self._complete(body, content, prompt_bytes // 4)
+                with server._lock:
+                    server.intervals.append((start, time.perf_counter_ns()))
+
+            def _complete(self, body: dict, content: str, prompt_tokens: int):
+                # 非流式响应同样要等整个响应生成完毕，按流式分块的总延迟模拟生成时间
+                chunks = -(-len(content) // server.chunk_size)
+                if server.chunk_delay and chunks > 1:
+                    time.sleep(server.chunk_delay * (chunks - 1))
+                completion_tokens = len(content.encode("utf-8")) // 4
+                data = json.dumps({
+                    "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": body.get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                              "total_tokens": prompt_tokens + completion_tokens},
+                }, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, content: str):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for i in range(0, len(content), server.chunk_size):
+                        if i and server.chunk_delay:
+                            time.sleep(server.chunk_delay)
+                        chunk = {"id": "mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": "mock",
+                                 "choices": [{"index": 0, "delta": {"content": content[i:i + server.chunk_size]},
+                                              "finish_reason": None}]}
+                        self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self._write_chunk(b"data: [DONE]\n\n")
+                    self._write_chunk(b"")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def _write_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+    def start(self) -> "MockLLMServer":
+        """在后台线程中启动服务，端口由系统分配"""
+        self._server = _Server(("127.0.0.1", 0), self._make_handler())
+        threading.Thread(target=self._server.serve_forever, daemon=True, name="mock-llm").start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+离线基准测试：在本地模拟 LLM 服务上端到端运行编排器，测量框架自身的开销。
+
+用法 (在项目根目录执行):
+    python -m benchmarks.run                              # 运行全部场景
+    python -m benchmarks.run -s baseline,many_loops -n 3  # 指定场景，每个场景运行 3 次取中位数
+    python -m benchmarks.run --compare benchmarks/results/<旧结果>.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from benchmarks.mock_llm import MockLLMServer, ReplayResponder
+from benchmarks.scenarios import SCENARIOS, Scenario, ScriptedResponder
+from core.tracing import pad_display
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(PROJECT_ROOT, "benchmarks", "results")
+
+# 汇总表和对比时展示的指标：(键, 列名)
+_COLUMNS = [
+    ("wall_seconds", "总耗时(s)"),
+    ("llm_seconds", "LLM(s)"),
+    ("overhead_seconds", "框架开销(s)"),
+    ("overhead_per_call_ms", "每次调用开销(ms)"),
+    ("llm_calls", "LLM调用"),
+    ("prompt_bytes_mean", "平均提示字节"),
+    ("iterations_per_step_mean", "每步循环"),
+    ("peak_rss_mb", "峰值RSS(MB)"),
+]
+
+
+def _union_seconds(intervals: List[tuple]) -> float:
+    """计算若干 (开始, 结束) 区间的并集长度 (秒)；并发的 LLM 调用只计一次墙钟时间"""
+    total, current_start, current_end = 0, None, None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total / 1e9
+
+
+def _peak_rss_mb(who) -> float:
+    # Linux 上 ru_maxrss 的单位是 KB，macOS 上是字节
+    rss = resource.getrusage(who).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def configure_app(base_url: str, workdir: str):
+    """把全局配置指向模拟 LLM 服务，并把日志、工作区和检查点等输出目录放到临时目录中"""
+    # 必须在第一次调用 LLM 之前修改配置，LLM 客户端在第一次使用时按配置创建
+    from config import AppConfig
+    AppConfig.LLM_BASE_URL = base_url
+    AppConfig.LLM_API_KEY = "benchmark"
+    AppConfig.LLM_MODEL = AppConfig.LLM_MODEL or "mock-model"
+    AppConfig.LLM_ACTION_PROTOCOL = "text"
+    # 所有调用都发往模拟服务，不使用配置的其他模型档位
+    AppConfig.LLM_PROFILES = {}
+    AppConfig.ROUTING_PLANNER = AppConfig.ROUTING_EXECUTOR = AppConfig.ROUTING_SUMMARY = []
+    AppConfig.LLM_REQUESTS_PER_MINUTE = AppConfig.LLM_TOKENS_PER_MINUTE = 0
+    AppConfig.LLM_CACHE_ENABLED = False
+    AppConfig.TRACING_ENABLED = False
+    AppConfig.LOGS_PATH = os.path.join(workdir, "logs")
+    AppConfig.WORKSPACE_PATH = os.path.join(workdir, "workspace")
+    AppConfig.RESULTS_PATH = os.path.join(AppConfig.WORKSPACE_PATH, "results")
+    AppConfig.BATCH_WORKSPACE_ROOT = os.path.join(workdir, "batch")
+    AppConfig.CHECKPOINT_DIR = os.path.join(workdir, "checkpoints")
+    AppConfig.PLAN_CACHE_PATH = os.path.join(workdir, "plan_cache.sqlite3")
+    os.makedirs(AppConfig.LOGS_PATH, exist_ok=True)
+
+
+def run_scenario(scenario: Scenario, latency: float, chunk_delay: float, replay: Optional[str] = None) -> dict:
+    """
+    在当前进程中运行一个场景并返回指标。
+    会修改全局配置，因此每个场景应在独立的子进程中运行 (见 `main`)。
+    """
+    responder = ReplayResponder(replay) if replay else ScriptedResponder(scenario)
+    server = MockLLMServer(responder, latency=latency, chunk_delay=chunk_delay).start()
+    workdir = tempfile.mkdtemp(prefix="omlbench_")
+
+    configure_app(server.base_url, workdir)
+
+    # 与正常运行一样记录日志 (不输出到控制台)，日志本身的开销也计入框架开销
+    from core.log_setup import setup_logging
+    setup_logging(console=False, logs_path=os.path.join(workdir, "logs"))
+
+    from core import tracing
+    from core.orchestrator import Orchestrator
+    from core.async_orchestrator import AsyncOrchestrator
+    from core.batch_runner import BatchRunner
+
+    # 客户端和分词器在第一次使用时才创建；启动开销由 benchmarks.startup 单独测量，这里预先创建，不计入场景耗时
+    from core import llm
+    from core.tokens import count_tokens
+    llm.client.get()
+    llm.async_client.get()
+    count_tokens("warm up")
+
+    with tracing.trace("benchmark", scenario=scenario.name) as tracer:
+        start = time.perf_counter()
+        if scenario.mode == "batch":
+            input_path = os.path.join(workdir, "tasks.jsonl")
+            with open(input_path, "w", encoding="utf-8") as f:
+                for i in range(scenario.batch_tasks):
+                    f.write(json.dumps({"task_id": f"task-{i}", "task": scenario.task_text(i)}, ensure_ascii=False) + "\n")
+            runner = BatchRunner(input_path, os.path.join(workdir, "results.jsonl"), workers=scenario.batch_workers)
+            stats = runner.run()
+            status = ",".join(f"{k}={v}" for k, v in sorted(stats["statuses"].items()))
+        else:
+            orchestrator_cls = AsyncOrchestrator if scenario.mode == "async" else Orchestrator
+            orchestrator = orchestrator_cls(task=scenario.task_text(), workspace=os.path.join(workdir, "workspace"),
+                                            pipeline=scenario.mode == "pipeline")
+            try:
+                orchestrator.run()
+            finally:
+                orchestrator.close()
+            status = "finished" if orchestrator.finished else "completed"
+        wall = time.perf_counter() - start
+    server.stop()
+
+    # LLM 时间按模拟服务端的处理区间计算；客户端的请求构造、SSE 解析和令牌计数计入框架开销
+    llm_seconds = _union_seconds(server.intervals)
+    llm_spans = [s for s in tracer.spans if s.kind == tracing.LLM]
+    llm_client_seconds = _union_seconds([(s.start_ns, s.end_ns) for s in llm_spans])
+    iterations: Dict[str, int] = {}
+    for s in tracer.spans:
+        if s.kind == tracing.ITERATION:
+            iterations[s.parent_id] = iterations.get(s.parent_id, 0) + 1
+    loops = list(iterations.values()) or [0]
+    prompt_bytes = sorted(server.prompt_bytes) or [0]
+    calls = len(server.prompt_bytes)
+
+    return {
+        "scenario": scenario.name,
+        "description": scenario.description,
+        "status": status,
+        "wall_seconds": round(wall, 3),
+        "llm_seconds": round(llm_seconds, 3),
+        "llm_client_seconds": round(llm_client_seconds, 3),
+        "overhead_seconds": round(wall - llm_seconds, 3),
+        "overhead_per_call_ms": round((wall - llm_seconds) / max(calls, 1) * 1000, 2),
+        "llm_calls": calls,
+        "prompt_bytes_total": sum(prompt_bytes),
+        "prompt_bytes_mean": round(sum(prompt_bytes) / len(prompt_bytes)),
+        "prompt_bytes_p50": prompt_bytes[len(prompt_bytes) // 2],
+        "prompt_bytes_max": prompt_bytes[-1],
+        "steps": len(iterations),
+        "iterations_per_step_mean": round(sum(loops) / len(loops), 2),
+        "iterations_per_step_max": max(loops),
+        "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF),
+        "peak_children_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+
+def _run_child(name: str, args) -> dict:
+    """在独立子进程中运行场景，使峰值 RSS 和全局状态互不影响"""
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        result_file = f.name
+    command = [sys.executable, "-m", "benchmarks.run", "--child", name, "--result-file", result_file,
+               "--latency", str(args.latency), "--chunk-delay", str(args.chunk_delay)]
+    if args.replay:
+        command += ["--replay", args.replay]
+    try:
+        proc = subprocess.run(command, cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                              timeout=args.timeout)
+        if proc.returncode != 0:
+            stderr = proc.stderr.decode("utf-8", errors="replace")[-2000:]
+            return {"scenario": name, "status": "error", "error": stderr}
+        with open(result_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except subprocess.TimeoutExpired:
+        return {"scenario": name, "status": "error", "error": f"超过 {args.timeout} 秒未完成"}
+    finally:
+        os.unlink(result_file)
+
+
+def _git_info() -> dict:
+    def git(*cmd) -> str:
+        try:
+            return subprocess.run(["git", *cmd], cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=10).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+    return {"commit": git("rev-parse", "--short", "HEAD") or "unknown",
+            "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def _format_table(results: Dict[str, dict], baseline: Optional[Dict[str, dict]] = None) -> str:
+    header = pad_display("场景", 14, align_left=True) + "".join(pad_display(title, 18) for _, title in _COLUMNS)
+    lines = [header]
+    for name, result in results.items():
+        if result.get("status") == "error":
+            lines.append(f"{name:<14}  失败: {result['error'].splitlines()[-1] if result['error'] else ''}")
+            continue
+        cells = []
+        for key, _ in _COLUMNS:
+            value = result.get(key, 0)
+            cell = f"{value}"
+            old = (baseline or {}).get(name, {}).get(key)
+            if isinstance(old, (int, float)) and old:
+                cell += f" ({(value - old) / old * 100:+.0f}%)"
+            cells.append(f"{cell:>18}")
+        lines.append(f"{name:<14}" + "".join(cells))
+    return "\n".join(lines)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="OpenManus-Lite 离线基准测试")
+    parser.add_argument("-s", "--scenarios", default="all", help=f"逗号分隔的场景名，可选: {', '.join(SCENARIOS)}")
+    parser.add_argument("-n", "--repeat", type=int, default=1, help="每个场景的运行次数，结果取总耗时的中位数")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟 LLM 每次调用的延迟 (秒)")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="模拟流式响应相邻分块之间的延迟 (秒)")
+    parser.add_argument("--replay", help="按顺序回放录制的回复 (JSONL，每行 {\"response\": ...})，代替脚本化回复")
+    parser.add_argument("--timeout", type=float, default=600, help="单个场景的时间限制 (秒)")
+    parser.add_argument("-o", "--output", help="结果 JSON 文件，默认写入 benchmarks/results/")
+    parser.add_argument("--compare", help="与之前的结果 JSON 对比，在表格中显示变化百分比")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if args.child:
+        result = run_scenario(SCENARIOS[args.child], args.latency, args.chunk_delay, args.replay)
+        with open(args.result_file, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        return
+
+    names = list(SCENARIOS) if args.scenarios == "all" else [n.strip() for n in args.scenarios.split(",")]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        print(f"❌ 错误：未知的场景 {', '.join(unknown)}。可选: {', '.join(SCENARIOS)}")
+        sys.exit(1)
+
+    results: Dict[str, dict] = {}
+    for name in names:
+        print(f"⏱️ 正在运行场景 {name} ({SCENARIOS[name].description})...")
+        runs = [_run_child(name, args) for _ in range(max(args.repeat, 1))]
+        ok = sorted((r for r in runs if r.get("status") != "error"), key=lambda r: r["wall_seconds"])
+        results[name] = ok[len(ok) // 2] if ok else runs[-1]
+
+    git = _git_info()
+    report = {
+        "meta": {
+            **git,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "latency_seconds": args.latency,
+            "chunk_delay_seconds": args.chunk_delay,
+            "repeat": args.repeat,
+            "replay": args.replay,
+        },
+        "scenarios": results,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{git['commit']}{'-dirty' if git['dirty'] else ''}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("scenarios", {})
+    print("\n" + _format_table(results, baseline))
+    print(f"\n💾 结果已保存到 {output}")
+
+
+if __name__ == "__main__":
+    main()
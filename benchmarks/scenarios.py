@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import json
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+_TASK_RE = re.compile(r"总体任务：\n(.*?)\n")
+_STEP_RE = re.compile(r"当前要完成的步骤：\n(\d+)\.")
+
+
+@dataclass
+class Scenario:
+    """
+    一个基准测试场景：计划形状、每个步骤的循环次数以及工具调用都是确定的。
+
+    属性:
+        name (str): 场景名称
+        description (str): 场景说明
+        steps (int): 计划的步骤数
+        loops_per_step (int): 每个步骤在完成之前执行的行动次数
+        action (dict): 每次循环调用的工具
+        mode (str): "sync"、"pipeline" (顺序执行，计划流式生成时就开始执行)、"async" (依赖图并发) 或 "batch" (批量运行器)
+        batch_tasks (int): 批量模式下的任务数
+        batch_workers (int): 批量模式下同时执行的任务数
+    """
+    name: str
+    description: str
+    steps: int = 3
+    loops_per_step: int = 1
+    action: dict = field(default_factory=lambda: {
+        "name": "write_file", "args": {"file_path": "notes.txt", "content": "基准测试写入的内容。\n" * 20}
+    })
+    mode: str = "sync"
+    batch_tasks: int = 0
+    batch_workers: int = 4
+
+    def task_text(self, index: int = 0) -> str:
+        return f"基准测试 {self.name} #{index}：按计划依次执行各步骤。"
+
+
+SCENARIOS: Dict[str, Scenario] = {s.name: s for s in [
+    Scenario("baseline", "3 个步骤，每步 1 次行动，顺序执行"),
+    Scenario("long_plan", "30 个步骤的长计划，历史随步骤增长并触发压缩", steps=30),
+    Scenario("large_output", "每次行动产生约 1.3 MB 的 shell 输出，检验截断和历史大小", steps=3,
+             action={"name": "shell", "args": {"command": "seq 1 200000"}}),
+    Scenario("many_loops", "每个步骤 8 次 ReAct 循环", steps=3, loops_per_step=8),
+    Scenario("pipeline", "10 个步骤顺序执行，计划流式生成时就开始执行已解析出的步骤 (配合 --chunk-delay 观察重叠)",
+             steps=10, mode="pipeline"),
+    Scenario("async_dag", "8 个互不依赖的步骤加一个汇总步骤，按依赖图并发执行", steps=9, loops_per_step=2, mode="async"),
+    Scenario("batch", "批量运行 16 个任务，4 个并发", steps=3, mode="batch", batch_tasks=16, batch_workers=4),
+]}
+
+
+class ScriptedResponder:
+    """
+    按场景生成确定的 LLM 回复。
+    ReAct 请求按 (任务, 步骤) 分别计数，因此并发执行时每个步骤收到的回复序列与执行顺序无关：
+    先执行 loops_per_step 次场景行动，然后调用 step_complete 结束步骤，最后一个步骤调用 finish。
+    """
+    def __init__(self, scenario: Scenario):
+        self.scenario = scenario
+        self._counters: Dict[Tuple[str, int], int] = {}
+        self._lock = threading.Lock()
+
+    def _plan(self, graph: bool) -> str:
+        n = self.scenario.steps
+        if graph:
+            steps: List[dict] = [{"id": i, "description": f"执行子任务 {i}", "depends_on": []} for i in range(1, n)]
+            steps.append({"id": n, "description": "汇总所有子任务的结果", "depends_on": list(range(1, n))})
+        else:
+            steps = [{"id": i, "description": f"执行子任务 {i}", "depends_on": [i - 1] if i > 1 else []}
+                     for i in range(1, n + 1)]
+        for step in steps:
+            step.update(expected_output=f"子任务 {step['id']} 的结果", tools=[self.scenario.action["name"]],
+                        max_iterations=self.scenario.loops_per_step + 1)
+        return "```json\n" + json.dumps({"steps": steps}, ensure_ascii=False) + "\n```"
+
+    def _react(self, prompt: str) -> str:
+        task = _TASK_RE.search(prompt)
+        step = _STEP_RE.search(prompt)
+        key = (task.group(1) if task else "", int(step.group(1)) if step else 0)
+        with self._lock:
+            count = self._counters[key] = self._counters.get(key, 0) + 1
+
+        if count <= self.scenario.loops_per_step:
+            action = self.scenario.action
+        elif key[1] >= self.scenario.steps:
+            action = {"name": "finish", "args": {"summary": f"{key[0]} 已完成。"}}
+        else:
+            action = {"name": "step_complete", "args": {"summary": f"子任务 {key[1]} 已完成。"}}
+        return json.dumps({"thought": f"执行步骤 {key[1]} 的第 {count} 次行动。", "action": action}, ensure_ascii=False)
+
+    def __call__(self, body: dict) -> str:
+        messages = body.get("messages", [])
+        system = messages[0].get("content", "") if messages else ""
+        prompt = messages[-1].get("content", "") if messages else ""
+        if "Planning Agent" in system:
+            return self._plan(graph="dependency graph" in system)
+        if "执行记录压缩助手" in system:
+            return "这一步执行了若干次写文件操作，未遇到问题。"
+        return self._react(prompt)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+启动时间基准测试：测量 CLI 的导入耗时和从启动进程到发出第一个 LLM 请求的冷启动时间。
+
+导入耗时用 `python -X importtime` 在全新的子进程中测量；冷启动时间在本地模拟 LLM 服务上测量，
+子进程按 main.py 的正常流程启动，从创建子进程开始计时，到模拟服务收到第一个请求为止。
+
+用法 (在项目根目录执行):
+    python -m benchmarks.startup                   # 每项测量 5 次取中位数
+    python -m benchmarks.startup -n 10 --top 20    # 测量 10 次，列出导入最慢的 20 个模块
+    python -m benchmarks.startup --check           # 超出启动预算时以非零退出码结束 (可用于 CI)
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(PROJECT_ROOT, "benchmarks", "results")
+
+# 分别测量导入耗时的模块
+MODULES = ["config", "core.llm", "core.orchestrator", "main"]
+
+# 启动预算 (毫秒)：导入 main 的耗时，以及从启动进程到发出第一个 LLM 请求的时间
+BUDGET_MS = {
+    "import_main_ms": 250,
+    "first_request_ms": 1500,
+}
+
+
+def _median(values: List[float]) -> float:
+    values = sorted(values)
+    return values[len(values) // 2] if values else 0.0
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """解析 -X importtime 的输出，返回 [(模块名, 自身耗时 (微秒), 累计耗时 (微秒)), ...]"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            entries.append((name.strip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return entries
+
+
+def measure_import(module: str) -> Tuple[float, List[Tuple[str, int, int]]]:
+    """在全新的子进程中导入模块，返回 (该模块的累计导入耗时 (毫秒), 所有模块的导入记录)"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=PROJECT_ROOT,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, timeout=120,
+                          env={**os.environ, "LLM_API_KEY": os.environ.get("LLM_API_KEY", "benchmark")})
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败：{proc.stderr[-500:]}")
+    entries = parse_importtime(proc.stderr)
+    total = next((cumulative for name, _, cumulative in entries if name == module), 0)
+    return total / 1000, entries
+
+
+def measure_first_request(timeout: float) -> Optional[float]:
+    """启动一次 main.py 的完整流程，返回从创建进程到模拟服务收到第一个 LLM 请求的毫秒数；超时返回 None"""
+    from benchmarks.mock_llm import MockLLMServer
+    from benchmarks.scenarios import SCENARIOS, ScriptedResponder
+
+    server = MockLLMServer(ScriptedResponder(SCENARIOS["baseline"]), latency=0).start()
+    try:
+        start = time.perf_counter_ns()
+        proc = subprocess.Popen([sys.executable, "-m", "benchmarks.startup", "--child", server.base_url],
+                                cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + timeout
+        while not server.intervals and proc.poll() is None and time.monotonic() < deadline:
+            time.sleep(0.001)
+        proc.kill()
+        proc.wait()
+        if not server.intervals:
+            return None
+        # 模拟服务记录的是收到请求时的 perf_counter (与本进程同一时钟)
+        return (server.intervals[0][0] - start) / 1e6
+    finally:
+        server.stop()
+
+
+def run_child(base_url: str):
+    """子进程：把配置指向模拟服务后，按 main.py 的正常流程运行"""
+    from benchmarks.run import configure_app
+    from benchmarks.scenarios import SCENARIOS
+    configure_app(base_url, tempfile.mkdtemp(prefix="omlstartup_"))
+    import main
+    sys.argv = ["main.py", "--task", SCENARIOS["baseline"].task_text()]
+    main.main()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="OpenManus-Lite 启动时间基准测试")
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="每项测量的次数，结果取中位数")
+    parser.add_argument("--top", type=int, default=10, help="列出导入 main 时自身耗时最长的模块数")
+    parser.add_argument("--timeout", type=float, default=60, help="等待第一个 LLM 请求的时间限制 (秒)")
+    parser.add_argument("--check", action="store_true", help="任何一项超出启动预算时以非零退出码结束")
+    parser.add_argument("-o", "--output", help="结果 JSON 文件，默认写入 benchmarks/results/")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        run_child(args.child)
+        return
+
+    repeat = max(args.repeat, 1)
+    results: Dict[str, float] = {}
+    slowest: Dict[str, List[int]] = {}
+    for module in MODULES:
+        print(f"⏱️ 正在测量导入 {module} 的耗时...")
+        samples = []
+        for _ in range(repeat):
+            total, entries = measure_import(module)
+            samples.append(total)
+            if module == "main":
+                for name, self_us, _ in entries:
+                    slowest.setdefault(name, []).append(self_us)
+        results[f"import_{module.replace('.', '_')}_ms"] = round(_median(samples), 1)
+
+    print("⏱️ 正在测量从启动到第一个 LLM 请求的时间...")
+    samples = [measure_first_request(args.timeout) for _ in range(repeat)]
+    ok = [s for s in samples if s is not None]
+    results["first_request_ms"] = round(_median(ok), 1) if ok else None
+
+    top = sorted(((name, _median(v) / 1000) for name, v in slowest.items()), key=lambda x: -x[1])[:args.top]
+
+    print("\n" + "\n".join(
+        f"{key:<28}{value if value is not None else '超时':>10}"
+        + (f"   (预算 {BUDGET_MS[key]})" if key in BUDGET_MS else "")
+        for key, value in results.items()
+    ))
+    print(f"\n导入 main 时自身耗时最长的 {len(top)} 个模块 (毫秒):")
+    for name, ms in top:
+        print(f"  {name:<48}{ms:>8.1f}")
+
+    over = [key for key, budget in BUDGET_MS.items() if results.get(key) is None or results[key] > budget]
+    report = {
+        "meta": {"timestamp": datetime.now().isoformat(timespec="seconds"), "python": sys.version.split()[0],
+                 "repeat": repeat},
+        "results": results,
+        "budget_ms": BUDGET_MS,
+        "over_budget": over,
+        "slowest_imports_ms": {name: round(ms, 2) for name, ms in top},
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"startup_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 结果已保存到 {output}")
+
+    if over:
+        print(f"❌ 超出启动预算: {', '.join(over)}")
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,16 @@
 import os
-import toml
-from dotenv import load_dotenv
-# 如果存在.env文件，则从中加载环境变量
-load_dotenv()
+import threading
 
 # --- 配置类 ---
 class Config:
     def __init__(self, config_path="config.toml"):
         """从TOML文件和系统环境变量加载配置"""
+        # 只在真正加载配置时才导入，导入本模块本身不做任何 I/O
+        import toml
+        from dotenv import load_dotenv
+        # 如果存在.env文件，则从中加载环境变量
+        load_dotenv()
+
         if not os.path.exists(config_path):
             raise FileNotFoundError(f"配置文件未找到: {config_path}")
 
@@ -22,12 +25,142 @@ class Config:
         self.LLM_MODEL = llm_config.get("model")
         self.LLM_MAX_TOKENS = llm_config.get("max_tokens", 8192)
         self.LLM_TEMPERATURE = llm_config.get("temperature", 0.1)
+        self.LLM_STREAM = llm_config.get("stream", True)
+        self.LLM_ACTION_PROTOCOL = llm_config.get("action_protocol", "text")
+        self.LLM_MULTI_ACTION = llm_config.get("multi_action", True)
+
+        # --- LLM 客户端连接与重试配置 ---
+        self.LLM_CONNECT_TIMEOUT = llm_config.get("connect_timeout", 10.0)
+        self.LLM_READ_TIMEOUT = llm_config.get("read_timeout", 120.0)
+        self.LLM_MAX_CONNECTIONS = llm_config.get("max_connections", 20)
+        self.LLM_MAX_KEEPALIVE_CONNECTIONS = llm_config.get("max_keepalive_connections", 10)
+        self.LLM_KEEPALIVE_EXPIRY = llm_config.get("keepalive_expiry", 60.0)
+        self.LLM_MAX_RETRIES = llm_config.get("max_retries", 5)
+        self.LLM_RETRY_BASE_DELAY = llm_config.get("retry_base_delay", 1.0)
+        self.LLM_RETRY_MAX_DELAY = llm_config.get("retry_max_delay", 60.0)
+        self.LLM_REQUESTS_PER_MINUTE = llm_config.get("requests_per_minute", 0)
+        self.LLM_TOKENS_PER_MINUTE = llm_config.get("tokens_per_minute", 0)
+
+        # --- 模型档位与路由配置 ---
+        # [models.<name>] 中未设置的字段取自 [llm]；各角色未配置档位序列时使用 [llm] 中的模型
+        self.LLM_PROFILES = toml_config.get("models", {})
+        routing_config = toml_config.get("routing", {})
+        self.ROUTING_PLANNER = routing_config.get("planner", [])
+        self.ROUTING_EXECUTOR = routing_config.get("executor", [])
+        self.ROUTING_SUMMARY = routing_config.get("summary", [])
+        self.ROUTING_ESCALATE_AFTER = routing_config.get("escalate_after", 2)
+        self.ROUTING_HARD_STEP_ITERATIONS = routing_config.get("hard_step_iterations", 0)
+        self.ROUTING_MIN_SUCCESS_RATE = routing_config.get("min_success_rate", 0.5)
+        self.ROUTING_MIN_SAMPLES = routing_config.get("min_samples", 5)
+        self.ROUTING_STATS_WINDOW = routing_config.get("stats_window", 50)
 
         project_root = os.path.dirname(os.path.realpath(__file__))
+
+        # --- LLM 响应缓存配置 ---
+        cache_config = toml_config.get("cache", {})
+        self.LLM_CACHE_ENABLED = cache_config.get("enabled", True)
+        self.LLM_CACHE_PATH = os.path.join(project_root, cache_config.get("path", "cache/llm_cache.sqlite3"))
+        self.LLM_CACHE_TTL_SECONDS = cache_config.get("ttl_seconds", 7 * 24 * 3600)
+        self.LLM_CACHE_MAX_ENTRIES = cache_config.get("max_entries", 10000)
+        self.LLM_CACHE_MAX_BYTES = cache_config.get("max_bytes", 200 * 1024 * 1024)
+        self.LLM_CACHE_FORCE = cache_config.get("force", False)
+
+        # --- 计划缓存配置 ---
+        plan_cache_config = toml_config.get("plan_cache", {})
+        self.PLAN_CACHE_ENABLED = plan_cache_config.get("enabled", True)
+        self.PLAN_CACHE_PATH = os.path.join(project_root, plan_cache_config.get("path", "cache/plan_cache.sqlite3"))
+        self.PLAN_CACHE_SIMILARITY_THRESHOLD = plan_cache_config.get("similarity_threshold", 0.85)
+        self.PLAN_CACHE_MAX_ENTRIES = plan_cache_config.get("max_entries", 5000)
+        self.PLAN_CACHE_ADAPT = plan_cache_config.get("adapt", True)
+
+        # --- 执行历史配置 ---
+        history_config = toml_config.get("history", {})
+        self.HISTORY_TOKEN_BUDGET = history_config.get("token_budget", 6000)
+        self.HISTORY_MAX_OBSERVATION_CHARS = history_config.get("max_observation_chars", 4000)
+        self.HISTORY_SUMMARY_MODE = history_config.get("summary_mode", "truncate")
+        self.HISTORY_SUMMARY_MAX_CHARS = history_config.get("summary_max_chars", 600)
+
+        # --- 编排器配置 ---
+        orchestrator_config = toml_config.get("orchestrator", {})
+        self.MAX_CONCURRENT_STEPS = orchestrator_config.get("max_concurrent_steps", 4)
+        self.MAX_PARALLEL_TOOLS = orchestrator_config.get("max_parallel_tools", 4)
+
+        # --- 规划配置 ---
+        planning_config = toml_config.get("planning", {})
+        self.PLANNING_REPAIR_ATTEMPTS = planning_config.get("repair_attempts", 1)
+        self.PLANNING_PIPELINE = planning_config.get("pipeline", False)
+
+        # --- 工具配置 ---
+        tools_config = toml_config.get("tools", {})
+        self.TOOLS_ENABLED = tools_config.get("enabled", [])
+        self.TOOLS_DISCOVER_PLUGINS = tools_config.get("discover_plugins", True)
+
+        # --- 执行智能体配置 ---
+        agent_config = toml_config.get("agent", {})
+        self.AGENT_STEP_ITERATIONS = agent_config.get("step_iterations", 5)
+        self.AGENT_MAX_STEP_ITERATIONS = agent_config.get("max_step_iterations", 10)
+        self.AGENT_MAX_STALLED_ITERATIONS = agent_config.get("max_stalled_iterations", 3)
+
         self.LOGS_PATH = os.path.join(project_root, "logs")
         self.WORKSPACE_PATH = os.path.join(project_root, "workspace")
         self.RESULTS_PATH = os.path.join(self.WORKSPACE_PATH, "results")
 
+        # --- Python 内核配置 ---
+        python_config = toml_config.get("python", {})
+        self.PYTHON_TIMEOUT_SECONDS = python_config.get("timeout_seconds", 60)
+        self.PYTHON_CPU_SECONDS = python_config.get("cpu_seconds", 60)
+        self.PYTHON_MEMORY_MB = python_config.get("memory_mb", 2048)
+        self.PYTHON_MAX_OUTPUT_BYTES = python_config.get("max_output_bytes", 20000)
+        self.PYTHON_POOL_SIZE = python_config.get("pool_size", 1)
+        self.PYTHON_PREWARM_IMPORTS = python_config.get("prewarm_imports", ["os", "re", "json", "math", "datetime", "collections"])
+
+        # --- 文件工具配置 ---
+        files_config = toml_config.get("files", {})
+        self.FILE_READ_MAX_BYTES = files_config.get("read_max_bytes", 20000)
+        self.FILE_MMAP_THRESHOLD_BYTES = files_config.get("mmap_threshold_bytes", 1024 * 1024)
+        self.FILE_LIST_MAX_ENTRIES = files_config.get("list_max_entries", 200)
+        self.FILE_GREP_MAX_MATCHES = files_config.get("grep_max_matches", 100)
+
+        # --- 工件存储配置 ---
+        artifacts_config = toml_config.get("artifacts", {})
+        self.ARTIFACTS_ENABLED = artifacts_config.get("enabled", True)
+        self.ARTIFACTS_DIR = artifacts_config.get("dir", ".artifacts")
+        self.ARTIFACTS_THRESHOLD_CHARS = artifacts_config.get("threshold_chars", 4000)
+        self.ARTIFACTS_PREVIEW_CHARS = artifacts_config.get("preview_chars", 1500)
+
+        # --- Shell 工具配置 ---
+        shell_config = toml_config.get("shell", {})
+        self.SHELL_TIMEOUT_SECONDS = shell_config.get("timeout_seconds", 60)
+        self.SHELL_MAX_OUTPUT_BYTES = shell_config.get("max_output_bytes", 20000)
+        self.SHELL_PERSISTENT_SESSION = shell_config.get("persistent_session", False)
+
+        # --- 检查点配置 ---
+        checkpoint_config = toml_config.get("checkpoint", {})
+        self.CHECKPOINT_ENABLED = checkpoint_config.get("enabled", True)
+        self.CHECKPOINT_DIR = os.path.join(project_root, checkpoint_config.get("dir", "checkpoints"))
+        self.CHECKPOINT_FSYNC = checkpoint_config.get("fsync", True)
+
+        # --- 日志配置 ---
+        logging_config = toml_config.get("logging", {})
+        self.LOG_LEVEL = logging_config.get("level", "INFO")
+        self.LOG_JSONL = logging_config.get("jsonl", True)
+        self.LOG_MAX_BYTES = logging_config.get("max_bytes", 10 * 1024 * 1024)
+        self.LOG_BACKUP_COUNT = logging_config.get("backup_count", 5)
+        self.LOG_MAX_FIELD_CHARS = logging_config.get("max_field_chars", 2000)
+        self.LOG_BLOBS = logging_config.get("blobs", True)
+        self.LOG_VERBOSE_SAMPLE_RATE = logging_config.get("verbose_sample_rate", 0.0)
+        self.LOG_QUEUE_SIZE = logging_config.get("queue_size", 10000)
+
+        # --- 追踪配置 ---
+        tracing_config = toml_config.get("tracing", {})
+        self.TRACING_ENABLED = tracing_config.get("enabled", True)
+        self.TRACING_OUTPUT_DIR = os.path.join(project_root, tracing_config.get("output_dir", "logs/traces"))
+
+        # --- 批量运行配置 ---
+        batch_config = toml_config.get("batch", {})
+        self.BATCH_WORKERS = batch_config.get("workers", 4)
+        self.BATCH_WORKSPACE_ROOT = os.path.join(project_root, batch_config.get("workspace_root", "workspace/batch"))
+
     def check_config(self):
         """检查核心配置是否已设置"""
         if not self.LLM_API_KEY:
@@ -49,9 +182,43 @@ class Config:
 
         return True
 
-# 创建全局配置实例供整个应用程序使用
-try:
-    AppConfig = Config()
-except FileNotFoundError as e:
-    print(f"❌ {e}")
-    AppConfig = None
\ No newline at end of file
+class LazyConfig:
+    """
+    全局配置的延迟加载代理。
+    第一次读取或修改属性时才加载 .env 和 config.toml，之后所有访问都转发到同一个 Config 实例。
+    配置文件不存在时代理的布尔值为 False，访问属性会抛出 FileNotFoundError。
+    """
+    def __init__(self, config_path: str = "config.toml"):
+        object.__setattr__(self, "_config_path", config_path)
+        object.__setattr__(self, "_config", None)
+        object.__setattr__(self, "_error", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _load(self):
+        if self._config is None and self._error is None:
+            with self._lock:
+                if self._config is None and self._error is None:
+                    try:
+                        object.__setattr__(self, "_config", Config(self._config_path))
+                    except FileNotFoundError as e:
+                        print(f"❌ {e}")
+                        object.__setattr__(self, "_error", e)
+        if self._error is not None:
+            raise self._error
+        return self._config
+
+    def __bool__(self) -> bool:
+        try:
+            self._load()
+            return True
+        except FileNotFoundError:
+            return False
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+# 全局配置实例供整个应用程序使用，在第一次访问时加载
+AppConfig = LazyConfig()
\ No newline at end of file
@@ -0,0 +1,146 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from config import AppConfig
+
+# 大段工具输出的工件存储。
+# 超过阈值的观察按内容的 SHA-256 保存到工作区的 .artifacts/ 目录 (相同的输出只保存一次)，
+# 历史中只保留一个短句柄和预览 (开头、结尾、大小和行数)，智能体需要其余内容时用 read_artifact 按行读取。
+# 这样提示大小不再随工具输出的大小增长。
+
+ARTIFACT_ID_LENGTH = 16
+_ARTIFACT_ID_RE = re.compile(rf"\b([0-9a-f]{{{ARTIFACT_ID_LENGTH}}})\b")
+
+
+@dataclass(frozen=True)
+class Artifact:
+    """
+    一个已保存的工件。
+
+    属性:
+        id (str): 工件 ID (内容 SHA-256 的前 16 位十六进制)
+        path (str): 工件文件的路径
+        chars (int): 字符数
+        lines (int): 行数
+    """
+    id: str
+    path: str
+    chars: int
+    lines: int
+
+
+def parse_artifact_id(text: str) -> Optional[str]:
+    """从 "3f2a9c1d0b7e4a65"、"工件 3f2a…" 等写法中取出工件 ID；不是合法的 ID 时返回 None"""
+    match = _ARTIFACT_ID_RE.search((text or "").strip().lower())
+    return match.group(1) if match else None
+
+
+def _count_lines(text: str) -> int:
+    if not text:
+        return 0
+    return text.count("\n") + (0 if text.endswith("\n") else 1)
+
+
+class ArtifactStore:
+    """按内容寻址的工件存储，位于工作区内，同一工作区的所有智能体共享"""
+    def __init__(self, root: str):
+        """
+        参数:
+            root (str): 工件目录
+        """
+        self.root = root
+
+    def path_for(self, artifact_id: str) -> str:
+        return os.path.join(self.root, artifact_id[:2], f"{artifact_id}.txt")
+
+    def put(self, text: str) -> Artifact:
+        """保存内容并返回工件；相同的内容只写入一次"""
+        data = text.encode("utf-8", errors="replace")
+        artifact_id = hashlib.sha256(data).hexdigest()[:ARTIFACT_ID_LENGTH]
+        path = self.path_for(artifact_id)
+        if not os.path.exists(path):
+            directory = os.path.dirname(path)
+            os.makedirs(directory, exist_ok=True)
+            # 先写临时文件再原子替换，并发写入同一工件时读者不会看到写了一半的文件
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        return Artifact(artifact_id, path, len(text), _count_lines(text))
+
+    def externalize(self, text: str, threshold_chars: int, preview_chars: int) -> str:
+        """
+        超过阈值的内容保存为工件，返回句柄和预览；未超过阈值时原样返回。
+
+        参数:
+            text (str): 工具输出
+            threshold_chars (int): 保存为工件的最小字符数
+            preview_chars (int): 预览 (开头加结尾) 的字符数
+
+        返回:
+            str: 原始内容，或 "[工件 <id>: ...]" 句柄加预览
+        """
+        if len(text) <= threshold_chars:
+            return text
+        artifact = self.put(text)
+        return render_preview(artifact, text, preview_chars)
+
+
+def render_preview(artifact: Artifact, text: str, preview_chars: int) -> str:
+    """工件的句柄和预览：开头约 2/3、结尾约 1/3，尽量在行边界处截断"""
+    head = text[:preview_chars * 2 // 3]
+    tail = text[-(preview_chars - len(head)):] if preview_chars > len(head) else ""
+    if "\n" in head:
+        head = head[:head.rfind("\n") + 1]
+    if "\n" in tail[:-1]:
+        tail = tail[tail.find("\n") + 1:]
+    head_lines = head.count("\n")
+    tail_lines = _count_lines(tail)
+    first, last = head_lines + 1, artifact.lines - tail_lines
+    omitted = f"第 {first}-{last} 行，" if head.endswith("\n") and last >= first else ""
+    return (
+        f"[工件 {artifact.id}：完整输出共 {artifact.chars} 个字符、{artifact.lines} 行，已保存为工件。"
+        f"这里只显示开头和结尾，需要其余内容时用 read_artifact 按行号或正则表达式读取]\n"
+        f"{head}"
+        f"\n...[已省略{omitted}{artifact.chars - len(head) - len(tail)} 个字符]...\n"
+        f"{tail}"
+    )
+
+
+def artifacts_root(workspace: Optional[str] = None) -> str:
+    """工作区的工件目录"""
+    return os.path.normpath(os.path.join(workspace or AppConfig.WORKSPACE_PATH, AppConfig.ARTIFACTS_DIR))
+
+
+def is_artifacts_dir(path: str, workspace: Optional[str] = None) -> bool:
+    """
+    path 是否是工作区的工件目录。列出、搜索文件和生成工作区清单时跳过该目录，
+    避免把之前保存的工具输出当作工作区文件。
+    """
+    return os.path.normpath(path) == artifacts_root(workspace)
+
+
+_stores: Dict[str, ArtifactStore] = {}
+_lock = threading.Lock()
+
+
+def get_artifact_store(workspace: Optional[str] = None) -> Optional[ArtifactStore]:
+    """返回工作区的工件存储 (按目录缓存)；未启用工件存储时返回 None"""
+    if not AppConfig.ARTIFACTS_ENABLED:
+        return None
+    root = artifacts_root(workspace)
+    with _lock:
+        store = _stores.get(root)
+        if store is None:
+            store = _stores[root] = ArtifactStore(root)
+    return store
@@ -0,0 +1,164 @@
+import asyncio
+import logging
+from dataclasses import asdict
+from typing import Dict, List, Optional
+
+from config import AppConfig
+from core import replay, tracing
+from core.orchestrator import Orchestrator
+from core.history import History, HistoryRecord
+from agents.plan import PlanStep, load_plan, ancestors
+
+class AsyncOrchestrator(Orchestrator):
+    """
+    基于 asyncio 的并发任务编排器。
+    PlanningAgent 生成依赖图 (DAG) 形式的计划，彼此独立的步骤在
+    并发上限内同时执行，各步骤的历史记录按步骤编号确定性地合并。
+    """
+    mode = "async"
+
+    def __init__(self, task: str, workspace: Optional[str] = None, max_concurrency: Optional[int] = None, **kwargs):
+        """
+        初始化并发编排器。
+
+        参数:
+            task (str): 用户定义的初始任务。
+            workspace (Optional[str]): 本任务的工作区目录，默认使用全局配置的工作区。
+            max_concurrency (Optional[int]): 同时执行的最大步骤数，默认取自配置。
+            **kwargs: 录制与回放、运行 ID 和工具子集等参数，见 `Orchestrator.__init__`。
+        """
+        super().__init__(task, workspace, **kwargs)
+        self.max_concurrency = max_concurrency or AppConfig.MAX_CONCURRENT_STEPS
+
+    async def _plan(self) -> List[PlanStep]:
+        """生成依赖图形式的计划；无法解析为 JSON 时由 PlanningAgent 退回到链式的线性计划。"""
+        if self.checkpoint and self.checkpoint.state.plan:
+            logging.info("♻️ 使用检查点中的计划，跳过规划。")
+            return load_plan(self.checkpoint.state.plan)
+        with tracing.span("plan", tracing.PLAN) as plan_span:
+            steps = self._lookup_cached_plan()
+            if steps is not None:
+                plan_span.set(cache="hit")
+            else:
+                steps = await self.planning_agent.acreate_plan(self.task, tools=self.tool_names)
+                self._new_plan = [asdict(step) for step in steps]
+            plan_span.set(steps=len(steps))
+        if steps and self.checkpoint:
+            self.checkpoint.save_plan([asdict(step) for step in steps])
+        return steps
+
+    async def arun(self):
+        """
+        异步启动并执行整个任务工作流程。
+        """
+        logging.info("="*50)
+        logging.info(f"🎬 开始新任务 (并发模式，上限 {self.max_concurrency}): {self.task}")
+        logging.info("="*50 + "\n")
+
+        # 1. 规划阶段
+        logging.info("\n" + "-"*20 + " 阶段 1: 任务规划 " + "-"*20)
+        steps = await self._plan()
+
+        if not steps:
+            logging.error("❌ 规划失败。无法生成有效计划。正在终止。")
+            return "错误：规划失败。"
+
+        logging.info("✅ 任务规划完成。计划如下:")
+        for step in steps:
+            deps = ", ".join(map(str, step.depends_on)) or "无"
+            logging.info(f"  - 步骤 {step.id}: {step.description} (依赖: {deps})")
+        logging.info("-" * 50 + "\n")
+
+        # 2. 执行阶段
+        logging.info("\n" + "-"*20 + " 阶段 2: 计划执行 " + "-"*20)
+
+        plan = [step.description for step in steps]
+        history = History.from_config()
+        step_records: Dict[int, List[HistoryRecord]] = {}
+        finished_steps: Dict[int, str] = {}
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        running: Dict[int, asyncio.Task] = {}
+        state = self.checkpoint.state if self.checkpoint else None
+
+        # 检查点中已完成的步骤直接恢复其历史记录和结果
+        if state:
+            for sid, done in state.done.items():
+                step_records[sid] = state.records.get(sid, [])
+                if done["finished"]:
+                    finished_steps[sid] = done["summary"]
+
+        async def run_one(step: PlanStep):
+            if step.id in step_records:
+                logging.info(f"⏭️ 步骤 {step.id} 已在检查点中完成，跳过。")
+                return
+            # 等待所有前置步骤完成
+            await asyncio.gather(*(running[d] for d in step.depends_on))
+            if finished_steps:
+                logging.info(f"⏭️ 任务已由其他步骤完成，跳过步骤 {step.id}。")
+                return
+
+            async with semaphore:
+                if finished_steps:
+                    return
+                # 只把该步骤的 (传递) 前置步骤历史作为上下文，按编号顺序排列
+                context = History.from_config()
+                for a in ancestors(steps, step.id):
+                    context.extend(step_records[a])
+                if state:
+                    context.extend(state.records.get(step.id, []))
+
+                logging.info(f"\n▶️ 正在执行步骤 {step.id}/{len(steps)}: {step.description}")
+                logging.info("-" * 40)
+
+                # ManusAgent 的工具调用是阻塞的，放到工作线程中执行，避免阻塞事件循环；
+                # to_thread 会复制当前上下文，步骤内的 span 因此挂在本步骤的 span 之下
+                with tracing.span("step", tracing.STEP, step=step.id, description=step.description[:200],
+                                  depends_on=list(step.depends_on)) as step_span, replay.step_scope(step.id):
+                    _, finished, final_summary = await asyncio.to_thread(
+                        self.manus_agent.run_step,
+                        task=self.task,
+                        plan=plan,
+                        current_step_index=step.id,
+                        history=context,
+                        checkpoint=self.checkpoint,
+                        plan_step=step,
+                    )
+                    step_span.set(finished=finished)
+                if self.checkpoint:
+                    # 写检查点需要 fsync 和遍历工作区，同样不在事件循环中执行
+                    await asyncio.to_thread(self.checkpoint.step_done, step.id, context, finished, final_summary)
+                step_records[step.id] = context.step_records(step.id)
+                if finished:
+                    finished_steps[step.id] = final_summary
+
+        # 步骤已按拓扑顺序排列，创建任务时其依赖的任务一定已存在
+        for step in steps:
+            running[step.id] = asyncio.create_task(run_one(step))
+        await asyncio.gather(*running.values())
+
+        # 按步骤编号顺序合并各步骤历史，与实际完成顺序无关
+        for sid in sorted(step_records):
+            history.extend(step_records[sid])
+
+        if finished_steps:
+            # 多个并发步骤都调用了 finish 时，取编号最小的一个，保证结果确定
+            step_id, final_summary = min(finished_steps.items())
+            self.finished = True
+            logging.info("\n" + "="*50)
+            logging.info(f"✅ 代理已在步骤 {step_id} 完成任务！")
+            logging.info(f"最终总结: {final_summary}")
+            logging.info("="*50 + "\n")
+            return final_summary
+
+        logging.info("\n" + "="*50)
+        logging.info("🏁 所有计划步骤均已执行。")
+        logging.info("未调用 'finish' 工具，这可能表示计划不完整。")
+        logging.info("将返回完整的执行历史记录作为结果。")
+        logging.info("="*50 + "\n")
+        return history.render()
+
+    def _execute(self):
+        """
+        同步入口：在新的事件循环中执行 `arun` (由 `run` 负责追踪和汇总)。
+        """
+        return asyncio.run(self.arun())
@@ -0,0 +1,223 @@
+import contextvars
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from config import AppConfig
+from core.llm import track_usage, is_llm_error, router
+from core.orchestrator import Orchestrator
+from core.async_orchestrator import AsyncOrchestrator
+
+# 视为已完成、恢复运行时会被跳过的状态；failed 的任务会被重新执行
+DONE_STATUSES = ("finished", "completed")
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    """最近秩法计算百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class BatchRunner:
+    """
+    批量任务运行器。
+    从 JSONL 文件中流式读取任务，在线程池中并发执行，每个任务使用独立的工作区，
+    结果逐条追加写入输出 JSONL。重新运行时会跳过输出文件中已完成的任务，
+    因此崩溃后可以直接续跑。
+    """
+    def __init__(self, input_path: str, output_path: str, workers: Optional[int] = None,
+                 workspace_root: Optional[str] = None, async_mode: bool = False):
+        """
+        参数:
+            input_path (str): 任务 JSONL 文件，每行一个 JSON 对象
+            output_path (str): 结果 JSONL 文件
+            workers (Optional[int]): 并发执行的任务数，默认取自配置
+            workspace_root (Optional[str]): 各任务工作区的根目录，默认取自配置
+            async_mode (bool): 是否在每个任务内部使用并发编排器
+        """
+        self.input_path = input_path
+        self.output_path = output_path
+        self.workers = workers or AppConfig.BATCH_WORKERS
+        # 工具按绝对路径校验文件是否在工作区内，命令行给出的相对路径需要先转换为绝对路径
+        self.workspace_root = os.path.abspath(workspace_root or AppConfig.BATCH_WORKSPACE_ROOT)
+        self.async_mode = async_mode
+
+        self._write_lock = threading.Lock()
+        self._latencies: List[float] = []
+        self._status_counts: Dict[str, int] = {}
+        self._prompt_tokens = 0
+        self._completion_tokens = 0
+        self._plan_cache_hits = 0
+
+    @staticmethod
+    def _task_from_record(record: dict, line_no: int) -> Tuple[str, str]:
+        """从一行 JSON 中取出任务 ID 和任务文本"""
+        task_id = str(record.get("task_id") or record.get("id") or record.get("request_id") or f"line-{line_no}")
+        if record.get("task"):
+            text = str(record["task"])
+        else:
+            # 兼容 {title, body} 形式的需求记录
+            text = "\n\n".join(str(record[k]) for k in ("title", "body") if record.get(k))
+        return task_id, text
+
+    def _iter_tasks(self) -> Iterator[Tuple[str, str]]:
+        """逐行流式读取任务，不会一次性把整个文件载入内存"""
+        with open(self.input_path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    logging.warning(f"⚠️ 跳过第 {line_no} 行：无效的 JSON ({e})")
+                    continue
+                task_id, text = self._task_from_record(record, line_no)
+                if text:
+                    yield task_id, text
+
+    def _completed_ids(self) -> Set[str]:
+        """读取已有的输出文件，返回已完成任务的 ID (忽略崩溃时写了一半的末行)"""
+        completed = set()
+        if not os.path.exists(self.output_path):
+            return completed
+        with open(self.output_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("status") in DONE_STATUSES:
+                    completed.add(str(record.get("task_id")))
+        return completed
+
+    def _workspace_for(self, task_id: str) -> str:
+        # 清理后的 ID 可能相同 (例如 "a/b" 和 "a_b"，或前 100 个字符相同的长 ID)，附加原始 ID 的哈希以免任务共用工作区
+        safe_id = re.sub(r"[^\w.-]", "_", task_id)[:100]
+        digest = hashlib.sha256(task_id.encode("utf-8")).hexdigest()[:8]
+        workspace = os.path.join(self.workspace_root, f"{safe_id}-{digest}")
+        os.makedirs(workspace, exist_ok=True)
+        return workspace
+
+    def _run_one(self, task_id: str, task: str) -> dict:
+        """在独立工作区中执行单个任务，返回结果记录"""
+        workspace = self._workspace_for(task_id)
+        start = time.perf_counter()
+        plan_cached = False
+        with track_usage() as usage:
+            try:
+                orchestrator_cls = AsyncOrchestrator if self.async_mode else Orchestrator
+                # 由任务 ID 和任务内容确定运行 ID，批量任务中断后重新执行时从该任务的检查点继续
+                digest = hashlib.sha256(task.encode("utf-8")).hexdigest()[:8]
+                run_id = f"batch-{os.path.basename(workspace)}-{digest}"
+                orchestrator = orchestrator_cls(task=task, workspace=workspace, run_id=run_id)
+                try:
+                    result = orchestrator.run()
+                finally:
+                    orchestrator.close()
+                plan_cached = orchestrator.cached_plan_id is not None
+                if isinstance(result, str) and is_llm_error(result):
+                    status = "failed"
+                else:
+                    status = "finished" if orchestrator.finished else "completed"
+                error = None
+            except Exception as e:
+                logging.exception(f"❌ 任务 {task_id} 执行失败")
+                result, status, error = None, "failed", f"{e.__class__.__name__}: {e}"
+        return {
+            "task_id": task_id,
+            "status": status,
+            "result": result,
+            "error": error,
+            "workspace": workspace,
+            "duration_seconds": round(time.perf_counter() - start, 3),
+            "plan_cached": plan_cached,
+            "llm_calls": usage.calls,
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": usage.completion_tokens,
+        }
+
+    def _write_result(self, out_file, record: dict):
+        """追加一条结果并立即落盘，保证崩溃时已完成的结果不会丢失"""
+        with self._write_lock:
+            out_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out_file.flush()
+            os.fsync(out_file.fileno())
+            self._latencies.append(record["duration_seconds"])
+            self._status_counts[record["status"]] = self._status_counts.get(record["status"], 0) + 1
+            self._prompt_tokens += record["prompt_tokens"]
+            self._completion_tokens += record["completion_tokens"]
+            self._plan_cache_hits += bool(record.get("plan_cached"))
+
+    def run(self) -> dict:
+        """
+        执行全部任务并返回统计信息。
+
+        返回:
+            dict: 任务数、吞吐量 (任务/分钟)、p50/p95 延迟和令牌用量
+        """
+        completed = self._completed_ids()
+        if completed:
+            logging.info(f"⏩ 输出文件中已有 {len(completed)} 个已完成任务，将跳过它们。")
+        os.makedirs(os.path.dirname(os.path.abspath(self.output_path)), exist_ok=True)
+
+        start = time.perf_counter()
+        skipped = 0
+        # 限制在途任务数量，避免一次性为上千个任务创建 Future
+        in_flight = threading.BoundedSemaphore(self.workers * 2)
+
+        with open(self.output_path, "a", encoding="utf-8") as out_file, \
+                ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch") as pool:
+
+            def on_done(future: Future):
+                try:
+                    self._write_result(out_file, future.result())
+                    self._log_progress(start)
+                finally:
+                    in_flight.release()
+
+            for task_id, task in self._iter_tasks():
+                if task_id in completed:
+                    skipped += 1
+                    continue
+                in_flight.acquire()
+                logging.info(f"📥 提交任务 {task_id}")
+                # 复制当前上下文，外层的追踪 (例如基准测试) 能收集到各任务的 span
+                context = contextvars.copy_context()
+                pool.submit(context.run, self._run_one, task_id, task).add_done_callback(on_done)
+
+        stats = self.stats(time.perf_counter() - start)
+        stats["skipped"] = skipped
+        return stats
+
+    def _log_progress(self, start: float):
+        elapsed = time.perf_counter() - start
+        done = len(self._latencies)
+        logging.info(f"📈 已完成 {done} 个任务，吞吐量 {done / max(elapsed, 1e-9) * 60:.1f} 任务/分钟")
+
+    def stats(self, elapsed: float) -> dict:
+        """汇总吞吐量、延迟分位数、令牌用量和各模型档位的调用统计"""
+        done = len(self._latencies)
+        return {
+            "tasks": done,
+            "statuses": dict(self._status_counts),
+            "elapsed_seconds": round(elapsed, 3),
+            "tasks_per_minute": round(done / max(elapsed, 1e-9) * 60, 2),
+            "latency_p50_seconds": round(_percentile(self._latencies, 50), 3),
+            "latency_p95_seconds": round(_percentile(self._latencies, 95), 3),
+            "prompt_tokens": self._prompt_tokens,
+            "completion_tokens": self._completion_tokens,
+            "total_tokens": self._prompt_tokens + self._completion_tokens,
+            "plan_cache_hits": self._plan_cache_hits,
+            "models": router.get().stats() if router.created else {},
+        }
@@ -0,0 +1,236 @@
+import json
+import logging
+import os
+import threading
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from core.artifacts import is_artifacts_dir
+from core.history import History, HistoryRecord
+
+# 运行检查点。
+# 每次运行对应一个只追加的 JSONL 文件 (checkpoints/<run_id>.jsonl)，每行一个事件：
+#   run       运行的任务、模式和工作区 (文件的第一行)
+#   plan      规划结果
+#   records   某个步骤新增的历史记录 (增量，每次 ReAct 循环开始前写入)
+#   step      某个步骤执行完毕，附带工作区文件清单的变化
+#   done      整个运行结束及其结果
+# 每个事件以一次 write 追加并 fsync，崩溃时最多丢失写了一半的末行，加载时会被忽略。
+
+
+def new_run_id() -> str:
+    return f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def workspace_manifest(root: str, max_files: int = 20000) -> Dict[str, List[int]]:
+    """返回工作区内文件的清单 {相对路径: [大小, 修改时间 (纳秒)]}，不包括工件目录"""
+    manifest: Dict[str, List[int]] = {}
+    if not os.path.isdir(root):
+        return manifest
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not is_artifacts_dir(os.path.join(dirpath, d), root))
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            manifest[os.path.relpath(path, root)] = [st.st_size, st.st_mtime_ns]
+            if len(manifest) >= max_files:
+                logging.warning(f"⚠️ 工作区文件超过 {max_files} 个，检查点中的文件清单不完整。")
+                return manifest
+    return manifest
+
+
+@dataclass
+class RunState:
+    """
+    从检查点文件恢复的运行状态。
+
+    属性:
+        run_id (str): 运行 ID
+        task (str): 任务描述
+        mode (str): 编排器模式，"sync" 或 "async"
+        workspace (Optional[str]): 工作区目录
+        plan (Optional[List[Any]]): 计划，两种模式都是 PlanStep 的字典列表 (由 load_plan 还原)；旧版检查点中同步模式的步骤描述列表同样可以加载
+        records (Dict[int, List[HistoryRecord]]): 各步骤的历史记录 (未压缩)
+        iterations (Dict[int, int]): 各步骤已完成的 ReAct 循环次数
+        done (Dict[int, dict]): 已完成的步骤 -> {"finished": 是否调用了 finish, "summary": 最终摘要}
+        manifest (Dict[str, List[int]]): 最近一个完成的步骤之后的工作区文件清单
+        result (Optional[str]): 运行已结束时的最终结果
+        finished (bool): 运行是否以调用 finish 结束
+    """
+    run_id: str
+    task: str
+    mode: str
+    workspace: Optional[str]
+    plan: Optional[List[Any]] = None
+    records: Dict[int, List[HistoryRecord]] = field(default_factory=dict)
+    iterations: Dict[int, int] = field(default_factory=dict)
+    done: Dict[int, dict] = field(default_factory=dict)
+    manifest: Dict[str, List[int]] = field(default_factory=dict)
+    result: Optional[str] = None
+    finished: bool = False
+
+    @property
+    def completed(self) -> bool:
+        return self.result is not None
+
+
+class Checkpointer:
+    """
+    把一次运行的进度增量写入检查点文件，并在恢复时重建运行状态。
+    可以安全地在多个线程间共享 (并发模式下各步骤在不同线程中写入)。
+    """
+    def __init__(self, directory: str, run_id: str, task: str, mode: str, workspace: Optional[str],
+                 manifest_root: str, fsync: bool = True):
+        """
+        打开 (恢复) 或创建运行的检查点文件。
+
+        参数:
+            directory (str): 检查点目录
+            run_id (str): 运行 ID
+            task (str): 任务描述，仅在新建时写入
+            mode (str): 编排器模式，仅在新建时写入
+            workspace (Optional[str]): 工作区目录，仅在新建时写入
+            manifest_root (str): 记录文件清单的工作区根目录
+            fsync (bool): 每次写入后是否 fsync
+        """
+        self.run_id = run_id
+        self.path = self.path_for(directory, run_id)
+        self.manifest_root = manifest_root
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._written: Dict[int, int] = {}
+
+        os.makedirs(directory, exist_ok=True)
+        self.state = self._load(self.path) if os.path.exists(self.path) else None
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if self.state is None:
+            self.state = RunState(run_id=run_id, task=task, mode=mode, workspace=workspace)
+            self._append({"type": "run", "run_id": run_id, "task": task, "mode": mode, "workspace": workspace,
+                          "created_at": datetime.now().isoformat(timespec="seconds")})
+        else:
+            self._written = {step: len(records) for step, records in self.state.records.items()}
+            self._check_workspace()
+
+    @staticmethod
+    def path_for(directory: str, run_id: str) -> str:
+        return os.path.join(directory, f"{run_id}.jsonl")
+
+    @property
+    def resumed(self) -> bool:
+        """是否从已有的检查点恢复 (且已有规划结果)"""
+        return self.state.plan is not None
+
+    @staticmethod
+    def _load(path: str) -> Optional[RunState]:
+        """读取检查点文件；截掉崩溃时写了一半的末行，之后的追加不会与它粘连"""
+        with open(path, "rb") as f:
+            data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]
+        if len(complete) != len(data):
+            with open(path, "r+b") as f:
+                f.truncate(len(complete))
+
+        state = None
+        for line in complete.decode("utf-8").splitlines():
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            kind = event.get("type")
+            if kind == "run":
+                state = RunState(run_id=event["run_id"], task=event["task"], mode=event["mode"],
+                                 workspace=event.get("workspace"))
+            elif state is None:
+                continue
+            elif kind == "plan":
+                state.plan = event["plan"]
+            elif kind == "records":
+                state.records.setdefault(event["step"], []).extend(HistoryRecord(**r) for r in event["records"])
+                if "iteration" in event:
+                    state.iterations[event["step"]] = event["iteration"]
+            elif kind == "step":
+                state.done[event["step"]] = {"finished": event["finished"], "summary": event.get("summary", "")}
+                for path, entry in event["manifest"]["changed"].items():
+                    state.manifest[path] = entry
+                for path in event["manifest"]["removed"]:
+                    state.manifest.pop(path, None)
+            elif kind == "done":
+                state.result = event["result"]
+                state.finished = event["finished"]
+        return state
+
+    @classmethod
+    def load(cls, directory: str, run_id: str) -> Optional[RunState]:
+        """只读取运行状态 (例如获取要恢复的任务和模式)，检查点不存在时返回 None"""
+        path = cls.path_for(directory, run_id)
+        return cls._load(path) if os.path.exists(path) else None
+
+    def _append(self, event: dict):
+        data = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            os.write(self._fd, data)
+            if self.fsync:
+                os.fsync(self._fd)
+
+    def _check_workspace(self):
+        """恢复时提示工作区中自检查点以来被修改或删除的文件"""
+        current = workspace_manifest(self.manifest_root)
+        changed = [p for p, entry in self.state.manifest.items() if current.get(p) != entry]
+        if changed:
+            logging.warning(f"⚠️ 工作区中有 {len(changed)} 个文件与检查点记录不一致 (例如 {changed[0]})，"
+                            "恢复后的步骤可能基于已变化的文件。")
+
+    def save_plan(self, plan: List[Any]):
+        self.state.plan = plan
+        self._append({"type": "plan", "plan": plan})
+
+    def save_records(self, step: int, history: History, iteration: Optional[int] = None):
+        """
+        追加某个步骤自上次写入以来新增的历史记录；当前步骤的记录只会追加，不会被压缩。
+
+        参数:
+            step (int): 步骤编号
+            history (History): 包含该步骤记录的历史
+            iteration (Optional[int]): 该步骤已完成的 ReAct 循环次数
+        """
+        records = history.step_records(step)
+        with self._lock:
+            start = self._written.get(step, 0)
+            self._written[step] = len(records)
+        new = records[start:]
+        if new:
+            self.state.records.setdefault(step, []).extend(new)
+            event = {"type": "records", "step": step, "records": [asdict(r) for r in new]}
+            if iteration is not None:
+                self.state.iterations[step] = iteration
+                event["iteration"] = iteration
+            self._append(event)
+
+    def step_done(self, step: int, history: History, finished: bool, summary: str):
+        """记录步骤完成，以及工作区文件清单的变化"""
+        self.save_records(step, history)
+        current = workspace_manifest(self.manifest_root)
+        with self._lock:
+            previous = self.state.manifest
+            changed = {p: entry for p, entry in current.items() if previous.get(p) != entry}
+            removed = [p for p in previous if p not in current]
+            self.state.manifest = current
+            self.state.done[step] = {"finished": finished, "summary": summary}
+        self._append({"type": "step", "step": step, "finished": finished, "summary": summary,
+                      "manifest": {"changed": changed, "removed": removed}})
+
+    def run_done(self, result: str, finished: bool):
+        self.state.result = result
+        self.state.finished = finished
+        self._append({"type": "done", "result": result, "finished": finished})
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
@@ -0,0 +1,215 @@
+import logging
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional
+
+from core.llm import is_llm_error
+from core.tokens import count_tokens
+
+THOUGHT = "thought"
+ACTION = "action"
+OBSERVATION = "observation"
+SUMMARY = "summary"
+
+_LABELS = {
+    THOUGHT: "Thought",
+    ACTION: "Action",
+    OBSERVATION: "Observation",
+}
+
+
+@dataclass
+class HistoryRecord:
+    """
+    历史记录中的一条类型化记录。
+
+    属性:
+        kind (str): 记录类型，THOUGHT / ACTION / OBSERVATION / SUMMARY 之一
+        content (str): 记录内容
+        step (int): 记录所属的计划步骤编号
+        tokens (int): 该记录渲染后的令牌数
+        merged (bool): 是否为合并了多个早期步骤的摘要
+    """
+    kind: str
+    content: str
+    step: int
+    tokens: int = 0
+    merged: bool = False
+
+    def render(self) -> str:
+        if self.kind == SUMMARY:
+            scope = f"步骤 {self.step} 及之前" if self.merged else f"步骤 {self.step}"
+            return f"\n[{scope}摘要] {self.content}"
+        return f"\n{_LABELS[self.kind]}: {self.content}"
+
+
+def truncate_middle(text: str, max_chars: int) -> str:
+    """保留文本的开头和结尾，截掉中间部分"""
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    head = max_chars * 2 // 3
+    tail = max_chars - head
+    omitted = len(text) - head - tail
+    return f"{text[:head]}\n...[已省略 {omitted} 个字符]...\n{text[-tail:]}"
+
+
+class History:
+    """
+    结构化、有界的执行历史。
+
+    以 Thought / Action / Observation 记录的列表代替不断拼接的字符串，
+    并对每条记录做令牌计数。当总令牌数超过预算时，较早步骤的记录会被
+    压缩为一条摘要 (基于截断或由 LLM 生成)，从而让提示大小在长任务中保持平稳。
+    """
+    def __init__(self, token_budget: int = 0, max_observation_chars: int = 0,
+                 summary_max_chars: int = 600, summarizer: Optional[Callable[[str], str]] = None):
+        """
+        初始化历史记录
+
+        参数:
+            token_budget (int): 渲染到提示中的历史令牌预算，0 表示不限制
+            max_observation_chars (int): 单条观察的最大字符数，超出部分从中间截断，0 表示不限制
+            summary_max_chars (int): 单个步骤摘要的最大字符数
+            summarizer (Optional[Callable[[str], str]]): 将步骤历史文本压缩为摘要的函数；
+                为 None 时使用基于截断的摘要
+        """
+        self.token_budget = token_budget
+        self.max_observation_chars = max_observation_chars
+        self.summary_max_chars = summary_max_chars
+        self.summarizer = summarizer
+        self.records: List[HistoryRecord] = []
+
+    @classmethod
+    def from_config(cls) -> "History":
+        """按全局配置创建历史记录"""
+        from config import AppConfig
+        summarizer = _llm_summarize if AppConfig.HISTORY_SUMMARY_MODE == "llm" else None
+        return cls(
+            token_budget=AppConfig.HISTORY_TOKEN_BUDGET,
+            max_observation_chars=AppConfig.HISTORY_MAX_OBSERVATION_CHARS,
+            summary_max_chars=AppConfig.HISTORY_SUMMARY_MAX_CHARS,
+            summarizer=summarizer,
+        )
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(r.tokens for r in self.records)
+
+    def add(self, kind: str, content: str, step: int) -> HistoryRecord:
+        """追加一条记录；观察内容会按上限截断"""
+        if kind == OBSERVATION:
+            content = truncate_middle(content, self.max_observation_chars)
+        record = HistoryRecord(kind=kind, content=content, step=step)
+        record.tokens = count_tokens(record.render())
+        self.records.append(record)
+        return record
+
+    def add_thought(self, content: str, step: int) -> HistoryRecord:
+        return self.add(THOUGHT, content, step)
+
+    def add_action(self, content: str, step: int) -> HistoryRecord:
+        return self.add(ACTION, content, step)
+
+    def add_observation(self, content: str, step: int) -> HistoryRecord:
+        return self.add(OBSERVATION, content, step)
+
+    def extend(self, records: Iterable[HistoryRecord]):
+        self.records.extend(records)
+
+    def drop_steps(self, steps: Iterable[int]):
+        """删除指定步骤的全部记录 (例如推测执行后与最终计划不一致、需要重新执行的步骤)"""
+        dropped = set(steps)
+        self.records = [r for r in self.records if r.step not in dropped]
+
+    def steps(self) -> List[int]:
+        """按出现顺序返回历史中包含的步骤编号"""
+        return list(dict.fromkeys(r.step for r in self.records))
+
+    def step_records(self, step: int) -> List[HistoryRecord]:
+        return [r for r in self.records if r.step == step]
+
+    def render(self, steps: Optional[Iterable[int]] = None) -> str:
+        """将历史渲染为提示文本，步骤之间以空行分隔"""
+        wanted = set(steps) if steps is not None else None
+        parts = []
+        for step in self.steps():
+            if wanted is not None and step not in wanted:
+                continue
+            parts.append("".join(r.render() for r in self.step_records(step)))
+        return "\n\n".join(parts)
+
+    def compact(self, current_step: Optional[int] = None):
+        """
+        当总令牌数超过预算时，从最早的步骤开始将其记录压缩为一条摘要，
+        直到回到预算之内。若全部早期步骤都已是摘要仍超出预算，
+        则继续把最早的摘要两两合并。当前步骤的记录不会被压缩。
+        """
+        if not self.token_budget or self.total_tokens <= self.token_budget:
+            return
+
+        for step in self.steps():
+            if self.total_tokens <= self.token_budget:
+                break
+            if step == current_step:
+                continue
+            step_records = self.step_records(step)
+            if len(step_records) == 1 and step_records[0].kind == SUMMARY:
+                continue
+            self._summarize_step(step, step_records)
+
+        summaries = [r for r in self.records if r.kind == SUMMARY and r.step != current_step]
+        while self.total_tokens > self.token_budget and len(summaries) >= 2:
+            first, second = summaries[0], summaries[1]
+            merged = HistoryRecord(
+                kind=SUMMARY,
+                content=truncate_middle(f"{first.content} / 步骤 {second.step}: {second.content}", self.summary_max_chars),
+                step=second.step,
+                merged=True,
+            )
+            merged.tokens = count_tokens(merged.render())
+            index = self._index_of(first)
+            self.records = [r for r in self.records if r is not first and r is not second]
+            self.records.insert(index, merged)
+            summaries = [merged] + summaries[2:]
+
+    def _index_of(self, record: HistoryRecord) -> int:
+        """按对象身份 (而非值相等) 查找记录的位置"""
+        return next(i for i, r in enumerate(self.records) if r is record)
+
+    def _summarize_step(self, step: int, step_records: List[HistoryRecord]):
+        """用一条摘要记录替换某一步骤的全部记录"""
+        text = "".join(r.render() for r in step_records)
+        summary = None
+        if self.summarizer:
+            try:
+                summary = self.summarizer(text)
+            except Exception as e:
+                logging.warning(f"⚠️ 生成步骤 {step} 的摘要失败，改用截断摘要：{e}")
+        if not summary or is_llm_error(summary):
+            summary = self._truncation_summary(step_records)
+        summary = truncate_middle(summary.strip(), self.summary_max_chars)
+
+        index = self._index_of(step_records[0])
+        self.records = [r for r in self.records if r.step != step]
+        record = HistoryRecord(kind=SUMMARY, content=summary, step=step)
+        record.tokens = count_tokens(record.render())
+        self.records.insert(index, record)
+        logging.info(f"🗜️ 已将步骤 {step} 的 {len(step_records)} 条历史记录压缩为摘要。")
+
+    def _truncation_summary(self, step_records: List[HistoryRecord]) -> str:
+        """基于截断的摘要：保留每条思考和观察的开头"""
+        per_record = max(self.summary_max_chars // max(len(step_records), 1), 40)
+        lines = []
+        for r in step_records:
+            if r.kind in (THOUGHT, OBSERVATION, SUMMARY):
+                first_line = r.content.strip().splitlines()[0] if r.content.strip() else ""
+                lines.append(f"{_LABELS.get(r.kind, '摘要')}: {first_line[:per_record]}")
+        return " | ".join(lines)
+
+
+def _llm_summarize(text: str) -> str:
+    """使用 LLM 将一个步骤的历史压缩为简短摘要"""
+    from core import routing
+    from core.llm import call_llm
+    from agents.prompts import HISTORY_SUMMARY_INSTRUCTIONS
+    with routing.route(routing.SUMMARY):
+        return call_llm(text, instructions=HISTORY_SUMMARY_INSTRUCTIONS)
@@ -1,67 +1,635 @@
-import openai
+import asyncio
+import email.utils
+import functools
+import inspect
+import json
+import random
+import threading
+import time
 import logging
+import sqlite3
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
 from config import AppConfig
+from core import replay, routing, tracing
+from core.lazy import Lazy
+from core.llm_cache import LLMCache
+from core.log_setup import log_event
+from core.rate_limiter import RateLimiter
+from core.routing import ModelProfile, ModelRouter
+from core.tokens import count_tokens
+
+# 所有 LLM 调用失败时返回的消息都以此前缀开头
+LLM_ERROR_PREFIX = "错误："
+
+def is_llm_error(text: str) -> bool:
+    """判断 LLM 调用函数的返回值是否为错误消息"""
+    return text.startswith(LLM_ERROR_PREFIX)
+
+@dataclass
+class TokenUsage:
+    """一段执行范围内 (例如一个任务) 累计的 LLM 调用次数与令牌用量。"""
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, prompt_tokens: int, completion_tokens: int):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+@dataclass
+class ToolCall:
+    """模型在一次响应中请求的一个工具调用。arguments 是模型生成的 JSON 字符串，由调用方解析。"""
+    id: str
+    name: str
+    arguments: str
+
+@dataclass
+class ToolCallResponse:
+    """
+    `call_llm_with_tools` 的返回值。
+
+    属性:
+        content (str): 响应正文 (通常是简短的思考)；调用失败时为以 LLM_ERROR_PREFIX 开头的错误消息
+        tool_calls (List[ToolCall]): 模型请求的工具调用，可能有多个
+        status_code (Optional[int]): 调用失败时服务端返回的 HTTP 状态码 (若有)
+    """
+    content: str
+    tool_calls: List[ToolCall] = field(default_factory=list)
+    status_code: Optional[int] = None
+
+_usage_var: ContextVar[Optional[TokenUsage]] = ContextVar("llm_usage", default=None)
+
+@contextmanager
+def track_usage() -> Iterator[TokenUsage]:
+    """
+    在 with 块内统计所有 LLM 调用的令牌用量。
+    统计对象通过 contextvars 传递，`asyncio.to_thread` 启动的工作线程同样会被计入。
+    """
+    usage = TokenUsage()
+    token = _usage_var.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage_var.reset(token)
+
+def _record_usage(prompt_tokens: int, completion_tokens: int, span=tracing.NOOP_SPAN):
+    """累计到当前的用量统计和本次调用的追踪 span，并按实际补全令牌数补扣 TPM 额度 (请求前只预扣了提示令牌)。"""
+    span.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    usage = _usage_var.get()
+    if usage is not None:
+        usage.add(prompt_tokens, completion_tokens)
+    rate_limiter.get().record(completion_tokens)
 
 # --- 初始化 OpenAI 客户端 ---
-# 此代码块现在根据加载的配置动态配置客户端。
-def get_llm_client():
-    """根据全局配置初始化并返回 OpenAI 客户端。"""
+# openai 和 httpx 的导入以及客户端的创建 (加载证书等) 都较慢，推迟到第一次真正请求 LLM 时进行，
+# 导入本模块 (以及依赖它的编排器、工具和历史模块) 不会产生这些开销，也不会创建任何目录。
+def _create_http_client(async_mode: bool = False):
+    """创建带连接池、长连接和显式超时的 httpx 客户端。"""
+    import httpx
+    limits = httpx.Limits(
+        max_connections=AppConfig.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=AppConfig.LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=AppConfig.LLM_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(AppConfig.LLM_READ_TIMEOUT, connect=AppConfig.LLM_CONNECT_TIMEOUT)
+    client_cls = httpx.AsyncClient if async_mode else httpx.Client
+    return client_cls(limits=limits, timeout=timeout)
+
+def get_llm_client(async_mode: bool = False, profile: Optional[ModelProfile] = None):
+    """根据全局配置 (或指定档位的端点和密钥) 初始化并返回 OpenAI 客户端 (同步或异步)。"""
     if not AppConfig or not AppConfig.check_config():
         logging.error("❌ 由于缺少配置，无法初始化 LLM 客户端。")
         return None
 
     try:
-        client = openai.OpenAI(
-            base_url=AppConfig.LLM_BASE_URL,
-            api_key=AppConfig.LLM_API_KEY,
+        import openai
+        client_cls = openai.AsyncOpenAI if async_mode else openai.OpenAI
+        client = client_cls(
+            base_url=profile.base_url if profile else AppConfig.LLM_BASE_URL,
+            api_key=profile.api_key if profile else AppConfig.LLM_API_KEY,
+            http_client=_create_http_client(async_mode=async_mode),
+            # 重试由本模块统一处理 (指数退避 + 抖动 + Retry-After)
+            max_retries=0,
         )
-        logging.info("✅ LLM 客户端初始化成功。")
+        logging.info(f"✅ LLM 客户端 ({client_cls.__name__}) 初始化成功。")
         return client
     except Exception as e:
         logging.error(f"❌ 初始化 OpenAI 客户端失败：{e}")
         return None
 
-# 导入模块时初始化客户端
-client = get_llm_client()
+def get_llm_cache():
+    """根据全局配置初始化 LLM 响应缓存；未启用时返回 None。"""
+    if not AppConfig or not AppConfig.LLM_CACHE_ENABLED:
+        return None
+    try:
+        return LLMCache(
+            AppConfig.LLM_CACHE_PATH,
+            ttl_seconds=AppConfig.LLM_CACHE_TTL_SECONDS,
+            max_entries=AppConfig.LLM_CACHE_MAX_ENTRIES,
+            max_bytes=AppConfig.LLM_CACHE_MAX_BYTES,
+        )
+    except sqlite3.Error as e:
+        logging.error(f"❌ 初始化 LLM 响应缓存失败：{e}")
+        return None
+
+# 客户端、缓存和限流器都在第一次使用时创建
+client = Lazy(get_llm_client)
+async_client = Lazy(lambda: get_llm_client(async_mode=True))
+llm_cache = Lazy(get_llm_cache)
+# 进程内所有智能体共享的 RPM/TPM 限流器
+rate_limiter = Lazy(lambda: RateLimiter(AppConfig.LLM_REQUESTS_PER_MINUTE, AppConfig.LLM_TOKENS_PER_MINUTE))
+# 进程内共享的模型路由器，汇总各档位的延迟和成功率
+router: "Lazy[ModelRouter]" = Lazy(lambda: routing.create_router(AppConfig))
+
+# 端点或密钥与 [llm] 不同的档位使用各自的客户端，其余档位共享上面的客户端 (及其连接池)
+_profile_clients: Dict[Tuple[str, Optional[str], bool], "Lazy"] = {}
+_profile_clients_lock = threading.Lock()
+
+def _client_for(profile: ModelProfile, async_mode: bool = False):
+    if profile.base_url == AppConfig.LLM_BASE_URL and profile.api_key == AppConfig.LLM_API_KEY:
+        return (async_client if async_mode else client).get()
+    key = (profile.base_url, profile.api_key, async_mode)
+    with _profile_clients_lock:
+        lazy = _profile_clients.get(key)
+        if lazy is None:
+            lazy = _profile_clients[key] = Lazy(lambda: get_llm_client(async_mode=async_mode, profile=profile))
+    return lazy.get()
+
+def _select_profile(span=None) -> ModelProfile:
+    """按当前调用方的路由请求 (见 `core.routing`) 选择本次调用的模型档位，并记录到追踪 span 和路由请求上"""
+    request = routing.current_route()
+    profile = router.get().select(request)
+    (span or tracing.current_span()).set(model=profile.model, profile=profile.name)
+    if request is not None:
+        request.profile = profile.name
+        request.entry = None
+    return profile
+
+def _record_route(profile: ModelProfile, started: float, ok: bool):
+    """把一次实际发出的调用的延迟和结果计入档位统计"""
+    entry = router.get().record(profile, time.perf_counter() - started, ok)
+    request = routing.current_route()
+    if request is not None and request.profile == profile.name:
+        request.entry = entry
+
+def _cache_key(profile: ModelProfile, prompt: str, instructions: str, tools: Optional[list] = None) -> Optional[str]:
+    if not llm_cache.get():
+        return None
+    return LLMCache.make_key(
+        profile.model, instructions, prompt, profile.temperature, profile.max_tokens, tools
+    )
+
+def _cache_lookup(key: Optional[str], profile: ModelProfile) -> Optional[str]:
+    """查找缓存。只有温度为 0 (结果确定) 或配置了强制使用缓存时才会返回命中。"""
+    if key is None or (profile.temperature != 0 and not AppConfig.LLM_CACHE_FORCE):
+        return None
+    cached = llm_cache.get().get(key)
+    if cached is not None:
+        logging.info("💾 命中 LLM 响应缓存，跳过网络请求。")
+    return cached
+
+def _cache_store(key: Optional[str], content: str):
+    """缓存成功的响应；错误消息不会被缓存。"""
+    if key is not None and content and not is_llm_error(content):
+        llm_cache.get().put(key, content)
+
+def _build_request(profile: ModelProfile, prompt: str, instructions: str, **extra) -> dict:
+    """构建聊天补全请求的参数，供同步、流式和异步调用共用。"""
+    return dict(
+        model=profile.model,
+        messages=[
+            {"role": "system", "content": instructions},
+            {"role": "user", "content": prompt},
+        ],
+        max_tokens=profile.max_tokens,
+        temperature=profile.temperature,
+        **extra,
+    )
+
+def _is_retryable(e: Exception) -> bool:
+    """429、5xx、超时和连接错误可以重试；其他错误 (如 400/401) 重试也不会成功。"""
+    import openai  # 发出请求时客户端已创建，这里只是取已导入的模块
+    if isinstance(e, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    return isinstance(e, openai.APIStatusError) and e.status_code >= 500
+
+def _retry_after_seconds(e: Exception) -> Optional[float]:
+    """解析服务端返回的 Retry-After (秒数或 HTTP 日期) 或 retry-after-ms 响应头。"""
+    response = getattr(e, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(value)
+            return max(retry_at.timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def _retry_delay(e: Exception, attempt: int) -> float:
+    """指数退避加随机抖动；服务端给出 Retry-After 时至少等待该时长。"""
+    backoff = min(AppConfig.LLM_RETRY_MAX_DELAY, AppConfig.LLM_RETRY_BASE_DELAY * (2 ** attempt))
+    delay = random.uniform(backoff / 2, backoff)
+    retry_after = _retry_after_seconds(e)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+def _estimate_request_tokens(prompt: str, instructions: str) -> int:
+    return count_tokens(prompt) + count_tokens(instructions)
+
+def _tpm_tokens(prompt: str, instructions: str, tools: Optional[List[dict]] = None) -> int:
+    """限流器预扣的提示令牌数。未配置 TPM 上限时不需要计数 (第一次计数还要加载分词器)，直接返回 0。"""
+    if not AppConfig.LLM_TOKENS_PER_MINUTE:
+        return 0
+    tokens = _estimate_request_tokens(prompt, instructions)
+    if tools:
+        tokens += count_tokens(json.dumps(tools, ensure_ascii=False))
+    return tokens
+
+def _create_with_retries(llm_client, request: dict, prompt_tokens: int):
+    """在限流器许可下发送请求，对可重试的错误进行退避重试。"""
+    for attempt in range(AppConfig.LLM_MAX_RETRIES + 1):
+        rate_limiter.get().acquire(prompt_tokens)
+        try:
+            return llm_client.chat.completions.create(**request)
+        except Exception as e:
+            if attempt >= AppConfig.LLM_MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = _retry_delay(e, attempt)
+            logging.warning(f"⚠️ LLM 调用失败 ({e.__class__.__name__})，{delay:.1f} 秒后进行第 {attempt + 1} 次重试...")
+            time.sleep(delay)
+
+async def _acreate_with_retries(llm_client, request: dict, prompt_tokens: int):
+    """`_create_with_retries` 的异步版本，等待期间不阻塞事件循环。"""
+    for attempt in range(AppConfig.LLM_MAX_RETRIES + 1):
+        await rate_limiter.get().aacquire(prompt_tokens)
+        try:
+            return await llm_client.chat.completions.create(**request)
+        except Exception as e:
+            if attempt >= AppConfig.LLM_MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = _retry_delay(e, attempt)
+            logging.warning(f"⚠️ LLM 调用失败 ({e.__class__.__name__})，{delay:.1f} 秒后进行第 {attempt + 1} 次重试...")
+            await asyncio.sleep(delay)
+
+def _log_call_start(profile: ModelProfile, mode: str = ""):
+    logging.info("\n" + "="*50)
+    logging.info(f"🤖 正在{mode}调用 LLM (模型: {profile.model}，档位: {profile.name})...")
+    logging.info("="*50 + "\n")
+
+def _log_usage(usage):
+    """记录令牌用量，包括服务端前缀缓存命中的提示令牌数 (若服务商提供)。"""
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details else None
+    cached_info = f"，其中缓存命中 {cached}" if cached is not None else ""
+    logging.info(f"📊 令牌用量: 提示 {usage.prompt_tokens}{cached_info}，补全 {usage.completion_tokens}")
+    span = tracing.current_span()
+    if cached is not None:
+        span.set(cached_prompt_tokens=cached)
+    # 非流式调用由 _traced 把 LLM span 设为当前 span
+    _record_usage(usage.prompt_tokens, usage.completion_tokens, span)
+
+def _handle_response(response) -> str:
+    """记录并返回非流式响应的文本内容。"""
+    content = response.choices[0].message.content
+
+    log_event("llm.response", "✅ LLM 响应:", payload={"content": content or ""}, chars=len(content or ""))
+    _log_usage(getattr(response, "usage", None))
+
+    return content.strip() if content else f"{LLM_ERROR_PREFIX}LLM 返回了空响应。"
+
+def _handle_error(e: Exception) -> str:
+    """将调用异常转换为以 LLM_ERROR_PREFIX 开头的消息。"""
+    import openai
+    if isinstance(e, openai.APIError):
+        error_message = f"OpenAI API 错误：{e}"
+    else:
+        error_message = f"调用 LLM 时发生意外错误：{e}"
+    logging.error(f"❌ {error_message}")
+    return f"{LLM_ERROR_PREFIX}{error_message}"
+
+def _traced(name: str):
+    """为非流式的 LLM 调用函数 (同步或异步) 创建追踪 span，并记录缓存命中和错误"""
+    def mark_error(span, result):
+        content = result.content if isinstance(result, ToolCallResponse) else result
+        if isinstance(content, str) and is_llm_error(content):
+            span.set(error=content[:200])
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracing.span(name, tracing.LLM) as span:
+                    result = await func(*args, **kwargs)
+                    mark_error(span, result)
+                    return result
+            return async_wrapper
 
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracing.span(name, tracing.LLM) as span:
+                result = func(*args, **kwargs)
+                mark_error(span, result)
+                return result
+        return wrapper
+    return decorator
+
+def _encode_tool_response(response: ToolCallResponse) -> str:
+    return json.dumps(
+        {"content": response.content, "tool_calls": [call.__dict__ for call in response.tool_calls]}, ensure_ascii=False
+    )
+
+def _decode_tool_response(data: str) -> ToolCallResponse:
+    data = json.loads(data)
+    return ToolCallResponse(data["content"], [ToolCall(**call) for call in data["tool_calls"]])
+
+def _replayable(func):
+    """
+    接入运行录制与回放 (见 `core.replay`)：回放中时直接返回录制的响应，
+    否则实际调用。成功的响应 (包括回放和命中缓存的响应) 都会写入录制文件。
+    """
+    signature = inspect.signature(func)
+
+    def lookup(args, kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        request = bound.arguments
+        tools = request.get("tools")
+        replayed = replay.lookup_llm(request["prompt"], request["instructions"], tools)
+        if replayed is not None:
+            tracing.current_span().set(replayed=True)
+            replayed = _decode_tool_response(replayed) if tools is not None else replayed
+        return request, tools, replayed
+
+    def record(request, tools, result):
+        content = result.content if isinstance(result, ToolCallResponse) else result
+        if content is not None and not is_llm_error(content):
+            replay.record_llm(request["prompt"], request["instructions"],
+                              _encode_tool_response(result) if tools is not None else result, tools)
+
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            request, tools, result = lookup(args, kwargs)
+            if result is None:
+                result = await func(*args, **kwargs)
+            record(request, tools, result)
+            return result
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        request, tools, result = lookup(args, kwargs)
+        if result is None:
+            result = func(*args, **kwargs)
+        record(request, tools, result)
+        return result
+    return wrapper
+
+@_traced("llm.call")
+@_replayable
 def call_llm(prompt: str, instructions: str = "你是一个乐于助人的助手。") -> str:
     """
     一个调用大型语言模型 (LLM) 的通用函数。
-    它现在使用全局配置的客户端和参数。
+    模型档位由调用方的路由请求决定 (见 `core.routing`)，不在路由请求中时使用 [llm] 中的模型。
     """
-    if not client:
+    profile = _select_profile()
+    key = _cache_key(profile, prompt, instructions)
+    cached = _cache_lookup(key, profile)
+    if cached is not None:
+        tracing.current_span().set(cache_hit=True)
+        return cached
+
+    llm_client = _client_for(profile)
+    if not llm_client:
         error_msg = "LLM 客户端未初始化。请检查您的配置。"
         print(f"❌ {error_msg}")
-        return f"错误：{error_msg}"
+        return f"{LLM_ERROR_PREFIX}{error_msg}"
 
-    logging.info("\n" + "="*50)
-    logging.info(f"🤖 正在调用 LLM (模型: {AppConfig.LLM_MODEL})...")
-    logging.info("="*50 + "\n")
+    _log_call_start(profile)
 
+    started = time.perf_counter()
     try:
-        response = client.chat.completions.create(
-            model=AppConfig.LLM_MODEL,
-            messages=[
-                {"role": "system", "content": instructions},
-                {"role": "user", "content": prompt},
-            ],
-            max_tokens=AppConfig.LLM_MAX_TOKENS,
-            temperature=AppConfig.LLM_TEMPERATURE,
+        response = _create_with_retries(
+            llm_client, _build_request(profile, prompt, instructions), _tpm_tokens(prompt, instructions)
         )
-        content = response.choices[0].message.content
+        content = _handle_response(response)
+    except Exception as e:
+        _record_route(profile, started, ok=False)
+        return _handle_error(e)
+    _record_route(profile, started, ok=not is_llm_error(content))
+    _cache_store(key, content)
+    return content
 
-        logging.info("\n" + "*"*50)
-        logging.info("✅ LLM 响应:")
-        logging.info(content)
-        logging.info("*"*50 + "\n")
 
-        return content.strip() if content else "错误：LLM 返回了空响应。"
+@_traced("llm.acall")
+@_replayable
+async def acall_llm(prompt: str, instructions: str = "你是一个乐于助人的助手。") -> str:
+    """
+    `call_llm` 的异步版本，基于 `openai.AsyncOpenAI`。
+    在事件循环中等待网络响应时不会阻塞其他协程。
+    """
+    profile = _select_profile()
+    key = _cache_key(profile, prompt, instructions)
+    cached = _cache_lookup(key, profile)
+    if cached is not None:
+        tracing.current_span().set(cache_hit=True)
+        return cached
 
-    except openai.APIError as e:
-        error_message = f"OpenAI API 错误：{e}"
-        logging.error(f"❌ {error_message}")
-        return f"错误：{error_message}"
+    llm_client = _client_for(profile, async_mode=True)
+    if not llm_client:
+        error_msg = "异步 LLM 客户端未初始化。请检查您的配置。"
+        print(f"❌ {error_msg}")
+        return f"{LLM_ERROR_PREFIX}{error_msg}"
+
+    _log_call_start(profile, "异步")
+
+    started = time.perf_counter()
+    try:
+        response = await _acreate_with_retries(
+            llm_client, _build_request(profile, prompt, instructions), _tpm_tokens(prompt, instructions)
+        )
+        content = _handle_response(response)
     except Exception as e:
-        error_message = f"调用 LLM 时发生意外错误：{e}"
-        logging.error(f"❌ {error_message}")
-        return f"错误：{error_message}"
+        _record_route(profile, started, ok=False)
+        return _handle_error(e)
+    _record_route(profile, started, ok=not is_llm_error(content))
+    _cache_store(key, content)
+    return content
+
+
+@_traced("llm.tools")
+@_replayable
+def call_llm_with_tools(prompt: str, instructions: str, tools: List[dict]) -> ToolCallResponse:
+    """
+    以原生函数调用方式 (`tools` / `tool_choice="auto"`) 调用 LLM。
+    模型可以在一次响应中请求多个工具调用，无需再从文本中提取 JSON。
+    结果 (正文和工具调用) 以 JSON 形式写入响应缓存。
+    """
+    profile = _select_profile()
+    key = _cache_key(profile, prompt, instructions, tools)
+    cached = _cache_lookup(key, profile)
+    if cached is not None:
+        tracing.current_span().set(cache_hit=True)
+        return _decode_tool_response(cached)
+
+    llm_client = _client_for(profile)
+    if not llm_client:
+        error_msg = "LLM 客户端未初始化。请检查您的配置。"
+        print(f"❌ {error_msg}")
+        return ToolCallResponse(f"{LLM_ERROR_PREFIX}{error_msg}")
+
+    _log_call_start(profile, "函数调用方式")
+
+    started = time.perf_counter()
+    try:
+        response = _create_with_retries(
+            llm_client,
+            _build_request(profile, prompt, instructions, tools=tools, tool_choice="auto"),
+            _tpm_tokens(prompt, instructions, tools),
+        )
+    except Exception as e:
+        _record_route(profile, started, ok=False)
+        return ToolCallResponse(_handle_error(e), status_code=getattr(e, "status_code", None))
+
+    message = response.choices[0].message
+    content = (message.content or "").strip()
+    tool_calls = [
+        ToolCall(id=call.id, name=call.function.name, arguments=call.function.arguments or "{}")
+        for call in (message.tool_calls or [])
+    ]
+
+    log_event("llm.response", "✅ LLM 响应:", payload={"content": content}, chars=len(content),
+              tool_calls=[call.name for call in tool_calls])
+    for call in tool_calls:
+        log_event("llm.tool_call", f"🔧 工具调用: {call.name}", payload={"arguments": call.arguments},
+                  tool=call.name, chars=len(call.arguments))
+    _log_usage(getattr(response, "usage", None))
+
+    _record_route(profile, started, ok=bool(content or tool_calls))
+    if not content and not tool_calls:
+        return ToolCallResponse(f"{LLM_ERROR_PREFIX}LLM 返回了空响应。")
+    result = ToolCallResponse(content, tool_calls)
+    if key is not None:
+        llm_cache.get().put(key, _encode_tool_response(result))
+    return result
+
+
+def stream_llm(prompt: str, instructions: str = "你是一个乐于助人的助手。") -> Iterator[str]:
+    """
+    以流式方式 (`stream=True`) 调用 LLM，逐块产出响应文本。
+    调用方可以在拿到所需内容后随时关闭生成器，剩余的流会被立即取消，
+    从而节省等待时间和输出令牌。出错时产出一条以 LLM_ERROR_PREFIX 开头的消息。
+    只有建立流之前的错误会被重试，流开始后中断不会重试：此时在已产出的部分内容之后
+    再单独产出一条以 LLM_ERROR_PREFIX 开头的消息，调用方据此区分中断的响应和完整的响应。
+    命中缓存时一次性产出完整的缓存响应。只有完整接收的流会被写入缓存：被调用方主动提前关闭
+    或出错中断的流只收到了响应的前缀，而缓存与 `call_llm` 共用同一个键，缓存前缀会让之后相同的请求拿到截断的响应。
+    """
+    # 生成器在 yield 之间会把控制权交还调用方，因此不把该 span 设为当前 span，而是显式结束
+    span = tracing.start_span("llm.stream", tracing.LLM)
+    profile = _select_profile(span)
+    started = time.perf_counter()
+    replayed = replay.lookup_stream(prompt, instructions)
+    if replayed is not None:
+        text, partial = replayed
+        replay.record_llm(prompt, instructions, text, partial=partial)
+        span.set(replayed=True)
+        span.end()
+        yield text
+        return
+
+    key = _cache_key(profile, prompt, instructions)
+    cached = _cache_lookup(key, profile)
+    if cached is not None:
+        replay.record_llm(prompt, instructions, cached)
+        span.set(cache_hit=True)
+        span.end()
+        yield cached
+        return
+
+    llm_client = _client_for(profile)
+    if not llm_client:
+        error_msg = "LLM 客户端未初始化。请检查您的配置。"
+        print(f"❌ {error_msg}")
+        span.set(error=error_msg)
+        span.end()
+        yield f"{LLM_ERROR_PREFIX}{error_msg}"
+        return
+
+    _log_call_start(profile, "流式")
+
+    try:
+        stream = _create_with_retries(
+            llm_client, _build_request(profile, prompt, instructions, stream=True), _tpm_tokens(prompt, instructions)
+        )
+    except Exception as e:
+        _record_route(profile, started, ok=False)
+        error = _handle_error(e)
+        span.set(error=error[:200])
+        span.end()
+        yield error
+        return
+
+    collected = []
+    completed = False
+    cancelled = False
+    error = None
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if not collected:
+                    span.set(ttft_ms=round((time.perf_counter() - started) * 1000, 1))
+                collected.append(delta)
+                yield delta
+        completed = True
+    except GeneratorExit:
+        cancelled = True
+        raise
+    except Exception as e:
+        import openai
+        kind = "OpenAI API 错误：" if isinstance(e, openai.APIError) else ""
+        error = f"流式响应中断：{kind}{e}"
+        logging.error(f"❌ {error}")
+        span.set(error=error[:200])
+    finally:
+        # 关闭底层 HTTP 连接；若调用方提前关闭生成器，这里会取消剩余的流
+        stream.close()
+        text = "".join(collected)
+        log_event("llm.response", "✅ LLM 流式响应:" if completed else "✂️ LLM 流式响应 (已提前终止):",
+                  payload={"content": text}, chars=len(text), cancelled=cancelled)
+        # 流式响应不一定带用量信息，按请求和已接收的内容估算令牌数
+        _record_usage(_estimate_request_tokens(prompt, instructions), count_tokens(text), span)
+        # 延迟按接收完 (或被调用方提前关闭) 为止计算
+        _record_route(profile, started, ok=bool(collected) and (completed or cancelled))
+        if completed:
+            _cache_store(key, text.strip())
+        if (completed or cancelled) and collected:
+            # 录制调用方实际收到的内容；提前关闭的流标记为 partial，回放时只交给流式调用
+            replay.record_llm(prompt, instructions, text.strip(), partial=cancelled)
+        span.set(cancelled=cancelled)
+        span.end()
+    if error is not None:
+        yield f"{LLM_ERROR_PREFIX}{error}"
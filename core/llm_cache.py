@@ -0,0 +1,139 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+class LLMCache:
+    """
+    基于 SQLite 的持久化、内容寻址 LLM 响应缓存。
+
+    键为 (model, instructions, prompt, temperature, max_tokens) 的 SHA-256 哈希。
+    支持 TTL 过期、按最近访问时间的 LRU 淘汰、条目数与总字节数上限，
+    并统计命中/未命中等指标。可以安全地在多个线程间共享。
+    """
+    def __init__(self, path: str, ttl_seconds: float = 0, max_entries: int = 0, max_bytes: int = 0):
+        """
+        初始化缓存
+
+        参数:
+            path (str): SQLite 数据库文件路径
+            ttl_seconds (float): 条目的存活时间，0 表示永不过期
+            max_entries (int): 最大条目数，0 表示不限制
+            max_bytes (int): 响应内容的总字节数上限，0 表示不限制
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, instructions: str, prompt: str, temperature: float, max_tokens: int,
+                 tools: Optional[list] = None) -> str:
+        """计算请求的内容哈希键；带工具定义的请求 (函数调用) 与普通请求互不命中"""
+        parts = [model, instructions, prompt, temperature, max_tokens]
+        if tools:
+            parts.append(tools)
+        payload = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """查找缓存响应；未命中或已过期时返回 None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self.evictions += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str):
+        """写入 (或覆盖) 一条缓存响应，并按上限执行淘汰"""
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now),
+            )
+            self.stores += 1
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        """删除过期条目，再按 LRU 顺序删除超出条目数或字节数上限的条目 (调用方需持有锁)"""
+        if self.ttl_seconds:
+            cursor = self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            self.evictions += max(cursor.rowcount, 0)
+
+        if not self.max_entries and not self.max_bytes:
+            return
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        if (not self.max_entries or count <= self.max_entries) and (not self.max_bytes or total <= self.max_bytes):
+            return
+
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access ASC"):
+            if (not self.max_entries or count <= self.max_entries) and (not self.max_bytes or total <= self.max_bytes):
+                break
+            victims.append((key,))
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def stats(self) -> dict:
+        """返回命中率、条目数、占用字节数等指标"""
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": total,
+        }
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
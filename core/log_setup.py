@@ -1,42 +1,265 @@
+import atexit
+import hashlib
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import random
+import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, Optional, Union
+
 from config import AppConfig
+from core import replay
+
+# 日志管道。
+# 根日志器上只挂一个 QueueHandler：调用方线程只创建日志记录并放入有界队列，不做任何 I/O；
+# 后台的 QueueListener 线程负责截断大段内容、写入按大小轮转的文本日志和结构化 JSONL 日志，以及输出到控制台。
+# LLM 响应、工具观察、历史等大段内容作为 payload 附在记录上 (只传引用，不在调用方线程复制或格式化)，
+# 每个字段在写入时截断到 max_field_chars，完整内容按内容哈希只保存一次到 blobs 目录。
+# 逐次循环的完整历史等冗长内容以 VERBOSE 级别记录，并按 verbose_sample_rate 采样，采样之外的内容不会被生成。
+
+VERBOSE = 15
+logging.addLevelName(VERBOSE, "VERBOSE")
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - [%(module)s:%(lineno)d] - %(message)s"
+
+_run_var: ContextVar[Optional[str]] = ContextVar("log_run_id", default=None)
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["_NonBlockingQueueHandler"] = None
+
+
+@contextmanager
+def run_scope(run_id: str) -> Iterator[None]:
+    """标记块内的日志属于哪次运行 (写入 JSONL 日志的 run_id 字段)"""
+    token = _run_var.set(run_id)
+    try:
+        yield
+    finally:
+        _run_var.reset(token)
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    head = max_chars * 2 // 3
+    tail = max_chars - head
+    return f"{text[:head]}\n...[已省略 {len(text) - head - tail} 个字符]...\n{text[-tail:]}"
+
+
+class _ContextFilter(logging.Filter):
+    """在调用方线程中为每条记录补上运行 ID、计划步骤和事件类型 (contextvars 只能在这里读取)"""
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.run_id = _run_var.get()
+        record.step = replay.current_step()
+        if not hasattr(record, "event"):
+            record.event = "log"
+        return True
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃记录并计数，而不是阻塞调用方"""
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 只在调用方线程中合并消息参数和异常堆栈，payload 原样传给后台线程处理
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _PayloadProcessor:
+    """在后台线程中截断记录上的 payload 字段，超长的完整内容按哈希保存到 blobs 目录"""
+    def __init__(self, max_field_chars: int, blob_dir: Optional[str]):
+        self.max_field_chars = max_field_chars
+        self.blob_dir = blob_dir
+
+    def _store_blob(self, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        path = os.path.join(self.blob_dir, digest[:2], f"{digest}.txt")
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        return os.path.relpath(path, os.path.dirname(self.blob_dir))
+
+    def process(self, record: logging.LogRecord):
+        if getattr(record, "processed_payload", None) is not None:
+            return
+        processed = {}
+        for name, value in (getattr(record, "payload", None) or {}).items():
+            text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+            entry = {"chars": len(text), "text": _truncate(text, self.max_field_chars)}
+            if len(text) > self.max_field_chars and self.blob_dir:
+                entry["blob"] = self._store_blob(text)
+            processed[name] = entry
+        record.processed_payload = processed
+
+
+class _TextFormatter(logging.Formatter):
+    """文本日志：消息之后逐行附上截断后的 payload"""
+    def __init__(self, processor: _PayloadProcessor):
+        super().__init__(LOG_FORMAT)
+        self.processor = processor
+
+    def format(self, record: logging.LogRecord) -> str:
+        self.processor.process(record)
+        text = super().format(record)
+        for entry in record.processed_payload.values():
+            text += "\n" + entry["text"]
+            if "blob" in entry:
+                text += f"\n[完整内容 {entry['chars']} 个字符: {entry['blob']}]"
+        return text
+
 
-def setup_logging():
+class _JsonFormatter(logging.Formatter):
+    """结构化日志：每条记录一行 JSON，包含事件类型、运行 ID、步骤、附加字段和 payload 的大小"""
+    def __init__(self, processor: _PayloadProcessor):
+        super().__init__()
+        self.processor = processor
+
+    def format(self, record: logging.LogRecord) -> str:
+        self.processor.process(record)
+        event = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "event": getattr(record, "event", "log"),
+            "run_id": getattr(record, "run_id", None),
+            "step": getattr(record, "step", None),
+            "module": record.module,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        event.update(getattr(record, "fields", None) or {})
+        if record.processed_payload:
+            event["payload"] = record.processed_payload
+        if record.exc_text:
+            event["exc"] = record.exc_text
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+def _level(name: Union[str, int]) -> int:
+    return name if isinstance(name, int) else logging.getLevelName(str(name).upper())
+
+
+def setup_logging(console: bool = True, logs_path: Optional[str] = None):
     """
-    Configures the root logger to output to both console and a timestamped file.
+    配置根日志器：调用方线程只把记录放入队列，由后台线程写入按大小轮转的文本日志、
+    结构化 JSONL 日志 (可选) 和控制台。重复调用时会先停止之前的后台线程。
+
+    参数:
+        console (bool): 是否输出到控制台
+        logs_path (Optional[str]): 日志目录，默认取自配置
     """
+    global _listener, _queue_handler
     if not AppConfig:
         print("Cannot setup logging, config not loaded.")
         return
 
-    # Create a unique log file name with a timestamp
-    log_filename = f"run_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.log"
-    log_filepath = os.path.join(AppConfig.LOGS_PATH, log_filename)
+    shutdown_logging()
+    logs_path = logs_path or AppConfig.LOGS_PATH
+    os.makedirs(logs_path, exist_ok=True)
+    stem = f"run_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}"
+    log_filepath = os.path.join(logs_path, f"{stem}.log")
 
-    # Define the logging format
-    log_format = logging.Formatter('%(asctime)s - %(levelname)s - [%(module)s:%(lineno)d] - %(message)s')
+    processor = _PayloadProcessor(
+        AppConfig.LOG_MAX_FIELD_CHARS,
+        os.path.join(logs_path, "blobs") if AppConfig.LOG_BLOBS else None,
+    )
+    handlers = []
 
-    # Get the root logger
-    root_logger = logging.getLogger()
-    root_logger.setLevel(logging.INFO)
+    # --- 文本日志，按大小轮转 ---
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_filepath, maxBytes=AppConfig.LOG_MAX_BYTES, backupCount=AppConfig.LOG_BACKUP_COUNT, encoding="utf-8")
+    file_handler.setFormatter(_TextFormatter(processor))
+    handlers.append(file_handler)
+
+    # --- 结构化 JSONL 日志，按大小轮转 ---
+    if AppConfig.LOG_JSONL:
+        jsonl_handler = logging.handlers.RotatingFileHandler(
+            os.path.join(logs_path, f"{stem}.jsonl"), maxBytes=AppConfig.LOG_MAX_BYTES,
+            backupCount=AppConfig.LOG_BACKUP_COUNT, encoding="utf-8")
+        jsonl_handler.setFormatter(_JsonFormatter(processor))
+        handlers.append(jsonl_handler)
 
-    # Avoid adding duplicate handlers if this function is called multiple times
-    if root_logger.hasHandlers():
-        root_logger.handlers.clear()
+    # --- 控制台 (不输出采样的 VERBOSE 内容) ---
+    level = _level(AppConfig.LOG_LEVEL)
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(_TextFormatter(processor))
+        console_handler.setLevel(level)
+        handlers.append(console_handler)
 
-    # --- File Handler ---
-    # Writes logs to the file
-    file_handler = logging.FileHandler(log_filepath, encoding='utf-8')
-    file_handler.setFormatter(log_format)
-    root_logger.addHandler(file_handler)
+    _queue_handler = _NonBlockingQueueHandler(queue.Queue(AppConfig.LOG_QUEUE_SIZE))
+    _queue_handler.addFilter(_ContextFilter())
+    root_logger = logging.getLogger()
+    # 启用采样时，采样到的冗长内容写入日志文件
+    root_logger.setLevel(min(level, VERBOSE) if AppConfig.LOG_VERBOSE_SAMPLE_RATE > 0 else level)
+    root_logger.handlers.clear()
+    root_logger.addHandler(_queue_handler)
 
-    # --- Console Handler ---
-    # Writes logs to the console
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(log_format)
-    root_logger.addHandler(console_handler)
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
 
     logging.info("Logging configured successfully. Output will be saved to %s", log_filepath)
 
+
+def shutdown_logging():
+    """停止后台线程并写完队列中剩余的日志 (进程退出时自动调用)"""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+    if _queue_handler and _queue_handler.dropped:
+        print(f"⚠️ 日志队列已满，丢弃了 {_queue_handler.dropped} 条日志。", file=sys.stderr)
+
+
+atexit.register(shutdown_logging)
+
+
+def log_event(event: str, message: str, level: int = logging.INFO, payload: Optional[Dict[str, Any]] = None,
+              **fields):
+    """
+    记录一条结构化事件。
+
+    参数:
+        event (str): 事件类型，例如 "llm.response"、"tool.observation"
+        message (str): 简短的消息 (文本日志和控制台中显示的一行)
+        level (int): 日志级别
+        payload (Optional[Dict[str, Any]]): 大段内容 {字段名: 内容}，写入时截断，调用方不需要预先截断或复制
+        **fields: 附加的结构化字段 (大小、名称等)，写入 JSONL 日志
+    """
+    logger = logging.getLogger()
+    if logger.isEnabledFor(level):
+        logger.log(level, message, extra={"event": event, "payload": payload, "fields": fields}, stacklevel=2)
+
+
+def log_verbose(event: str, message: str, content: Union[str, Callable[[], str]], **fields):
+    """
+    按采样率以 VERBOSE 级别记录冗长内容 (例如每次循环的完整历史)。
+    content 可以是返回内容的函数，未被采样或 VERBOSE 级别未启用时不会调用，不产生任何开销。
+    """
+    logger = logging.getLogger()
+    rate = AppConfig.LOG_VERBOSE_SAMPLE_RATE
+    if rate <= 0 or not logger.isEnabledFor(VERBOSE) or (rate < 1 and random.random() >= rate):
+        return
+    text = content() if callable(content) else content
+    logger.log(VERBOSE, message, extra={"event": event, "payload": {"content": text}, "fields": fields},
+               stacklevel=2)
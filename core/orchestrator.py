@@ -1,10 +1,20 @@
+import contextvars
 import logging
+import queue
+import threading
+from dataclasses import asdict
+from typing import List, Optional, Tuple
+from config import AppConfig
+from agents.plan import PlanStep, load_plan
 from agents.planning_agent import PlanningAgent
 from agents.manus_agent import ManusAgent
-from tools.file_tools import ReadFileTool, WriteFileTool, ListFilesTool
-from tools.shell_tool import ShellTool
-from tools.python_tool import PythonTool
-from tools.finish_tool import FinishTool
+from core import replay, tracing
+from core.log_setup import run_scope
+from core.checkpoint import Checkpointer, new_run_id
+from core.history import History
+from core.llm import is_llm_error
+from core.plan_cache import plan_cache
+from tools.registry import create_tools
 
 class Orchestrator:
     """
@@ -12,98 +22,228 @@ class Orchestrator:
     它接收一个初始任务，协调 PlanningAgent 和 ManusAgent，
     并驱动整个工作流程直至完成。
     """
-    def __init__(self, task: str):
+    # 写入检查点的编排器模式，恢复运行时据此选择编排器
+    mode = "sync"
+
+    def __init__(self, task: str, workspace: Optional[str] = None, record_path: Optional[str] = None,
+                 replay_path: Optional[str] = None, replay_until_step: Optional[int] = None, replay_tools: bool = True,
+                 run_id: Optional[str] = None, tools: Optional[List[str]] = None, pipeline: Optional[bool] = None):
         """
         初始化编排器。
 
         参数:
             task (str): 用户定义的初始任务。
+            workspace (Optional[str]): 本任务的工作区目录，默认使用全局配置的工作区。
+            record_path (Optional[str]): 把本次运行的所有 LLM 响应和工具观察录制到该文件。
+            replay_path (Optional[str]): 回放之前录制的运行，录制的步骤不再请求 LLM 或执行工具。
+            replay_until_step (Optional[int]): 只回放到该步骤 (含)，之后实时执行；默认回放全部录制内容。
+            replay_tools (bool): 是否回放工具观察；为 False 时工具总是实际执行。
+            run_id (Optional[str]): 运行 ID；该 ID 已有检查点时从检查点继续执行，默认生成新的 ID。
+            tools (Optional[List[str]]): 提供给执行智能体的工具子集 (工具越少提示越短)；默认取自配置，为空时提供全部工具。
+            pipeline (Optional[bool]): 是否以流水线模式执行 (计划流式生成，解析出第一个步骤后立即开始执行)；默认取自配置。
         """
         self.task = task
+        self.workspace = workspace
+        self.record_path = record_path
+        self.replay_path = replay_path
+        self.replay_until_step = replay_until_step
+        self.replay_tools = replay_tools
+        self.run_id = run_id or new_run_id()
+        self.checkpoint: Optional[Checkpointer] = None
+        self.finished = False
+        # 本次运行使用的计划来自计划缓存时为其条目 ID；新生成的计划在运行成功后存入缓存
+        self.cached_plan_id: Optional[int] = None
+        self._new_plan: Optional[list] = None
+        # 流水线模式 (计划仍在流式生成时就开始执行) 与录制和回放不兼容：推测执行后被重新执行的步骤会打乱录制内容
+        self.pipeline = (AppConfig.PLANNING_PIPELINE if pipeline is None else pipeline) \
+            and not (record_path or replay_path)
         self.planning_agent = PlanningAgent()
 
-        # 为执行智能体初始化所有可用工具
-        self.tools = [
-            ReadFileTool(),
-            WriteFileTool(),
-            ListFilesTool(),
-            ShellTool(),
-            PythonTool(),
-            FinishTool()
-        ]
-        self.manus_agent = ManusAgent(self.tools)
-
-    def _parse_plan(self, plan_str: str) -> list[str]:
-        """一个简单的解析器，用于将 LLM 的计划字符串转换为步骤列表。"""
-        if not plan_str or "错误:" in plan_str:
-            return []
-
-        steps = []
-        for line in plan_str.split('\n'):
-            line = line.strip()
-            # 这个正则表达式查找以数字后跟点或括号，或以连字符开头的行。
-            # 例如 "1. ", "1) ", "- "
-            if line and (line[0].isdigit() or line.startswith('-')):
-                # 清理前缀以获取实际的步骤描述
-                step_description = ".".join(line.split('.')[1:]).strip()
-                if not step_description: # 处理像 "- 步骤" 这样的情况
-                    step_description = " ".join(line.split(' ')[1:]).strip()
-                if step_description:
-                    steps.append(step_description)
-
-        # 如果解析失败，则将整个字符串视为单步计划
-        return steps if steps else [plan_str]
+        # 为执行智能体初始化可用工具 (工具模块在这里才被导入)
+        self.tools = create_tools(workspace, tools or AppConfig.TOOLS_ENABLED)
+        self.tool_names = [tool.name for tool in self.tools]
+        self.manus_agent = ManusAgent(self.tools, workspace=workspace)
+
+    def close(self):
+        """释放所有工具持有的资源 (例如 Python 内核进程)。"""
+        for tool in self.tools:
+            tool.close()
+
+    def _lookup_cached_plan(self) -> Optional[List[PlanStep]]:
+        """在计划缓存中查找相似任务的成功计划；回放时不使用缓存，保证与录制时的规划一致"""
+        cache = plan_cache.get() if not self.replay_path else None
+        hit = cache.lookup(self.task, self.mode) if cache else None
+        if hit is None:
+            return None
+        self.cached_plan_id = hit.plan_id
+        logging.info(f"📋 命中计划缓存 (相似度 {hit.similarity}，改写 {hit.substitutions} 处)，跳过 LLM 规划。")
+        return load_plan(hit.plan)
+
+    def _update_plan_cache(self, succeeded: bool):
+        """运行结束后晋升或降级复用的计划，或存储新生成的成功计划"""
+        cache = plan_cache.get() if plan_cache.created else None
+        if cache is None:
+            return
+        if self.cached_plan_id is not None:
+            if succeeded:
+                cache.promote(self.cached_plan_id)
+            else:
+                cache.demote(self.cached_plan_id)
+        elif succeeded and self._new_plan:
+            cache.store(self.task, self.mode, self._new_plan)
+
+    def _open_checkpoint(self) -> Optional[Checkpointer]:
+        """打开本次运行的检查点；已有检查点时加载其中的进度"""
+        if not AppConfig.CHECKPOINT_ENABLED:
+            return None
+        checkpoint = Checkpointer(
+            AppConfig.CHECKPOINT_DIR, self.run_id, self.task, self.mode, self.workspace,
+            manifest_root=self.workspace or AppConfig.WORKSPACE_PATH, fsync=AppConfig.CHECKPOINT_FSYNC,
+        )
+        if checkpoint.resumed:
+            logging.info(f"♻️ 从检查点恢复运行 {self.run_id}：已完成 {len(checkpoint.state.done)} 个步骤。")
+        else:
+            logging.info(f"🆔 运行 ID: {self.run_id} (中断后可通过 --resume {self.run_id} 继续)")
+        return checkpoint
 
     def run(self):
         """
         启动并执行整个任务工作流程。
+        整个运行过程会被追踪，结束时输出各阶段的耗时汇总并导出追踪文件。
+        每个步骤和每次 ReAct 循环之后都会写入检查点，中断后可以用相同的 run_id 继续。
         """
+        self.checkpoint = self._open_checkpoint()
+        if self.checkpoint and self.checkpoint.state.completed:
+            logging.info(f"♻️ 运行 {self.run_id} 已经完成，直接返回检查点中的结果。")
+            self.checkpoint.close()
+            self.finished = self.checkpoint.state.finished
+            return self.checkpoint.state.result
+
+        # 嵌套在外层追踪中时 (例如基准测试)，由外层负责汇总和导出
+        owns_trace = tracing.active_tracer() is None
+        try:
+            with run_scope(self.run_id), \
+                    tracing.trace("orchestrator.run", task=self.task[:200], run_id=self.run_id) as tracer, \
+                    replay.session(self.record_path, self.replay_path, self.replay_until_step, self.replay_tools, self.task):
+                result = self._execute()
+            failed = isinstance(result, str) and (is_llm_error(result) or result.startswith("错误："))
+            # 失败的运行不标记为完成，恢复时会从最后一个检查点重试
+            if self.checkpoint and not failed:
+                self.checkpoint.run_done(result, self.finished)
+            # 只有以 finish 结束的运行才算计划成功
+            self._update_plan_cache(self.finished and not failed)
+        finally:
+            if self.checkpoint:
+                self.checkpoint.close()
+        if owns_trace and AppConfig.TRACING_ENABLED:
+            paths = tracing.export_trace(tracer, AppConfig.TRACING_OUTPUT_DIR)
+            logging.info("\n" + "="*50)
+            logging.info("⏱️ 性能汇总:\n" + tracer.summary())
+            logging.info(f"📁 追踪文件: {paths['jsonl']}")
+            logging.info(f"📁 Chrome 追踪文件 (可在 Perfetto 中打开): {paths['chrome']}")
+            logging.info("="*50 + "\n")
+        return result
+
+    def _execute(self):
+        """执行规划和各计划步骤，返回最终结果。"""
         logging.info("="*50)
         logging.info(f"🎬 开始新任务: {self.task}")
         logging.info("="*50 + "\n")
 
         # 1. 规划阶段
         logging.info("\n" + "-"*20 + " 阶段 1: 任务规划 " + "-"*20)
-        plan_str = self.planning_agent.create_plan(self.task)
-        plan = self._parse_plan(plan_str)
+        state = self.checkpoint.state if self.checkpoint else None
+        if state and state.plan:
+            plan = load_plan(state.plan)
+            logging.info("♻️ 使用检查点中的计划，跳过规划。")
+        else:
+            with tracing.span("plan", tracing.PLAN) as plan_span:
+                plan = self._lookup_cached_plan()
+                if plan is not None:
+                    plan_span.set(cache="hit")
+                elif not self.pipeline:
+                    plan = self.planning_agent.create_plan(self.task, tools=self.tool_names)
+                    self._new_plan = [asdict(step) for step in plan]
+                if plan is not None:
+                    plan_span.set(steps=len(plan))
+            if plan is None:
+                return self._execute_pipelined()
+            if plan and self.checkpoint:
+                self.checkpoint.save_plan([asdict(step) for step in plan])
 
         if not plan:
             logging.error("❌ 规划失败。无法生成有效计划。正在终止。")
             return "错误：规划失败。"
-
-        logging.info("✅ 任务规划完成。计划如下:")
-        for i, step in enumerate(plan, 1):
-            logging.info(f"  - 步骤 {i}: {step}")
-        logging.info("-" * 50 + "\n")
+        self._log_plan(plan)
 
         # 2. 执行阶段
         logging.info("\n" + "-"*20 + " 阶段 2: 计划执行 " + "-"*20)
 
-        full_history = ""
-        for i, step_description in enumerate(plan, 1):
-            logging.info(f"\n▶️ 正在执行步骤 {i}/{len(plan)}: {step_description}")
-            logging.info("-" * 40)
+        descriptions = [step.description for step in plan]
+        history = History.from_config()
+        for plan_step in plan:
+            i = plan_step.id
+            if state:
+                # 已完成或执行到一半的步骤，先恢复它们的历史记录
+                history.extend(state.records.get(i, []))
+                if i in state.done:
+                    logging.info(f"⏭️ 步骤 {i} 已在检查点中完成，跳过。")
+                    if state.done[i]["finished"]:
+                        self.finished = True
+                        return state.done[i]["summary"]
+                    continue
+
+            finished, final_summary = self._run_step(plan_step, descriptions, history, self.checkpoint)
+            if self.checkpoint:
+                self.checkpoint.step_done(i, history, finished, final_summary)
+
+            # 如果智能体调用了 FinishTool，则提前结束流程。
+            if finished:
+                return self._finish(final_summary)
+
+        return self._all_steps_done(history)
+
+    @staticmethod
+    def _log_plan(plan: List[PlanStep]):
+        logging.info("✅ 任务规划完成。计划如下:")
+        for step in plan:
+            logging.info(f"  - 步骤 {step.id}: {step.description}"
+                         + (f" (预期产出: {step.expected_output})" if step.expected_output else ""))
+        logging.info("-" * 50 + "\n")
+
+    def _run_step(self, plan_step: PlanStep, descriptions: List[str], history: History,
+                  checkpoint: Optional[Checkpointer]) -> Tuple[bool, str]:
+        """执行计划中的一个步骤，返回 (是否调用了 finish, 最终摘要)"""
+        i, step_description = plan_step.id, plan_step.description
+        logging.info(f"\n▶️ 正在执行步骤 {i}/{len(descriptions)}: {step_description}")
+        logging.info("-" * 40)
 
-            # 调用 ManusAgent 来执行单个步骤。
-            # 它返回该步骤的思考/操作历史记录，以及一个指示任务是否完成的标志。
-            step_history, finished, final_summary = self.manus_agent.run_step(
+        # 调用 ManusAgent 来执行单个步骤。
+        # 该步骤的思考/操作记录会追加到共享的历史中，作为后续步骤的上下文；
+        # 返回值包含一个指示任务是否完成的标志。
+        with tracing.span("step", tracing.STEP, step=i, description=step_description[:200]) as step_span, \
+                replay.step_scope(i):
+            _, finished, final_summary = self.manus_agent.run_step(
                 task=self.task,
-                plan=plan,
+                plan=descriptions,
                 current_step_index=i,
-                previous_steps_history=full_history
+                history=history,
+                checkpoint=checkpoint,
+                plan_step=plan_step,
             )
+            step_span.set(finished=finished)
+        return finished, final_summary
 
-            # 将已完成步骤的历史记录附加到完整历史记录中，以便在下一步骤中作为上下文。
-            full_history += step_history + "\n\n"
-
-            # 如果智能体调用了 FinishTool，则提前结束流程。
-            if finished:
-                logging.info("\n" + "="*50)
-                logging.info(f"✅ 代理已提前完成任务！")
-                logging.info(f"最终总结: {final_summary}")
-                logging.info("="*50 + "\n")
-                return final_summary
+    def _finish(self, final_summary: str) -> str:
+        self.finished = True
+        logging.info("\n" + "="*50)
+        logging.info(f"✅ 代理已提前完成任务！")
+        logging.info(f"最终总结: {final_summary}")
+        logging.info("="*50 + "\n")
+        return final_summary
 
+    @staticmethod
+    def _all_steps_done(history: History) -> str:
         # 如果代理在没有调用 FinishTool 的情况下完成了所有步骤，则会执行到这部分。
         # 这可能表示计划有缺陷，但我们可以将完整的历史记录作为结果返回。
         logging.info("\n" + "="*50)
@@ -111,4 +251,104 @@ class Orchestrator:
         logging.info("未调用 'finish' 工具，这可能表示计划不完整。")
         logging.info("将返回完整的执行历史记录作为结果。")
         logging.info("="*50 + "\n")
-        return full_history
+        return history.render()
+
+    def _plan_in_background(self, updates: "queue.Queue[Tuple[List[PlanStep], bool]]") -> threading.Thread:
+        """在后台线程中以流式方式生成计划，把每次解析出的部分计划和最终计划 (标记为 True) 放入队列"""
+        def plan():
+            steps: List[PlanStep] = []
+            try:
+                with tracing.span("plan", tracing.PLAN, pipelined=True) as plan_span:
+                    steps = self.planning_agent.create_plan(
+                        self.task, tools=self.tool_names, on_step=lambda partial: updates.put((partial, False)))
+                    plan_span.set(steps=len(steps))
+            except Exception as e:
+                logging.error(f"❌ 流式规划失败：{e}")
+            finally:
+                updates.put((steps, True))
+
+        # 复制上下文，规划线程的追踪、日志和路由与编排器所在的运行保持一致
+        thread = threading.Thread(target=contextvars.copy_context().run, args=(plan,), name="planner", daemon=True)
+        thread.start()
+        return thread
+
+    def _reconcile(self, executed: List[Tuple[PlanStep, bool, str]], plan: List[PlanStep], history: History):
+        """
+        把推测执行的步骤与最终计划逐一核对：第一个不一致的步骤及其之后的步骤从 executed 中移除，
+        并丢弃它们的历史记录；一致的步骤在这时才写入检查点。
+        """
+        valid = 0
+        for (step, _, _), final_step in zip(executed, plan):
+            if not _same_step(step, final_step):
+                break
+            valid += 1
+        invalid = [step.id for step, _, _ in executed[valid:]]
+        if invalid:
+            logging.warning(f"↩️ 最终计划与推测执行的步骤 {invalid} 不一致，丢弃其结果并按最终计划重新执行。")
+            history.drop_steps(invalid)
+            del executed[valid:]
+        else:
+            logging.info(f"✅ 最终计划与推测执行的 {valid} 个步骤一致。")
+        if self.checkpoint and plan:
+            self.checkpoint.save_plan([asdict(step) for step in plan])
+            for step, finished, summary in executed:
+                self.checkpoint.step_done(step.id, history, finished, summary)
+
+    def _execute_pipelined(self):
+        """
+        流水线模式：计划以流式方式生成，每解析出一个完整的步骤就放入队列，第 1 步在计划的其余部分
+        仍在生成时就开始执行，规划和执行的耗时因此重叠。
+        计划生成完毕 (经过校验，必要时修正格式) 之后，与已推测执行的步骤逐一核对：与最终计划不一致的步骤
+        及其之后的步骤丢弃历史记录，按最终计划重新执行 (它们对工作区的修改不会撤销，重新执行时会被覆盖)。
+        推测执行的步骤在核对之后才写入检查点；推测执行的步骤调用 finish 时先等待计划完成并核对。
+        """
+        updates: "queue.Queue[Tuple[List[PlanStep], bool]]" = queue.Queue()
+        self._plan_in_background(updates)
+        logging.info("🚰 流水线模式：计划以流式方式生成，解析出第一个步骤后立即开始执行。")
+
+        history = History.from_config()
+        partial: List[PlanStep] = []
+        plan: Optional[List[PlanStep]] = None
+        executed: List[Tuple[PlanStep, bool, str]] = []
+
+        while True:
+            # 取出已到达的计划更新；没有可执行的步骤 (或需要核对 finish) 时阻塞等待
+            while plan is None:
+                waiting = len(executed) >= len(partial) or bool(executed and executed[-1][1])
+                try:
+                    steps, done = updates.get(block=waiting)
+                except queue.Empty:
+                    break
+                if done:
+                    plan = steps
+                    if not plan:
+                        logging.error("❌ 规划失败。无法生成有效计划。正在终止。")
+                        return "错误：规划失败。"
+                    self._new_plan = [asdict(step) for step in plan]
+                    self._log_plan(plan)
+                    self._reconcile(executed, plan, history)
+                else:
+                    partial = steps
+
+            if executed and executed[-1][1]:
+                return self._finish(executed[-1][2])
+            current = plan if plan is not None else partial
+            if len(executed) >= len(current):
+                return self._all_steps_done(history)
+
+            plan_step = current[len(executed)]
+            if plan is None:
+                logging.info(f"🔮 推测执行步骤 {plan_step.id} (计划仍在生成中)。")
+            # 推测执行的步骤不写入检查点，核对后再写入
+            checkpoint = self.checkpoint if plan is not None else None
+            finished, final_summary = self._run_step(plan_step, [s.description for s in current], history, checkpoint)
+            executed.append((plan_step, finished, final_summary))
+            if checkpoint:
+                checkpoint.step_done(plan_step.id, history, finished, final_summary)
+
+
+def _same_step(speculative: PlanStep, final: PlanStep) -> bool:
+    """推测执行的步骤与最终计划中的步骤是否相同 (顺序执行时不比较依赖关系)"""
+    return (speculative.id, speculative.description, speculative.expected_output, speculative.tools,
+            speculative.max_iterations) == (final.id, final.description, final.expected_output, final.tools,
+                                            final.max_iterations)
@@ -0,0 +1,337 @@
+import difflib
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import struct
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import AppConfig
+from core.lazy import Lazy
+
+# 按任务相似度复用计划。
+# 任务文本规范化后切分为字符 3-gram，用 MinHash 签名估计两个任务的 Jaccard 相似度，
+# 并用 LSH 分桶 (16 个桶 × 每桶 4 行) 只比较可能相似的候选，查找开销与已存储的计划数基本无关。
+# 只有最终调用了 finish 的计划才会被存储；复用后成功则晋升，失败则降级，失败次数超过成功次数时删除。
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+_PRIME = (1 << 61) - 1
+
+# 固定种子生成的哈希函数参数，签名在不同进程和不同次运行之间保持一致
+_rng = random.Random(20240601)
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+_TOKEN_RE = re.compile(r"[A-Za-z0-9_]+|\S")
+
+
+def normalize_task(task: str) -> str:
+    """统一全角/半角和大小写，合并空白"""
+    return " ".join(unicodedata.normalize("NFKC", task).lower().split())
+
+
+def _shingles(text: str) -> set:
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash(task: str) -> List[int]:
+    """返回任务文本的 MinHash 签名 (NUM_PERM 个整数)"""
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+              for s in _shingles(normalize_task(task))]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMS]
+
+
+def similarity(sig_a: List[int], sig_b: List[int]) -> float:
+    """两个签名中相同位置取值相等的比例，即 Jaccard 相似度的估计值"""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def _band_keys(sig: List[int]) -> List[str]:
+    return [hashlib.blake2b(struct.pack(f"<{ROWS}Q", *sig[i * ROWS:(i + 1) * ROWS]), digest_size=8).hexdigest()
+            for i in range(BANDS)]
+
+
+def _token_spans(text: str) -> List[Tuple[str, int, int]]:
+    return [(m.group(0), m.start(), m.end()) for m in _TOKEN_RE.finditer(text)]
+
+
+def adapt_plan(source_task: str, task: str, plan: List[Any]) -> Tuple[List[Any], int]:
+    """
+    把为 source_task 生成的计划轻度改写为 task 的计划：
+    对两个任务做词级差异比较，把计划中出现的被替换片段 (例如文件名、数量、语言) 换成新任务中的对应片段。
+
+    参数:
+        source_task (str): 计划原本对应的任务
+        task (str): 当前任务
+        plan (List[Any]): 步骤描述列表，或步骤字典列表 (改写其中的 "description" 和 "expected_output")
+
+    返回:
+        Tuple[List[Any], int]: (改写后的计划, 替换的次数)
+    """
+    old_tokens, new_tokens = _token_spans(source_task), _token_spans(task)
+    matcher = difflib.SequenceMatcher(None, [t[0] for t in old_tokens], [t[0] for t in new_tokens], autojunk=False)
+    replacements: Dict[str, str] = {}
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op == "replace":
+            old = source_task[old_tokens[i1][1]:old_tokens[i2 - 1][2]]
+            replacements.setdefault(old, task[new_tokens[j1][1]:new_tokens[j2 - 1][2]])
+    if not replacements:
+        return plan, 0
+
+    # 所有片段一次性替换，避免替换后的文本再被其他片段替换；片段两端是字母数字时要求完整匹配
+    def bounded(old: str) -> str:
+        pattern = re.escape(old)
+        if re.match(r"\w", old, re.ASCII):
+            pattern = r"(?<![A-Za-z0-9_])" + pattern
+        if re.search(r"\w$", old, re.ASCII):
+            pattern += r"(?![A-Za-z0-9_])"
+        return pattern
+    regex = re.compile("|".join(bounded(old) for old in sorted(replacements, key=len, reverse=True)))
+    count = 0
+
+    def substitute(text: str) -> str:
+        nonlocal count
+        text, n = regex.subn(lambda m: replacements[m.group(0)], text)
+        count += n
+        return text
+
+    adapted = [
+        {**step, **{k: substitute(step[k]) for k in ("description", "expected_output") if isinstance(step.get(k), str)}}
+        if isinstance(step, dict) else substitute(step)
+        for step in plan
+    ]
+    return adapted, count
+
+
+@dataclass
+class CachedPlan:
+    """
+    计划缓存的一次命中。
+
+    属性:
+        plan_id (int): 条目 ID，运行结束后据此晋升或降级
+        task (str): 计划原本对应的任务
+        plan (List[Any]): 已按当前任务改写的计划
+        similarity (float): 与当前任务的估计相似度
+        substitutions (int): 改写时替换的次数
+    """
+    plan_id: int
+    task: str
+    plan: List[Any]
+    similarity: float
+    substitutions: int = 0
+
+
+class PlanCache:
+    """
+    基于 SQLite 的计划缓存，按任务相似度查找之前成功执行过的计划。
+    按编排器模式分别存储 (线性计划与依赖图计划互不复用)，可以安全地在多个线程间共享。
+    """
+    def __init__(self, path: str, threshold: float = 0.85, max_entries: int = 0, adapt: bool = True):
+        """
+        初始化计划缓存
+
+        参数:
+            path (str): SQLite 数据库文件路径
+            threshold (float): 复用计划所需的最低相似度 (0~1)
+            max_entries (int): 最大条目数，超出后按最近使用时间淘汰，0 表示不限制
+            adapt (bool): 复用时是否按任务差异改写计划
+        """
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.adapt = adapt
+        self.hits = 0
+        self.misses = 0
+        self.promotions = 0
+        self.demotions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS plans (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                mode TEXT NOT NULL,
+                task TEXT NOT NULL,
+                task_hash TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                plan TEXT NOT NULL,
+                successes INTEGER NOT NULL DEFAULT 0,
+                failures INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_plans_task ON plans(mode, task_hash);
+            CREATE TABLE IF NOT EXISTS plan_bands (
+                band INTEGER NOT NULL,
+                bucket TEXT NOT NULL,
+                plan_id INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_plan_bands ON plan_bands(band, bucket);
+            CREATE INDEX IF NOT EXISTS idx_plan_bands_plan ON plan_bands(plan_id);
+            """
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _task_hash(task: str) -> str:
+        return hashlib.sha256(normalize_task(task).encode("utf-8")).hexdigest()
+
+    def lookup(self, task: str, mode: str) -> Optional[CachedPlan]:
+        """
+        查找与任务足够相似的已成功计划
+
+        参数:
+            task (str): 当前任务
+            mode (str): 编排器模式，"sync" 或 "async"
+
+        返回:
+            Optional[CachedPlan]: 相似度最高 (相同时取成功次数最多) 的计划；没有足够相似的计划时返回 None
+        """
+        sig = minhash(task)
+        with self._lock:
+            ids = set()
+            for band, bucket in enumerate(_band_keys(sig)):
+                ids.update(row[0] for row in self._conn.execute(
+                    "SELECT plan_id FROM plan_bands WHERE band = ? AND bucket = ?", (band, bucket)))
+            best = None
+            if ids:
+                marks = ",".join("?" * len(ids))
+                rows = self._conn.execute(
+                    f"SELECT id, task, signature, plan, successes, failures FROM plans "
+                    f"WHERE mode = ? AND successes > failures AND id IN ({marks})", (mode, *ids)).fetchall()
+                for plan_id, source, blob, plan, successes, failures in rows:
+                    score = (similarity(sig, list(struct.unpack(f"<{NUM_PERM}Q", blob))), successes - failures)
+                    if score[0] >= self.threshold and (best is None or score > best[0]):
+                        best = (score, plan_id, source, plan)
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            (score, _), plan_id, source, plan = best
+            self._conn.execute("UPDATE plans SET last_used = ? WHERE id = ?", (time.time(), plan_id))
+            self._conn.commit()
+
+        plan = json.loads(plan)
+        substitutions = 0
+        if self.adapt and normalize_task(source) != normalize_task(task):
+            plan, substitutions = adapt_plan(source, task, plan)
+        return CachedPlan(plan_id, source, plan, round(score, 3), substitutions)
+
+    def promote(self, plan_id: int):
+        """复用的计划执行成功"""
+        with self._lock:
+            self._conn.execute("UPDATE plans SET successes = successes + 1, last_used = ? WHERE id = ?",
+                               (time.time(), plan_id))
+            self._conn.commit()
+            self.promotions += 1
+
+    def demote(self, plan_id: int):
+        """复用的计划执行失败；失败次数超过成功次数时删除该计划"""
+        with self._lock:
+            self._conn.execute("UPDATE plans SET failures = failures + 1 WHERE id = ?", (plan_id,))
+            removed = self._conn.execute("SELECT id FROM plans WHERE id = ? AND failures > successes",
+                                         (plan_id,)).fetchone()
+            if removed:
+                self._delete([plan_id])
+                logging.info(f"🗑️ 计划缓存条目 {plan_id} 失败次数过多，已删除。")
+            self._conn.commit()
+            self.demotions += 1
+
+    def store(self, task: str, mode: str, plan: List[Any]):
+        """
+        存储一个执行成功的新计划；同一任务 (规范化后相同) 已有计划时替换它并累计成功次数
+
+        参数:
+            task (str): 任务
+            mode (str): 编排器模式
+            plan (List[Any]): 可序列化为 JSON 的计划
+        """
+        sig = minhash(task)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM plans WHERE mode = ? AND task_hash = ?",
+                                     (mode, self._task_hash(task))).fetchone()
+            if row:
+                self._conn.execute(
+                    "UPDATE plans SET plan = ?, successes = successes + 1, last_used = ? WHERE id = ?",
+                    (json.dumps(plan, ensure_ascii=False), now, row[0]))
+            else:
+                cursor = self._conn.execute(
+                    "INSERT INTO plans (mode, task, task_hash, signature, plan, successes, created_at, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, 1, ?, ?)",
+                    (mode, task, self._task_hash(task), struct.pack(f"<{NUM_PERM}Q", *sig),
+                     json.dumps(plan, ensure_ascii=False), now, now))
+                self._conn.executemany("INSERT INTO plan_bands (band, bucket, plan_id) VALUES (?, ?, ?)",
+                                       [(band, bucket, cursor.lastrowid) for band, bucket in enumerate(_band_keys(sig))])
+                self._evict()
+            self._conn.commit()
+
+    def _delete(self, ids: List[int]):
+        self._conn.executemany("DELETE FROM plans WHERE id = ?", [(i,) for i in ids])
+        self._conn.executemany("DELETE FROM plan_bands WHERE plan_id = ?", [(i,) for i in ids])
+
+    def _evict(self):
+        """按最近使用时间删除超出条目数上限的计划 (调用方需持有锁)"""
+        if not self.max_entries:
+            return
+        count = self._conn.execute("SELECT COUNT(*) FROM plans").fetchone()[0]
+        if count > self.max_entries:
+            victims = self._conn.execute("SELECT id FROM plans ORDER BY last_used ASC LIMIT ?",
+                                         (count - self.max_entries,)).fetchall()
+            self._delete([row[0] for row in victims])
+
+    def stats(self) -> dict:
+        """返回命中率、晋升/降级次数和条目数"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM plans").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "promotions": self.promotions,
+            "demotions": self.demotions,
+            "entries": entries,
+        }
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM plans")
+            self._conn.execute("DELETE FROM plan_bands")
+            self._conn.commit()
+
+
+def get_plan_cache() -> Optional[PlanCache]:
+    """根据全局配置初始化计划缓存；未启用时返回 None。"""
+    if not AppConfig or not AppConfig.PLAN_CACHE_ENABLED:
+        return None
+    try:
+        return PlanCache(
+            AppConfig.PLAN_CACHE_PATH,
+            threshold=AppConfig.PLAN_CACHE_SIMILARITY_THRESHOLD,
+            max_entries=AppConfig.PLAN_CACHE_MAX_ENTRIES,
+            adapt=AppConfig.PLAN_CACHE_ADAPT,
+        )
+    except sqlite3.Error as e:
+        logging.error(f"❌ 初始化计划缓存失败：{e}")
+        return None
+
+
+# 进程内共享，第一次规划时创建
+plan_cache = Lazy(get_plan_cache)
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import time
+
+class TokenBucket:
+    """
+    线程安全的令牌桶。
+    以 `rate_per_minute / 60` 的速度匀速补充，容量为每分钟的配额。
+    余额可以被扣成负数 (例如按实际用量补扣)，之后的请求会等待补足。
+    """
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """返回余额足够支付 `amount` 所需等待的秒数，0 表示现在就足够 (调用方需持有外部锁)"""
+        self._refill(time.monotonic())
+        # 单次请求超过桶容量时，只要求桶是满的，避免永远无法满足
+        needed = min(amount, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def debit(self, amount: float):
+        """无条件扣除额度 (调用方需持有外部锁)"""
+        self._refill(time.monotonic())
+        self.tokens -= amount
+
+
+class RateLimiter:
+    """
+    请求数/分钟 (RPM) 与令牌数/分钟 (TPM) 双令牌桶限流器。
+    同一个实例在进程内的所有智能体 (线程或协程) 之间共享，
+    保证整体吞吐不超过服务商的速率限制。
+    """
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        """
+        参数:
+            requests_per_minute (float): 每分钟请求数上限，0 表示不限制
+            tokens_per_minute (float): 每分钟令牌数上限，0 表示不限制
+        """
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, tokens: int) -> float:
+        """尝试同时从两个桶中扣除额度，返回需要等待的秒数 (0 表示已获得许可)"""
+        with self._lock:
+            wait = 0.0
+            if self._requests:
+                wait = max(wait, self._requests.wait_time(1))
+            if self._tokens:
+                wait = max(wait, self._tokens.wait_time(tokens))
+            if wait > 0:
+                return wait
+            if self._requests:
+                self._requests.debit(1)
+            if self._tokens:
+                self._tokens.debit(tokens)
+            return 0.0
+
+    def acquire(self, tokens: int = 0):
+        """阻塞直到获得一次请求许可 (同步调用方使用)"""
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int = 0):
+        """等待直到获得一次请求许可 (异步调用方使用，不阻塞事件循环)"""
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def record(self, tokens: int):
+        """按实际用量补扣令牌额度 (例如响应返回后的补全令牌数)"""
+        if self._tokens and tokens:
+            with self._lock:
+                self._tokens.debit(tokens)
@@ -0,0 +1,235 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Deque, Dict, Iterator, Optional, Tuple
+
+from tools.base_tool import ToolResult
+
+# 一次运行的录制与回放。
+# 录制文件为 JSONL (以 .gz 结尾时用 gzip 压缩)，按发生顺序记录每次 LLM 调用的响应和每次工具调用的观察，
+# 并标注所属的计划步骤 (规划阶段为 0)。LLM 请求只保存内容哈希，不保存完整提示。
+# 回放时按步骤取出录制的内容直接返回，不发网络请求、不执行工具；超过指定步骤或录制内容用完后转为实时执行。
+
+_session_var: ContextVar[Optional["ReplaySession"]] = ContextVar("replay_session", default=None)
+_step_var: ContextVar[int] = ContextVar("replay_step", default=0)
+
+
+def _request_hash(prompt: str, instructions: str, tools: Optional[list] = None) -> str:
+    payload = json.dumps([instructions, prompt, tools], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _tool_key(name: str, args: dict) -> str:
+    return json.dumps([name, args], ensure_ascii=False, sort_keys=True, default=str)
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class ReplaySession:
+    """
+    一次运行的录制器和/或回放器，可以安全地在多个线程间共享。
+
+    LLM 响应按步骤排成队列，按调用顺序依次取出；工具观察按 (步骤, 工具名, 参数) 排队，
+    因此并发执行的步骤和并发执行的只读工具都能取到各自对应的记录。
+    """
+    def __init__(self, record_path: Optional[str] = None, replay_path: Optional[str] = None,
+                 until_step: Optional[int] = None, replay_tools: bool = True, task: Optional[str] = None):
+        """
+        参数:
+            record_path (Optional[str]): 录制文件路径；为 None 时不录制
+            replay_path (Optional[str]): 要回放的录制文件路径；为 None 时不回放
+            until_step (Optional[int]): 只回放到该步骤 (含)，之后实时执行；None 表示回放全部录制内容
+            replay_tools (bool): 是否回放工具观察；为 False 时工具总是实际执行 (工作区需要重新生成时使用)
+            task (Optional[str]): 本次运行的任务，写入录制文件并在回放时与录制时的任务比对
+        """
+        self.until_step = until_step
+        self.replay_tools = replay_tools
+        self.replayed_llm = 0
+        self.replayed_tools = 0
+        self._llm: Dict[int, Deque[dict]] = {}
+        self._tools: Dict[Tuple[int, str], Deque[ToolResult]] = {}
+        self._lock = threading.Lock()
+        self._file = None
+
+        if replay_path:
+            self._load(replay_path, task)
+        if record_path:
+            os.makedirs(os.path.dirname(os.path.abspath(record_path)), exist_ok=True)
+            self._file = _open(record_path, "w")
+            self._write({"type": "meta", "task": task, "created_at": datetime.now().isoformat(timespec="seconds"),
+                         "replayed_from": replay_path})
+
+    def _load(self, path: str, task: Optional[str]):
+        llm_count = tool_count = 0
+        with _open(path, "r") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 录制中断时写了一半的末行
+                kind = event.get("type")
+                if kind == "meta":
+                    if task is not None and event.get("task") not in (None, task):
+                        logging.warning("⚠️ 录制文件中的任务与当前任务不同，回放的内容可能不匹配。")
+                elif kind == "llm":
+                    self._llm.setdefault(event["step"], deque()).append(event)
+                    llm_count += 1
+                elif kind == "tool":
+                    result = ToolResult(event["observation"], event.get("status", ToolResult.SUCCESS),
+                                        event.get("step_complete", False))
+                    self._tools.setdefault((event["step"], event["key"]), deque()).append(result)
+                    tool_count += 1
+        logging.info(f"⏪ 已加载录制文件 {path}：{llm_count} 次 LLM 调用，{tool_count} 次工具调用。")
+
+    def _write(self, event: dict):
+        if self._file is None:
+            return
+        with self._lock:
+            self._file.write(json.dumps(event, ensure_ascii=False) + "\n")
+            self._file.flush()  # 运行中途失败时，已发生的调用也不会丢失
+
+    def _replaying(self, step: int) -> bool:
+        return self.until_step is None or step <= self.until_step
+
+    def _next_llm(self, prompt: str, instructions: str, tools: Optional[list], stream: bool) -> Optional[dict]:
+        step = _step_var.get()
+        if not self._replaying(step):
+            return None
+        with self._lock:
+            queue = self._llm.get(step)
+            if not queue:
+                return None
+            event = queue.popleft()
+            if event.get("partial") and not stream:
+                # 被提前关闭的流只录制了响应的前缀，不能交给需要完整响应的调用；
+                # 仍然取出该记录以保持之后的调用与录制顺序对齐，这一次调用实时执行
+                logging.warning(f"⚠️ 步骤 {step} 录制的是提前终止的流式响应，本次非流式调用实时执行。")
+                return None
+            self.replayed_llm += 1
+        if event.get("hash") != _request_hash(prompt, instructions, tools):
+            logging.warning(f"⚠️ 步骤 {step} 的 LLM 请求与录制时不同，仍按录制顺序回放。")
+        logging.info(f"⏪ 回放步骤 {step} 的 LLM 响应。")
+        return event
+
+    def lookup_llm(self, prompt: str, instructions: str, tools: Optional[list] = None) -> Optional[str]:
+        event = self._next_llm(prompt, instructions, tools, stream=False)
+        return event["response"] if event else None
+
+    def lookup_stream(self, prompt: str, instructions: str) -> Optional[Tuple[str, bool]]:
+        event = self._next_llm(prompt, instructions, None, stream=True)
+        return (event["response"], bool(event.get("partial"))) if event else None
+
+    def record_llm(self, prompt: str, instructions: str, response: str, tools: Optional[list] = None,
+                   partial: bool = False):
+        event = {"type": "llm", "step": _step_var.get(), "hash": _request_hash(prompt, instructions, tools),
+                 "response": response}
+        if partial:
+            event["partial"] = True
+        self._write(event)
+
+    def lookup_tool(self, name: str, args: dict) -> Optional[ToolResult]:
+        step = _step_var.get()
+        if not self.replay_tools or not self._replaying(step):
+            return None
+        with self._lock:
+            queue = self._tools.get((step, _tool_key(name, args)))
+            if not queue:
+                return None
+            self.replayed_tools += 1
+            return queue.popleft()
+
+    def record_tool(self, name: str, args: dict, result: ToolResult):
+        event = {"type": "tool", "step": _step_var.get(), "key": _tool_key(name, args),
+                 "observation": result.output, "status": result.status}
+        if result.step_complete:
+            event["step_complete"] = True
+        self._write(event)
+
+    def close(self):
+        if self._file is not None:
+            with self._lock:
+                self._file.close()
+                self._file = None
+
+
+@contextmanager
+def session(record_path: Optional[str] = None, replay_path: Optional[str] = None, until_step: Optional[int] = None,
+            replay_tools: bool = True, task: Optional[str] = None) -> Iterator[Optional[ReplaySession]]:
+    """在 with 块内启用录制和/或回放；两个路径都为 None 时不做任何事"""
+    if not record_path and not replay_path:
+        yield None
+        return
+    s = ReplaySession(record_path, replay_path, until_step, replay_tools, task)
+    token = _session_var.set(s)
+    try:
+        yield s
+    finally:
+        _session_var.reset(token)
+        s.close()
+        if replay_path:
+            logging.info(f"⏪ 回放统计：LLM 调用 {s.replayed_llm} 次，工具调用 {s.replayed_tools} 次。")
+        if record_path:
+            logging.info(f"📼 本次运行已录制到 {record_path}")
+
+
+@contextmanager
+def step_scope(step: int) -> Iterator[None]:
+    """标记块内的 LLM 调用和工具调用属于哪个计划步骤"""
+    token = _step_var.set(step)
+    try:
+        yield
+    finally:
+        _step_var.reset(token)
+
+
+def current_step() -> int:
+    """当前所在的计划步骤 (规划阶段为 0)"""
+    return _step_var.get()
+
+
+def lookup_llm(prompt: str, instructions: str, tools: Optional[list] = None) -> Optional[str]:
+    """
+    回放当前步骤的下一个录制的 LLM 响应；没有活动的回放或已转为实时执行时返回 None。
+    下一个记录是提前终止的流式响应 (只有前缀) 时跳过该记录并返回 None，本次调用实时执行。
+    """
+    s = _session_var.get()
+    return s.lookup_llm(prompt, instructions, tools) if s else None
+
+
+def lookup_stream(prompt: str, instructions: str) -> Optional[Tuple[str, bool]]:
+    """
+    为流式调用回放下一个录制的 LLM 响应，返回 (响应, 是否为提前终止的流只录制了前缀)；
+    与 lookup_llm 不同，录制的前缀同样会被回放 (调用方当时需要的内容已包含其中)
+    """
+    s = _session_var.get()
+    return s.lookup_stream(prompt, instructions) if s else None
+
+
+def record_llm(prompt: str, instructions: str, response: str, tools: Optional[list] = None, partial: bool = False):
+    """录制一次 LLM 响应；partial 表示这是被调用方提前关闭的流，只包含响应的前缀"""
+    s = _session_var.get()
+    if s:
+        s.record_llm(prompt, instructions, response, tools, partial)
+
+
+def lookup_tool(name: str, args: dict) -> Optional[ToolResult]:
+    """回放当前步骤中相同工具和参数的下一个录制的观察"""
+    s = _session_var.get()
+    return s.lookup_tool(name, args) if s else None
+
+
+def record_tool(name: str, args: dict, result: ToolResult):
+    s = _session_var.get()
+    if s:
+        s.record_tool(name, args, result)
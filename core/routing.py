@@ -0,0 +1,240 @@
+import logging
+import os
+import statistics
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, replace
+from typing import Dict, Iterator, List, Optional
+
+# 按调用方角色和步骤难度在多个模型档位之间路由。
+# 每个角色 (规划、执行、摘要) 配置一个由弱到强的档位序列：调用从序列中第一个健康的档位开始，
+# 调用方可以请求更高的升级级别 (例如连续收到无效响应或步骤失败后)，选中的档位向后顺延。
+# 每个档位近期调用的延迟和成功率 (调用出错或响应无法使用都算失败) 按滑动窗口统计：
+# 成功率过低或延迟中位数超出上限的档位在选择起始档位时被跳过，直到统计窗口中的新结果使其恢复。
+
+PLANNER = "planner"
+EXECUTOR = "executor"
+SUMMARY = "summary"
+ROLES = (PLANNER, EXECUTOR, SUMMARY)
+
+# 由 [llm] 配置构成的档位，未配置路由时所有调用都使用它
+DEFAULT_PROFILE = "default"
+
+
+@dataclass(frozen=True)
+class ModelProfile:
+    """
+    一个模型档位。
+
+    属性:
+        name (str): 档位名称 ([models.<name>])
+        model (str): 模型名称
+        base_url (str): API 端点，未配置时与 [llm] 相同
+        api_key (Optional[str]): API 密钥，未配置时与 [llm] 相同
+        max_tokens (int): 响应中的最大令牌数
+        temperature (float): 采样温度
+        max_latency_seconds (float): 近期调用延迟中位数的上限，超出时不作为起始档位；0 表示不限制
+    """
+    name: str
+    model: str
+    base_url: str
+    api_key: Optional[str]
+    max_tokens: int
+    temperature: float
+    max_latency_seconds: float = 0.0
+
+
+class Route:
+    """
+    一次调用的路由请求：调用方角色和升级级别。
+    选中的档位名称和本次调用的统计条目由 LLM 调用函数回填，调用方据此报告响应是否可用。
+    """
+    def __init__(self, role: str, level: int = 0):
+        self.role = role
+        self.level = level
+        self.profile: Optional[str] = None
+        self.entry: Optional[list] = None
+
+
+_route_var: ContextVar[Optional[Route]] = ContextVar("llm_route", default=None)
+
+
+@contextmanager
+def route(role: str, level: int = 0) -> Iterator[Route]:
+    """
+    块内的 LLM 调用按给定角色和升级级别选择模型档位。
+    路由请求通过 contextvars 传递，`asyncio.to_thread` 启动的工作线程同样生效。
+
+    参数:
+        role (str): 调用方角色，PLANNER、EXECUTOR 或 SUMMARY
+        level (int): 升级级别，0 表示从角色的起始档位开始
+    """
+    current = Route(role, level)
+    token = _route_var.set(current)
+    try:
+        yield current
+    finally:
+        _route_var.reset(token)
+
+
+def current_route() -> Optional[Route]:
+    """返回当前的路由请求；不在任何 route() 块中时返回 None (使用默认档位)"""
+    return _route_var.get()
+
+
+class ProfileStats:
+    """一个档位的调用统计：累计次数和最近 window 次调用的 [延迟秒数, 是否成功]"""
+    def __init__(self, window: int):
+        self.calls = 0
+        self.failures = 0
+        self.recent = deque(maxlen=max(window, 1))
+
+    def add(self, latency: float, ok: bool) -> list:
+        entry = [latency, ok]
+        self.recent.append(entry)
+        self.calls += 1
+        self.failures += not ok
+        return entry
+
+    def fail(self, entry: list):
+        if entry[1]:
+            entry[1] = False
+            self.failures += 1
+
+    def success_rate(self) -> Optional[float]:
+        if not self.recent:
+            return None
+        return sum(1 for _, ok in self.recent if ok) / len(self.recent)
+
+    def median_latency(self) -> Optional[float]:
+        if not self.recent:
+            return None
+        return statistics.median(latency for latency, _ in self.recent)
+
+
+class ModelRouter:
+    """
+    按角色和升级级别选择模型档位，并根据各档位的统计调整起始档位。
+    同一个实例在进程内的所有智能体 (线程或协程) 之间共享。
+    """
+    def __init__(self, profiles: Dict[str, ModelProfile], roles: Dict[str, List[str]], window: int = 50,
+                 min_success_rate: float = 0.5, min_samples: int = 5):
+        """
+        参数:
+            profiles (Dict[str, ModelProfile]): 所有档位 {名称: 档位}，必须包含 DEFAULT_PROFILE
+            roles (Dict[str, List[str]]): 每个角色由弱到强的档位名称序列，未配置的角色使用默认档位
+            window (int): 统计延迟和成功率的最近调用次数
+            min_success_rate (float): 起始档位所需的最低近期成功率
+            min_samples (int): 统计结果参与路由所需的最少调用次数
+        """
+        self.profiles = profiles
+        self.roles = {}
+        for role, names in roles.items():
+            unknown = [n for n in names if n not in profiles]
+            if unknown:
+                logging.error(f"❌ 角色 '{role}' 引用了未定义的模型档位: {', '.join(unknown)}，已忽略。")
+            self.roles[role] = [n for n in names if n in profiles] or [DEFAULT_PROFILE]
+        self.min_success_rate = min_success_rate
+        self.min_samples = min_samples
+        self._stats = {name: ProfileStats(window) for name in profiles}
+        self._lock = threading.Lock()
+
+    def chain(self, role: Optional[str]) -> List[ModelProfile]:
+        """返回角色由弱到强的档位序列"""
+        return [self.profiles[n] for n in self.roles.get(role, [DEFAULT_PROFILE])]
+
+    def levels(self, role: str) -> int:
+        """角色可用的档位数，升级级别的上限为 levels - 1"""
+        return len(self.chain(role))
+
+    def _healthy(self, profile: ModelProfile) -> bool:
+        stats = self._stats[profile.name]
+        if len(stats.recent) < self.min_samples:
+            return True
+        if stats.success_rate() < self.min_success_rate:
+            return False
+        return not profile.max_latency_seconds or stats.median_latency() <= profile.max_latency_seconds
+
+    def select(self, request: Optional[Route]) -> ModelProfile:
+        """
+        选择本次调用的档位：从角色序列中第一个健康的档位开始 (都不健康时从最强的档位开始)，
+        再按升级级别向后顺延，不超过最强的档位。
+        """
+        if request is None:
+            return self.profiles[DEFAULT_PROFILE]
+        chain = self.chain(request.role)
+        with self._lock:
+            start = next((i for i, p in enumerate(chain) if self._healthy(p)), len(chain) - 1)
+        return chain[min(start + max(request.level, 0), len(chain) - 1)]
+
+    def record(self, profile: ModelProfile, latency: float, ok: bool) -> list:
+        """记录一次实际发出的调用 (命中缓存和回放的响应不计入)，返回其统计条目"""
+        with self._lock:
+            return self._stats[profile.name].add(latency, ok)
+
+    def report_invalid(self, request: Route):
+        """调用方报告响应无法使用 (例如无法解析出行动)，把该次调用计为失败"""
+        if request.entry is None or request.profile is None:
+            return
+        with self._lock:
+            self._stats[request.profile].fail(request.entry)
+
+    def stats(self) -> Dict[str, dict]:
+        """返回有调用记录的档位的统计：调用次数、失败次数、近期成功率和延迟中位数"""
+        with self._lock:
+            result = {}
+            for name, stats in self._stats.items():
+                if not stats.calls:
+                    continue
+                rate, latency = stats.success_rate(), stats.median_latency()
+                result[name] = {
+                    "model": self.profiles[name].model,
+                    "calls": stats.calls,
+                    "failures": stats.failures,
+                    "recent_success_rate": round(rate, 3),
+                    "median_latency_s": round(latency, 3),
+                }
+            return result
+
+
+def load_profiles(config) -> Dict[str, ModelProfile]:
+    """
+    由 [llm] 和 [models.<name>] 配置构建所有档位。档位中未设置的字段取自 [llm]；
+    API 密钥也可以通过环境变量 LLM_API_KEY_<档位名称大写> 提供。
+    """
+    default = ModelProfile(
+        name=DEFAULT_PROFILE,
+        model=config.LLM_MODEL,
+        base_url=config.LLM_BASE_URL,
+        api_key=config.LLM_API_KEY,
+        max_tokens=config.LLM_MAX_TOKENS,
+        temperature=config.LLM_TEMPERATURE,
+    )
+    profiles = {DEFAULT_PROFILE: default}
+    settable = ("model", "base_url", "api_key", "max_tokens", "temperature", "max_latency_seconds")
+    for name, section in config.LLM_PROFILES.items():
+        overrides = {key: section[key] for key in settable if key in section}
+        env_key = os.getenv(f"LLM_API_KEY_{name.upper()}")
+        if env_key:
+            overrides["api_key"] = env_key
+        profiles[name] = replace(default, name=name, **overrides)
+    return profiles
+
+
+def create_router(config) -> ModelRouter:
+    """根据全局配置创建路由器"""
+    roles = {
+        PLANNER: config.ROUTING_PLANNER,
+        EXECUTOR: config.ROUTING_EXECUTOR,
+        SUMMARY: config.ROUTING_SUMMARY,
+    }
+    roles = {role: [names] if isinstance(names, str) else list(names) for role, names in roles.items()}
+    return ModelRouter(
+        load_profiles(config),
+        roles,
+        window=config.ROUTING_STATS_WINDOW,
+        min_success_rate=config.ROUTING_MIN_SUCCESS_RATE,
+        min_samples=config.ROUTING_MIN_SAMPLES,
+    )
@@ -0,0 +1,45 @@
+import logging
+import re
+
+# 中日韩字符通常各占约 1 个令牌，其余文本约 4 个字符 1 个令牌
+_CJK_PATTERN = re.compile(r"[　-〿㐀-䶿一-鿿＀-￯]")
+
+_ENCODING_NAME = "cl100k_base"
+_encoding = None
+_encoding_failed = False
+
+def _get_encoding():
+    """惰性加载本地分词器；加载失败 (未安装或缺少词表文件) 时返回 None"""
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        try:
+            # 导入 tiktoken 和加载词表都较慢，推迟到第一次计数时进行
+            import tiktoken
+        except ImportError:  # tiktoken 是可选依赖，缺失时使用启发式估算
+            _encoding_failed = True
+            return None
+        try:
+            _encoding = tiktoken.get_encoding(_ENCODING_NAME)
+        except Exception as e:
+            logging.warning(f"⚠️ 加载分词器 {_ENCODING_NAME} 失败，改用估算令牌数：{e}")
+            _encoding_failed = True
+    return _encoding
+
+def estimate_tokens(text: str) -> int:
+    """不依赖分词器的令牌数近似值"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def count_tokens(text: str) -> int:
+    """
+    计算文本的令牌数。
+    安装了 tiktoken 时使用本地分词器精确计数，否则退回到估算值。
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
@@ -0,0 +1,261 @@
+import json
+import logging
+import os
+import threading
+import time
+import unicodedata
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+# 一次任务运行的追踪：span 按“运行 → 规划/步骤 → ReAct 循环 → LLM 调用/工具调用”嵌套。
+# 当前追踪器和当前 span 通过 contextvars 传递，asyncio 任务和 `asyncio.to_thread`
+# 启动的工作线程会自动继承；没有活动的追踪时，所有埋点都是空操作。
+
+RUN = "run"
+PLAN = "plan"
+STEP = "step"
+ITERATION = "iteration"
+LLM = "llm"
+TOOL = "tool"
+
+
+def pad_display(text: str, width: int, align_left: bool = False) -> str:
+    """按显示宽度 (中文字符占两列) 填充，使表格在终端中对齐"""
+    display = sum(2 if unicodedata.east_asian_width(ch) in ("W", "F") else 1 for ch in text)
+    padding = " " * max(width - display, 0)
+    return text + padding if align_left else padding + text
+
+
+@dataclass
+class Span:
+    """
+    一段被计时的操作。
+
+    属性:
+        name (str): 名称，例如 "llm.stream" 或 "tool.read_file"
+        kind (str): 类别 (RUN / PLAN / STEP / ITERATION / LLM / TOOL)
+        span_id (str): 16 位十六进制 ID
+        parent_id (Optional[str]): 父 span 的 ID
+        start_ns (int): 开始时间 (Unix 纳秒)
+        end_ns (Optional[int]): 结束时间 (Unix 纳秒)
+        thread (str): 开始时所在的线程名
+        attributes (Dict[str, Any]): 附加属性，例如令牌数、输出大小
+    """
+    name: str
+    kind: str
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    thread: str
+    end_ns: Optional[int] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    _tracer: Optional["Tracer"] = field(default=None, repr=False)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else self._tracer.now_ns()
+        return (end - self.start_ns) / 1e6
+
+    def set(self, **attributes):
+        """设置或覆盖属性"""
+        self.attributes.update(attributes)
+
+    def end(self):
+        """结束计时并交给追踪器；重复调用无效"""
+        if self.end_ns is None:
+            self.end_ns = self._tracer.now_ns()
+            self._tracer._finish(self)
+
+
+class _NoopSpan:
+    """没有活动追踪时返回的占位 span"""
+    attributes: Dict[str, Any] = {}
+
+    def set(self, **attributes):
+        pass
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """
+    收集一次运行中的所有 span，并负责导出和汇总。
+    时间戳以单调时钟计算，再对齐到追踪开始时的 Unix 时间，不受系统时间调整影响。
+    """
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+        self._epoch_ns = time.time_ns()
+        self._perf_ns = time.perf_counter_ns()
+
+    def now_ns(self) -> int:
+        return self._epoch_ns + (time.perf_counter_ns() - self._perf_ns)
+
+    def _finish(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def export_jsonl(self, path: str):
+        """每行一个 span，字段命名与 OpenTelemetry (OTLP) 的 span 模型一致"""
+        with open(path, "w", encoding="utf-8") as f:
+            for span in sorted(self.spans, key=lambda s: s.start_ns):
+                f.write(json.dumps({
+                    "trace_id": self.trace_id,
+                    "span_id": span.span_id,
+                    "parent_span_id": span.parent_id,
+                    "name": span.name,
+                    "kind": span.kind,
+                    "start_time_unix_nano": span.start_ns,
+                    "end_time_unix_nano": span.end_ns,
+                    "duration_ms": round(span.duration_ms, 3),
+                    "thread": span.thread,
+                    "attributes": span.attributes,
+                }, ensure_ascii=False, default=str) + "\n")
+
+    def export_chrome(self, path: str):
+        """导出为 Chrome trace-event 格式，可在 chrome://tracing 或 Perfetto 中查看"""
+        threads: Dict[str, int] = {}
+        events = []
+        for span in sorted(self.spans, key=lambda s: s.start_ns):
+            tid = threads.setdefault(span.thread, len(threads) + 1)
+            events.append({
+                "name": span.name,
+                "cat": span.kind,
+                "ph": "X",
+                "ts": span.start_ns / 1000,
+                "dur": (span.end_ns - span.start_ns) / 1000,
+                "pid": 1,
+                "tid": tid,
+                "args": span.attributes,
+            })
+        for thread, tid in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": thread}})
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms",
+                       "otherData": {"trace_id": self.trace_id}}, f, ensure_ascii=False, default=str)
+
+    def summary(self) -> str:
+        """按名称汇总各类 span 的次数和耗时，以及 LLM 令牌用量，返回文本表格"""
+        groups: Dict[str, List[Span]] = {}
+        for span in self.spans:
+            groups.setdefault(span.name, []).append(span)
+        order = {RUN: 0, PLAN: 1, STEP: 2, ITERATION: 3, LLM: 4, TOOL: 5}
+        names = sorted(groups, key=lambda n: (order.get(groups[n][0].kind, 9), n))
+
+        widths = (24, 8, 14, 12, 12)
+        rows = [("名称", "次数", "总耗时(ms)", "平均(ms)", "最大(ms)")]
+        for name in names:
+            durations = [s.duration_ms for s in groups[name]]
+            rows.append((name, str(len(durations)), f"{sum(durations):.1f}",
+                         f"{sum(durations) / len(durations):.1f}", f"{max(durations):.1f}"))
+        lines = [
+            "".join(pad_display(cell, width, align_left=(i == 0)) for i, (cell, width) in enumerate(zip(row, widths)))
+            for row in rows
+        ]
+
+        llm_spans = [s for s in self.spans if s.kind == LLM]
+        if llm_spans:
+            prompt = sum(s.attributes.get("prompt_tokens", 0) for s in llm_spans)
+            completion = sum(s.attributes.get("completion_tokens", 0) for s in llm_spans)
+            hits = sum(1 for s in llm_spans if s.attributes.get("cache_hit"))
+            ttfts = [s.attributes["ttft_ms"] for s in llm_spans if "ttft_ms" in s.attributes]
+            line = f"LLM: {len(llm_spans)} 次调用 (缓存命中 {hits})，提示令牌 {prompt}，补全令牌 {completion}"
+            if ttfts:
+                line += f"，平均首令牌时间 {sum(ttfts) / len(ttfts):.1f} ms"
+            lines.append(line)
+        tool_spans = [s for s in self.spans if s.kind == TOOL]
+        if tool_spans:
+            output = sum(s.attributes.get("output_bytes", 0) for s in tool_spans)
+            lines.append(f"工具: {len(tool_spans)} 次调用，输出共 {output} 字节")
+        return "\n".join(lines)
+
+
+_tracer_var: ContextVar[Optional[Tracer]] = ContextVar("tracer", default=None)
+_span_var: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def active_tracer() -> Optional[Tracer]:
+    """返回当前上下文中的追踪器；没有活动追踪时返回 None"""
+    return _tracer_var.get()
+
+
+def current_span():
+    """返回当前 span；没有活动追踪时返回空操作的占位 span"""
+    return _span_var.get() or NOOP_SPAN
+
+
+def start_span(name: str, kind: str, **attributes):
+    """
+    开始一个 span，但不把它设为当前 span，需要调用方显式调用 `end()`。
+    适用于生成器等无法安全地在 yield 前后设置 contextvars 的场景。
+    """
+    tracer = _tracer_var.get()
+    if tracer is None:
+        return NOOP_SPAN
+    parent = _span_var.get()
+    return Span(
+        name=name,
+        kind=kind,
+        span_id=uuid.uuid4().hex[:16],
+        parent_id=parent.span_id if parent else None,
+        start_ns=tracer.now_ns(),
+        thread=threading.current_thread().name,
+        attributes=dict(attributes),
+        _tracer=tracer,
+    )
+
+
+@contextmanager
+def span(name: str, kind: str, **attributes) -> Iterator[Span]:
+    """在 with 块内计时，并把该 span 设为块内创建的 span 的父节点；异常会记录在 error 属性中"""
+    s = start_span(name, kind, **attributes)
+    if s is NOOP_SPAN:
+        yield s
+        return
+    token = _span_var.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.set(error=f"{e.__class__.__name__}: {e}")
+        raise
+    finally:
+        _span_var.reset(token)
+        s.end()
+
+
+@contextmanager
+def trace(name: str, **attributes) -> Iterator[Tracer]:
+    """
+    开始一次追踪，with 块本身作为根 span。已有活动追踪时 (例如嵌套调用) 只创建子 span。
+    """
+    existing = _tracer_var.get()
+    tracer = existing or Tracer()
+    token = _tracer_var.set(tracer) if existing is None else None
+    try:
+        with span(name, RUN, **attributes):
+            yield tracer
+    finally:
+        if token is not None:
+            _tracer_var.reset(token)
+
+
+def export_trace(tracer: Tracer, output_dir: str) -> Dict[str, str]:
+    """把追踪导出为 JSONL 和 Chrome trace-event 两个文件，返回文件路径"""
+    os.makedirs(output_dir, exist_ok=True)
+    prefix = os.path.join(output_dir, f"trace_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{tracer.trace_id[:8]}")
+    paths = {"jsonl": prefix + ".jsonl", "chrome": prefix + ".chrome.json"}
+    try:
+        tracer.export_jsonl(paths["jsonl"])
+        tracer.export_chrome(paths["chrome"])
+    except OSError as e:
+        logging.error(f"❌ 导出追踪文件失败：{e}")
+    return paths
@@ -1,30 +1,112 @@
+import os
 import sys
+import argparse
 import logging
+from datetime import datetime
 from core.orchestrator import Orchestrator
+from core.async_orchestrator import AsyncOrchestrator
+from core.checkpoint import Checkpointer
 from config import AppConfig
 from core.log_setup import setup_logging
+from core.llm import llm_cache, router
+from core.plan_cache import plan_cache
+from tools.registry import get_tool_class, registered_tools
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="OpenManus-Lite 自主智能体")
+    parser.add_argument("--task", help="要执行的任务描述", default="把周杰伦最热门的5首歌的歌词翻译成英文写入docx文档，放在tmp目录下")
+    parser.add_argument("--async", dest="async_mode", action="store_true", help="按依赖图并发执行彼此独立的计划步骤")
+    parser.add_argument("--record", nargs="?", const="", metavar="PATH",
+                        help="录制本次运行的所有 LLM 响应和工具观察 (默认写入 logs/recordings/，以 .gz 结尾时压缩)")
+    parser.add_argument("--replay", metavar="PATH", help="回放之前录制的运行，录制的部分不再请求 LLM 或执行工具")
+    parser.add_argument("--replay-until", type=int, metavar="STEP", help="只回放到该步骤 (含)，之后实时执行")
+    parser.add_argument("--resume", metavar="RUN_ID", help="从检查点继续之前中断的运行 (任务和模式取自检查点)")
+    parser.add_argument("--replay-live-tools", action="store_true", help="回放时仍实际执行工具 (需要重新生成工作区文件时使用)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="流水线模式：计划仍在流式生成时就开始执行已解析出的步骤 (仅顺序模式)")
+    parser.add_argument("--tools", help="逗号分隔的工具子集，例如 read_file,write_file (step_complete 和 finish 总是提供)")
+    parser.add_argument("--list-tools", action="store_true", help="列出所有已注册的工具及其元数据后退出")
+    return parser.parse_args()
+
+def list_tools():
+    """打印所有已注册的工具：名称、来源、副作用类别、开销提示和参数"""
+    for name, spec in registered_tools().items():
+        try:
+            meta = get_tool_class(name).metadata()
+        except Exception as e:
+            print(f"- {name} ({spec.source})  ❌ 无法加载：{e}")
+            continue
+        params = ", ".join(meta["parameters"]["properties"])
+        print(f"- {name} ({spec.source})  副作用: {meta['side_effect']}  开销: {meta['cost']}  参数: {params}")
+        print(f"    {meta['description']}")
 
 def main():
+    args = parse_args()
+
     if not AppConfig:
         print("❌ 致命错误：无法加载配置。程序退出。")
         sys.exit(1)
 
+    if args.list_tools:
+        list_tools()
+        return
+
+    tools = [name.strip() for name in args.tools.split(",") if name.strip()] if args.tools else None
+    if tools:
+        unknown = [name for name in tools if name not in registered_tools()]
+        if unknown:
+            print(f"❌ 错误：未知的工具 {', '.join(unknown)}。可用工具: {', '.join(registered_tools())}")
+            sys.exit(1)
+
     setup_logging()
 
     if not AppConfig.check_config():
         print("错误：无法加载大模型配置。程序退出。")
         sys.exit(1)
 
-    task = "把周杰伦最热门的5首歌的歌词翻译成英文写入docx文档，放在tmp目录下"
+    task = args.task
+    async_mode = args.async_mode
+    workspace = None
+    if args.resume:
+        state = Checkpointer.load(AppConfig.CHECKPOINT_DIR, args.resume)
+        if state is None:
+            print(f"❌ 错误：未找到运行 {args.resume} 的检查点。")
+            sys.exit(1)
+        task, async_mode, workspace = state.task, state.mode == "async", state.workspace
+
+    record_path = args.record
+    if record_path == "":
+        record_path = os.path.join(AppConfig.LOGS_PATH, "recordings", f"run_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.jsonl.gz")
 
     logging.info("🚀 智能体开始任务: %s", task)
-    orchestrator = Orchestrator(task=task)
-    final_result = orchestrator.run()
+    orchestrator_cls = AsyncOrchestrator if async_mode else Orchestrator
+    orchestrator = orchestrator_cls(
+        task=task,
+        workspace=workspace,
+        run_id=args.resume,
+        tools=tools,
+        record_path=record_path,
+        replay_path=args.replay,
+        replay_until_step=args.replay_until,
+        replay_tools=not args.replay_live_tools,
+        pipeline=True if args.pipeline else None,
+    )
+    try:
+        final_result = orchestrator.run()
+    finally:
+        orchestrator.close()
 
     logging.info("\n\n" + "#"*20 + " Task Final Result " + "#"*20)
     logging.info(final_result if final_result else "The task did not return a definitive final result.")
     logging.info("#"*58)
 
+    if llm_cache.created and llm_cache.get():
+        logging.info(f"💾 LLM 响应缓存统计: {llm_cache.get().stats()}")
+    if plan_cache.created and plan_cache.get():
+        logging.info(f"📋 计划缓存统计: {plan_cache.get().stats()}")
+    if router.created and router.get().stats():
+        logging.info(f"🧭 模型档位统计: {router.get().stats()}")
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
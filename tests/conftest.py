@@ -0,0 +1,144 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# 配置文件按相对路径 config.toml 加载
+os.chdir(ROOT)
+
+
+class FakeLLMServer:
+    """
+    测试用的 OpenAI 兼容服务，按顺序返回预设的回复：
+        ("ok", 文本)            正常回复 (请求带 stream 时以 SSE 分块返回)
+        ("status", 状态码)      错误响应
+        ("broken", 文本)        流式返回一部分文本后直接断开连接
+    预设的回复用完后总是返回 ("ok", "默认回复")。
+    """
+    def __init__(self):
+        self.script: List[tuple] = []
+        self.requests: List[dict] = []
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _next(self, body: dict) -> tuple:
+        with self._lock:
+            self.requests.append(body)
+            return self.script.pop(0) if self.script else ("ok", "默认回复")
+
+    def start(self) -> "FakeLLMServer":
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                kind, value = server._next(body)
+                if kind == "status":
+                    data = json.dumps({"error": {"message": f"status {value}", "type": "test"}}).encode()
+                    self.send_response(value)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                elif body.get("stream"):
+                    self._stream(value, broken=kind == "broken")
+                else:
+                    data = json.dumps({
+                        "id": "fake", "object": "chat.completion", "created": 0, "model": body.get("model"),
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": value},
+                                     "finish_reason": "stop"}],
+                        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+                    }, ensure_ascii=False).encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+
+            def _stream(self, text: str, broken: bool):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i in range(0, len(text), 4):
+                    chunk = {"id": "fake", "object": "chat.completion.chunk", "created": 0, "model": "fake",
+                             "choices": [{"index": 0, "delta": {"content": text[i:i + 4]}, "finish_reason": None}]}
+                    self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                if broken:
+                    # 不发送结束分块就关闭连接，客户端读取时出错
+                    self.wfile.flush()
+                    self.close_connection = True
+                    self.connection.shutdown(2)
+                    return
+                self._write_chunk(b"data: [DONE]\n\n")
+                self._write_chunk(b"")
+
+            def _write_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def fake_llm(tmp_path, monkeypatch):
+    """把全局配置指向 FakeLLMServer，并为本测试重新创建 LLM 客户端、缓存、限流器和路由器"""
+    from config import AppConfig
+    from core import llm, routing
+    from core.lazy import Lazy
+    from core.rate_limiter import RateLimiter
+
+    server = FakeLLMServer().start()
+    settings = {
+        "LLM_BASE_URL": server.base_url,
+        "LLM_API_KEY": "test",
+        "LLM_MODEL": "fake-model",
+        "LLM_TEMPERATURE": 0,
+        "LLM_MAX_RETRIES": 2,
+        "LLM_RETRY_BASE_DELAY": 0.01,
+        "LLM_RETRY_MAX_DELAY": 0.02,
+        "LLM_REQUESTS_PER_MINUTE": 0,
+        "LLM_TOKENS_PER_MINUTE": 0,
+        "LLM_CACHE_ENABLED": True,
+        "LLM_CACHE_FORCE": False,
+        "LLM_CACHE_PATH": str(tmp_path / "llm_cache.sqlite3"),
+        "LLM_PROFILES": {},
+        "ROUTING_PLANNER": [],
+        "ROUTING_EXECUTOR": [],
+        "ROUTING_SUMMARY": [],
+        "TRACING_ENABLED": False,
+        "LOGS_PATH": str(tmp_path / "logs"),
+        "WORKSPACE_PATH": str(tmp_path / "workspace"),
+        "RESULTS_PATH": str(tmp_path / "workspace" / "results"),
+    }
+    for name, value in settings.items():
+        monkeypatch.setattr(AppConfig, name, value)
+    monkeypatch.setattr(llm, "client", Lazy(llm.get_llm_client))
+    monkeypatch.setattr(llm, "llm_cache", Lazy(llm.get_llm_cache))
+    monkeypatch.setattr(llm, "rate_limiter", Lazy(lambda: RateLimiter(0, 0)))
+    monkeypatch.setattr(llm, "router", Lazy(lambda: routing.create_router(AppConfig)))
+    yield server
+    server.stop()
@@ -0,0 +1,62 @@
+import re
+
+import pytest
+
+from config import AppConfig
+from core.artifacts import get_artifact_store, parse_artifact_id
+from tools.artifact_tool import ReadArtifactTool
+
+TEXT = "".join(f"第 {i} 行 " + "x" * 80 + "\n" for i in range(1, 1001))
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(AppConfig, "ARTIFACTS_ENABLED", True)
+    monkeypatch.setattr(AppConfig, "ARTIFACTS_THRESHOLD_CHARS", 4000)
+    monkeypatch.setattr(AppConfig, "ARTIFACTS_PREVIEW_CHARS", 1500)
+    return get_artifact_store(str(tmp_path))
+
+
+def test_large_output_is_replaced_by_handle_and_preview(store):
+    preview = store.externalize(TEXT, AppConfig.ARTIFACTS_THRESHOLD_CHARS, AppConfig.ARTIFACTS_PREVIEW_CHARS)
+    assert len(preview) < 2000
+    assert "第 1 行" in preview and "第 1000 行" in preview
+    artifact_id = parse_artifact_id(preview)
+    with open(store.path_for(artifact_id), encoding="utf-8") as f:
+        assert f.read() == TEXT
+    # 相同的内容只保存一次
+    assert store.put(TEXT).id == artifact_id
+
+
+def test_small_output_is_kept(store):
+    assert store.externalize("短输出", 4000, 1500) == "短输出"
+
+
+def test_read_artifact_pages_through_whole_artifact(store, tmp_path):
+    artifact_id = store.put(TEXT).id
+    tool = ReadArtifactTool(str(tmp_path))
+    pages, start = [], 1
+    while True:
+        output = tool.execute(artifact_id, start_line=start).output
+        # 每一页都不超过外部化阈值，不会被再次保存为工件
+        assert len(output) <= AppConfig.ARTIFACTS_THRESHOLD_CHARS
+        pages.append(output.split("---\n", 1)[1].rsplit("\n---", 1)[0])
+        more = re.search(r"start_line=(\d+)", output)
+        if not more:
+            break
+        start = int(more.group(1))
+    assert "\n".join(pages) + "\n" == TEXT
+
+
+def test_read_artifact_search(store, tmp_path):
+    artifact_id = store.put(TEXT).id
+    output = ReadArtifactTool(str(tmp_path)).execute(artifact_id, pattern=r"第 99\d 行").output
+    assert output.startswith(f"工件 {artifact_id} 中找到 10 处匹配")
+    assert "990: 第 990 行" in output
+    assert len(output) <= AppConfig.ARTIFACTS_THRESHOLD_CHARS
+
+
+def test_read_artifact_rejects_unknown_id(store, tmp_path):
+    tool = ReadArtifactTool(str(tmp_path))
+    assert tool.execute("0123456789abcdef").failed
+    assert tool.execute("../../etc/passwd").failed
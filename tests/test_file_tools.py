@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+from config import AppConfig
+from core.artifacts import get_artifact_store
+from core.batch_runner import BatchRunner
+from core.checkpoint import workspace_manifest
+from tools.file_tools import GrepFileTool, ListFilesTool, WriteFileTool, _secure_join
+
+
+def test_secure_join_stays_inside_workspace(tmp_path):
+    base = str(tmp_path / "ws")
+    assert _secure_join(base, "a/b.txt") == os.path.join(base, "a", "b.txt")
+    assert _secure_join(base, "a/../b.txt") == os.path.join(base, "b.txt")
+    with pytest.raises(ValueError):
+        _secure_join(base, "../outside.txt")
+    with pytest.raises(ValueError):
+        _secure_join(base, "/etc/passwd")
+
+
+def test_secure_join_rejects_sibling_with_common_prefix(tmp_path):
+    # 批量运行的工作区是兄弟目录，名称可能互为前缀
+    with pytest.raises(ValueError):
+        _secure_join(str(tmp_path / "t-1234"), "../t-1234-5678/x.txt")
+
+
+def test_batch_workspaces_are_distinct_and_usable(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    runner = BatchRunner(str(tmp_path / "in.jsonl"), str(tmp_path / "out.jsonl"), workers=1, workspace_root="wsrel")
+    first, second = runner._workspace_for("a/b"), runner._workspace_for("a_b")
+    assert first != second
+    assert os.path.isabs(first)
+    result = WriteFileTool(first).execute("t1", "内容")
+    assert not result.failed, result.output
+    assert (tmp_path / "wsrel" / os.path.basename(first) / "t1").read_text(encoding="utf-8") == "内容"
+
+
+def test_write_file_rejects_unknown_mode(tmp_path):
+    tool = WriteFileTool(str(tmp_path))
+    assert not tool.execute("a.txt", "原有内容").failed
+    assert tool.execute("a.txt", "x", mode="apend").failed
+    assert not tool.execute("a.txt", "，追加", mode="append").failed
+    assert (tmp_path / "a.txt").read_text(encoding="utf-8") == "原有内容，追加"
+
+
+def test_walkers_skip_artifact_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(AppConfig, "ARTIFACTS_ENABLED", True)
+    workspace = str(tmp_path)
+    (tmp_path / "notes.txt").write_text("needle\n", encoding="utf-8")
+    get_artifact_store(workspace).put("needle\n" * 1000)
+
+    listing = ListFilesTool(workspace).execute(recursive=True).output
+    assert "notes.txt" in listing and AppConfig.ARTIFACTS_DIR not in listing
+    matches = GrepFileTool(workspace).execute(pattern="needle").output
+    assert "找到 1 处匹配" in matches
+    assert list(workspace_manifest(workspace)) == ["notes.txt"]
@@ -0,0 +1,78 @@
+from core import llm, replay
+
+
+def test_retries_server_errors_then_succeeds(fake_llm):
+    fake_llm.script = [("status", 500), ("status", 503), ("ok", "你好")]
+    assert llm.call_llm("问候", instructions="测试") == "你好"
+    assert len(fake_llm.requests) == 3
+
+
+def test_does_not_retry_client_errors(fake_llm):
+    fake_llm.script = [("status", 400), ("ok", "不应被请求")]
+    result = llm.call_llm("问候", instructions="测试")
+    assert llm.is_llm_error(result)
+    assert len(fake_llm.requests) == 1
+
+
+def test_gives_up_after_max_retries(fake_llm):
+    fake_llm.script = [("status", 500)] * 5
+    assert llm.is_llm_error(llm.call_llm("问候", instructions="测试"))
+    assert len(fake_llm.requests) == 3  # 首次请求 + LLM_MAX_RETRIES 次重试
+
+
+def test_identical_request_is_served_from_cache(fake_llm):
+    fake_llm.script = [("ok", "缓存的回复")]
+    assert llm.call_llm("同一个问题", instructions="测试") == "缓存的回复"
+    assert llm.call_llm("同一个问题", instructions="测试") == "缓存的回复"
+    assert "".join(llm.stream_llm("同一个问题", instructions="测试")) == "缓存的回复"
+    assert len(fake_llm.requests) == 1
+
+
+def test_errors_are_not_cached(fake_llm):
+    fake_llm.script = [("status", 400), ("ok", "第二次成功")]
+    assert llm.is_llm_error(llm.call_llm("问题", instructions="测试"))
+    assert llm.call_llm("问题", instructions="测试") == "第二次成功"
+
+
+def test_completed_stream_is_cached(fake_llm):
+    fake_llm.script = [("ok", "完整的流式回复")]
+    assert "".join(llm.stream_llm("问题", instructions="测试")) == "完整的流式回复"
+    assert llm.call_llm("问题", instructions="测试") == "完整的流式回复"
+    assert len(fake_llm.requests) == 1
+
+
+def test_cancelled_stream_prefix_is_not_cached(fake_llm):
+    fake_llm.script = [("ok", "这是一段比较长的完整回复"), ("ok", "这是一段比较长的完整回复")]
+    chunks = llm.stream_llm("问题", instructions="测试")
+    first = next(chunks)
+    chunks.close()
+    assert first == "这是一段"
+    assert llm.call_llm("问题", instructions="测试") == "这是一段比较长的完整回复"
+    assert len(fake_llm.requests) == 2
+
+
+def test_broken_stream_ends_with_error_marker(fake_llm):
+    fake_llm.script = [("broken", "只收到一半"), ("ok", "完整回复")]
+    chunks = list(llm.stream_llm("问题", instructions="测试"))
+    assert "".join(chunks[:-1]) == "只收到一半"
+    assert llm.is_llm_error(chunks[-1])
+    # 中断的流不缓存，之后相同的请求重新发送
+    assert llm.call_llm("问题", instructions="测试") == "完整回复"
+
+
+def test_cancelled_stream_is_replayed_only_to_streams(fake_llm, tmp_path):
+    recording = str(tmp_path / "run.jsonl")
+    fake_llm.script = [("ok", "完整的流式回复内容")]
+    with replay.session(record_path=recording):
+        chunks = llm.stream_llm("问题", instructions="测试")
+        next(chunks)
+        chunks.close()
+
+    with replay.session(replay_path=recording):
+        assert "".join(llm.stream_llm("问题", instructions="测试")) == "完整的流"
+
+    # 非流式调用不能拿到录制的前缀，改为实时请求
+    fake_llm.script = [("ok", "实时的完整回复")]
+    with replay.session(replay_path=recording) as session:
+        assert llm.call_llm("另一个问题", instructions="测试") == "实时的完整回复"
+        assert session.replayed_llm == 0
@@ -0,0 +1,75 @@
+from agents.plan import _repair_json, parse_plan, validate_plan
+
+
+def test_validate_plan_orders_and_renumbers_steps():
+    steps, problems = validate_plan({"steps": [
+        {"id": 5, "description": "汇总", "depends_on": [3]},
+        {"id": 3, "description": "收集数据"},
+    ]})
+    assert [s.description for s in steps] == ["收集数据", "汇总"]
+    assert [s.id for s in steps] == [1, 2]
+    assert steps[1].depends_on == [1]
+    assert problems == []
+
+
+def test_validate_plan_fixes_invalid_fields():
+    steps, problems = validate_plan([
+        {"id": 1, "description": "读取文件", "tools": ["read_file", "browser"], "max_iterations": 99},
+        {"id": 1, "description": "写入结果", "depends_on": [1, 7, "x"], "max_iterations": "很多"},
+        {"id": 3},
+        "整理格式",
+    ], known_tools=["read_file", "write_file"], max_iterations=10)
+    by_description = {s.description: s for s in steps}
+    assert set(by_description) == {"读取文件", "写入结果", "整理格式"}
+    read, write = by_description["读取文件"], by_description["写入结果"]
+    assert read.tools == ["read_file"]
+    assert read.max_iterations == 10
+    assert write.depends_on == [read.id]
+    assert write.max_iterations is None
+    assert any("重复" in p for p in problems)
+    assert any("缺少 description" in p for p in problems)
+    assert any("browser" in p for p in problems)
+
+
+def test_validate_plan_breaks_cycles():
+    steps, _ = validate_plan([
+        {"id": 1, "description": "A", "depends_on": [2]},
+        {"id": 2, "description": "B", "depends_on": [1]},
+    ])
+    assert len(steps) == 2
+    # 打断环之后每个步骤只依赖排在它之前的步骤
+    for step in steps:
+        assert all(d < step.id for d in step.depends_on)
+
+
+def test_validate_plan_rejects_non_plans():
+    assert validate_plan({"foo": 1})[0] == []
+    assert validate_plan("不是计划")[0] == []
+
+
+def test_repair_json_common_llm_mistakes():
+    text = """好的，计划如下：
+```json
+{
+  // 两个步骤
+  "steps": [
+    {"id": 1, "description": “写代码”, "optional": True,},
+    {"id": 2, "description": "测试", "extra": None},
+  ],
+}
+"""
+    data = _repair_json(text)
+    assert data["steps"][0]["description"] == "写代码"
+    assert data["steps"][0]["optional"] is True
+    assert data["steps"][1]["extra"] is None
+
+
+def test_repair_json_gives_up_on_non_json():
+    assert _repair_json("没有任何 JSON") is None
+    assert _repair_json("{这不是 JSON}") is None
+
+
+def test_parse_plan_reports_repair():
+    steps, problems = parse_plan('{"steps": [{"id": 1, "description": "唯一的步骤"},]}')
+    assert [s.description for s in steps] == ["唯一的步骤"]
+    assert "JSON 格式有误，已自动修复" in problems
@@ -0,0 +1,63 @@
+import pytest
+
+from config import AppConfig
+from tools.shell_tool import ShellTool
+
+
+@pytest.fixture
+def shell(monkeypatch):
+    monkeypatch.setattr(AppConfig, "SHELL_PERSISTENT_SESSION", False)
+    return ShellTool()
+
+
+@pytest.mark.parametrize("command", [
+    "ls -la",
+    "cat a.txt | grep foo | wc -l",
+    "sort -u data.csv | head -n 5",
+    "find . -name '*.py'",
+    "cat a && wc -l b",
+    "rg -n TODO src",
+])
+def test_read_only_commands(shell, command):
+    assert shell.is_read_only({"command": command})
+
+
+@pytest.mark.parametrize("command", [
+    "rm -rf data",
+    "env rm -rf data",
+    "uniq in.txt out.txt",
+    "date -s 2020-01-01",
+    "less notes.txt",
+    "sort --output=x.txt a",
+    "sort -o x.txt a",
+    "sort -ox.txt a",
+    "sort -uo x.txt a",
+    "find . -delete",
+    "find . -exec rm {} ;",
+    "find . -fprintf out %p",
+    "find . -fprint0 out",
+    "find . -fls out",
+    "rg --pre=sh pattern",
+    "tree -o out.txt",
+    "cat a > b",
+    "cat a >> b",
+    "echo $(rm -rf x)",
+    "echo `rm -rf x`",
+    "ls &",
+    "ls\nrm x",
+    "FOO=1 ls",
+    "cat 'unterminated",
+    "",
+])
+def test_commands_with_side_effects(shell, command):
+    assert not shell.is_read_only({"command": command})
+
+
+def test_persistent_session_is_never_read_only(shell, monkeypatch):
+    monkeypatch.setattr(AppConfig, "SHELL_PERSISTENT_SESSION", True)
+    assert not shell.is_read_only({"command": "ls"})
+
+
+def test_missing_command_is_not_read_only(shell):
+    assert not shell.is_read_only({})
+    assert not shell.is_read_only({"command": None})
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+PythonTool 的内核工作进程。
+
+由 `tools.python_kernel.PythonKernel` 以独立子进程启动，只依赖标准库。
+通过标准输入/输出以 JSON 行协议与父进程通信：
+    父进程 -> 内核: {"op": "exec", "code": ..., "cpu_seconds": ...} 或 {"op": "chdir", "path": ...}
+    内核 -> 父进程: {"type": "ready"} / {"type": "output", "data": ...} / {"type": "result", ...}
+用户代码的变量和导入保存在同一个命名空间中，在多次调用之间保留。
+"""
+import json
+import os
+import signal
+import sys
+import traceback
+
+try:
+    import resource
+except ImportError:  # 非 POSIX 平台不支持资源限制
+    resource = None
+
+
+class CpuTimeExceeded(Exception):
+    pass
+
+
+class _PipeWriter:
+    """将用户代码的 print 输出实时转发给父进程，超过上限的部分只计数"""
+    def __init__(self, send, max_bytes: int):
+        self._send = send
+        self._max_bytes = max_bytes
+        self.sent = 0
+        self.dropped = 0
+
+    def write(self, text: str) -> int:
+        if not text:
+            return 0
+        size = len(text.encode("utf-8", errors="replace"))
+        if self.sent + size <= self._max_bytes:
+            self._send({"type": "output", "data": text})
+            self.sent += size
+        else:
+            self.dropped += size
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self) -> bool:
+        return False
+
+
+def _on_cpu_limit(signum, frame):
+    raise CpuTimeExceeded("超出 CPU 时间限制")
+
+
+def _set_cpu_limit(seconds: float):
+    """为本次执行设置 CPU 软限制 (基于进程已用的 CPU 时间)；硬限制保持不变以便之后放宽"""
+    if resource is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if seconds:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(usage.ru_utime + usage.ru_stime + seconds) + 1
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+    else:
+        soft = hard
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def main():
+    # 协议使用原始 stdout 的副本；fd 1 改指向 stderr，避免 C 扩展或子进程的输出破坏协议
+    protocol = os.fdopen(os.dup(1), "w", encoding="utf-8", buffering=1)
+    os.dup2(2, 1)
+
+    def send(message: dict):
+        protocol.write(json.dumps(message, ensure_ascii=False) + "\n")
+        protocol.flush()
+
+    settings = json.loads(sys.stdin.readline())
+    if resource is not None and settings.get("memory_mb"):
+        limit = int(settings["memory_mb"]) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if resource is not None:
+        signal.signal(signal.SIGXCPU, _on_cpu_limit)
+
+    namespace = {"__name__": "__main__", "__builtins__": __builtins__}
+    # 预热常用模块，之后的调用无需再付出导入开销
+    for module in settings.get("prewarm_imports", []):
+        try:
+            namespace[module.split(".")[0]] = __import__(module)
+        except Exception:
+            pass
+    send({"type": "ready"})
+
+    while True:
+        try:
+            line = sys.stdin.readline()
+        except KeyboardInterrupt:
+            continue
+        if not line:  # 父进程关闭了管道 (或已退出)
+            break
+        request = json.loads(line)
+
+        if request.get("op") == "chdir":
+            try:
+                os.chdir(request["path"])
+                send({"type": "result", "ok": True, "error": None, "dropped": 0})
+            except OSError as e:
+                send({"type": "result", "ok": False, "error": str(e), "dropped": 0})
+            continue
+
+        writer = _PipeWriter(send, int(request.get("max_stream_bytes", 1024 * 1024)))
+        saved = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = writer
+        error = None
+        try:
+            _set_cpu_limit(request.get("cpu_seconds", 0))
+            exec(compile(request["code"], "<agent>", "exec"), namespace)
+        except KeyboardInterrupt:
+            error = "执行超时，已被中断。"
+        except CpuTimeExceeded as e:
+            error = str(e)
+        except MemoryError:
+            error = "超出内存限制 (MemoryError)。"
+        except BaseException:
+            error = traceback.format_exc(limit=-5)
+        finally:
+            sys.stdout, sys.stderr = saved
+            _set_cpu_limit(0)
+        send({"type": "result", "ok": error is None, "error": error, "dropped": writer.dropped})
+
+
+if __name__ == "__main__":
+    main()
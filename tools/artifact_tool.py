@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import mmap
+import os
+import re
+from typing import Optional
+from config import AppConfig
+from core.artifacts import get_artifact_store, parse_artifact_id
+from tools.base_tool import BaseTool, ToolResult
+from tools.file_tools import _line_range, _to_int, _to_bool
+
+# 标题、分隔线和续读提示预留的字符数，内容加上它们不超过外部化阈值
+_OVERHEAD_CHARS = 200
+
+class ReadArtifactTool(BaseTool):
+    name = "read_artifact"
+    read_only = True
+    side_effect = "none"
+    description = (
+        "读取历史中以 [工件 <id>] 表示的大段工具输出的一部分。"
+        "可选参数: start_line / end_line (按行号读取，从 1 开始，包含两端)、"
+        "pattern (只返回匹配该正则表达式的行及其行号)、ignore_case (搜索时是否忽略大小写)。"
+    )
+
+    def execute(self, artifact_id: str, start_line: Optional[int] = None, end_line: Optional[int] = None,
+                pattern: Optional[str] = None, ignore_case: bool = False, **kwargs) -> ToolResult:
+        """
+        按行号或正则表达式读取工件的一部分。返回内容不超过工件阈值，超出时提示从哪一行继续读取。
+
+        参数:
+            artifact_id (str): 工件 ID (句柄 [工件 <id>] 中的 16 位十六进制字符串)。
+            start_line (Optional[int]): 起始行号 (从 1 开始)。
+            end_line (Optional[int]): 结束行号 (包含)。
+            pattern (Optional[str]): 只返回匹配该正则表达式的行 (不合法时按普通文本搜索)。
+            ignore_case (bool): 搜索时是否忽略大小写。
+        """
+        try:
+            store = get_artifact_store(self.workspace)
+            parsed = parse_artifact_id(artifact_id)
+            if store is None or parsed is None or not os.path.exists(store.path_for(parsed)):
+                return ToolResult.error(f"错误：工件 '{artifact_id}' 不存在。")
+            start_line = max(_to_int(start_line, "start_line") or 1, 1)
+            end_line = _to_int(end_line, "end_line")
+            # 返回内容 (连同标题和提示) 不超过外部化阈值，读取的片段本身不会再被保存为新的工件
+            cap = max(AppConfig.ARTIFACTS_THRESHOLD_CHARS - _OVERHEAD_CHARS, 500)
+            path = store.path_for(parsed)
+
+            if pattern:
+                return self._search(parsed, path, pattern, _to_bool(ignore_case), start_line, end_line, cap)
+
+            with open(path, "rb") as f:
+                if os.path.getsize(path) == 0:
+                    return ToolResult.ok(f"工件 {parsed} 是空的。")
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    start, end = _line_range(data, start_line, end_line)
+                    content = data[start:end].decode("utf-8", errors="replace")
+                finally:
+                    data.close()
+            if not content:
+                return ToolResult.error(f"错误：工件 {parsed} 没有第 {start_line} 行。")
+
+            shown, last = [], start_line - 1
+            size = 0
+            for line in content.splitlines(keepends=True):
+                if shown and size + len(line) > cap:
+                    break
+                shown.append(line[:cap])
+                size += len(shown[-1])
+                last += 1
+            result = f"工件 {parsed} 第 {start_line}-{last} 行:\n---\n{''.join(shown).rstrip(chr(10))}\n---"
+            if len(shown) < content.count("\n") + (0 if content.endswith("\n") else 1):
+                result += f"\n(已达到 {cap} 个字符的上限，可使用 start_line={last + 1} 继续读取)"
+            return ToolResult.ok(result)
+        except ValueError as e:
+            return ToolResult.error(f"错误：无效的参数。{e}")
+        except Exception as e:
+            return ToolResult.error(f"读取工件 '{artifact_id}' 时出错：{e}")
+
+    @staticmethod
+    def _search(artifact_id: str, path: str, pattern: str, ignore_case: bool, start_line: int,
+                end_line: Optional[int], cap: int) -> ToolResult:
+        """逐行扫描工件，返回行号范围内匹配的行"""
+        flags = re.IGNORECASE if ignore_case else 0
+        try:
+            regex = re.compile(pattern, flags)
+        except re.error:
+            regex = re.compile(re.escape(pattern), flags)  # 不是合法的正则表达式时按普通文本搜索
+
+        matches, size, truncated = [], 0, False
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line_no, line in enumerate(f, 1):
+                if line_no < start_line:
+                    continue
+                if end_line is not None and line_no > end_line:
+                    break
+                if regex.search(line):
+                    line = line.rstrip("\n")
+                    if len(line) > 300:
+                        line = line[:300] + "…"
+                    entry = f"{line_no}: {line}"
+                    if len(matches) >= AppConfig.FILE_GREP_MAX_MATCHES or size + len(entry) > cap:
+                        truncated = True
+                        break
+                    matches.append(entry)
+                    size += len(entry) + 1
+
+        if not matches:
+            return ToolResult.ok(f"工件 {artifact_id} 中没有匹配 '{pattern}' 的行。")
+        result = f"工件 {artifact_id} 中找到 {len(matches)} 处匹配:\n" + "\n".join(matches)
+        if truncated:
+            last = int(matches[-1].split(":", 1)[0])
+            result += f"\n(已达到返回上限，可使用 start_line={last + 1} 继续搜索，或使用更具体的模式。)"
+        return ToolResult.ok(result)
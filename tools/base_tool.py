@@ -1,6 +1,90 @@
 # -*- coding: utf-8 -*-
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Union, get_args, get_origin
 import inspect
+import re
+from config import AppConfig
+
+# Python 类型到 JSON Schema 类型的映射
+_JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean", list: "array", dict: "object"}
+
+def _json_type(annotation, default) -> str:
+    """根据参数的类型注解 (或默认值的类型) 推断 JSON Schema 类型，无法推断时视为字符串"""
+    if get_origin(annotation) is Union:
+        # Optional[X] 即 Union[X, None]
+        args = [a for a in get_args(annotation) if a is not type(None)]
+        annotation = args[0] if len(args) == 1 else inspect.Parameter.empty
+    annotation = get_origin(annotation) or annotation
+    if annotation in _JSON_TYPES:
+        return _JSON_TYPES[annotation]
+    if annotation is inspect.Parameter.empty and default not in (inspect.Parameter.empty, None):
+        return _JSON_TYPES.get(type(default), "string")
+    return "string"
+
+def _arg_descriptions(func) -> Dict[str, str]:
+    """从文档字符串的“参数:”部分解析出各参数的说明，例如 `code (str): 要执行的代码。`"""
+    descriptions = {}
+    in_args = False
+    for line in (inspect.getdoc(func) or "").splitlines():
+        line = line.strip()
+        if line in ("参数:", "参数："):
+            in_args = True
+            continue
+        if not in_args:
+            continue
+        if not line:
+            if descriptions:
+                break
+            continue
+        match = re.match(r"(\w+)\s*(?:\([^)]*\))?\s*[:：]\s*(.+)", line)
+        if match:
+            descriptions[match.group(1)] = match.group(2)
+    return descriptions
+
+@dataclass
+class ToolResult:
+    """
+    一次工具调用的结果。
+
+    属性:
+        output (str): 返回给 LLM 的观察文本
+        status (str): "success" (成功) 或 "error" (失败，包括参数无效、超时和非零退出码)
+        step_complete (bool): 本次调用是否表明当前计划步骤已完成 (由 step_complete 工具设置)
+    """
+    output: str
+    status: str = "success"
+    step_complete: bool = False
+
+    SUCCESS = "success"
+    ERROR = "error"
+
+    @classmethod
+    def ok(cls, output: str, **kwargs) -> "ToolResult":
+        return cls(output, cls.SUCCESS, **kwargs)
+
+    @classmethod
+    def error(cls, output: str) -> "ToolResult":
+        return cls(output, cls.ERROR)
+
+    @classmethod
+    def of(cls, value: Any) -> "ToolResult":
+        """把工具的返回值转换为 ToolResult；仍返回字符串的工具按“错误：”前缀判断状态"""
+        if isinstance(value, ToolResult):
+            return value
+        output = "" if value is None else str(value)
+        return cls(output, cls.ERROR if output.startswith("错误") else cls.SUCCESS)
+
+    @property
+    def failed(self) -> bool:
+        return self.status == self.ERROR
+
+    def __str__(self) -> str:
+        return self.output
+
+# 按工具类缓存的参数字符串和函数调用定义 (由 `execute` 的签名生成，同一个类总是相同)
+_args_cache: Dict[type, str] = {}
+_schema_cache: Dict[type, dict] = {}
 
 class BaseTool(ABC):
     """
@@ -8,6 +92,26 @@ class BaseTool(ABC):
     它为所有工具强制执行一个通用结构，包括名称、描述和一个 execute 方法。
     """
 
+    # 工具是否没有副作用 (只读取、不修改任何状态)。
+    # 只读的行动之间互不冲突，一次回应中相邻的只读行动会被并发执行；
+    # 其他行动会单独执行，并保持与前后行动的先后顺序。
+    read_only: bool = False
+
+    # 副作用类别："none" (只读)、"workspace" (修改工作区文件)、
+    # "execute" (执行任意命令或代码，副作用不可预知)、"control" (控制执行流程，如结束步骤)
+    side_effect: str = "execute"
+
+    # 单次调用的开销提示："low" (毫秒级的本地操作)、"medium" (可能需要数秒)、"high" (可能需要数十秒或大量资源)
+    cost: str = "low"
+
+    def __init__(self, workspace: Optional[str] = None):
+        """
+        参数:
+            workspace (Optional[str]): 工具操作的工作区目录，默认使用全局配置的工作区。
+                批量运行时每个任务都有自己独立的工作区。
+        """
+        self.workspace = workspace or AppConfig.WORKSPACE_PATH
+
     @property
     @abstractmethod
     def name(self) -> str:
@@ -21,23 +125,91 @@ class BaseTool(ABC):
         pass
 
     @abstractmethod
-    def execute(self, **kwargs) -> str:
+    def execute(self, **kwargs) -> ToolResult:
         """工具的核心逻辑。"""
         pass
 
-    def get_args_str(self) -> str:
+    def run(self, **kwargs) -> ToolResult:
+        """执行工具并把返回值统一为 ToolResult (兼容仍返回字符串的工具)"""
+        return ToolResult.of(self.execute(**kwargs))
+
+    def is_read_only(self, args: dict) -> bool:
+        """
+        判断使用给定参数的这次调用是否没有副作用。默认取决于 `read_only` 属性，
+        副作用取决于参数的工具 (例如 shell) 可以覆盖此方法。
+        """
+        return self.read_only
+
+    def close(self):
+        """释放工具持有的资源 (例如子进程)。默认无需清理。"""
+        pass
+
+    @classmethod
+    def _execute_params(cls) -> List[inspect.Parameter]:
+        """返回 `execute` 方法的位置或关键字参数，不包括 'self'、'args'、'kwargs'"""
+        sig = inspect.signature(cls.execute)
+        return [
+            p for p in sig.parameters.values()
+            if p.kind == inspect.Parameter.POSITIONAL_OR_KEYWORD and p.name != 'self'
+        ]
+
+    @classmethod
+    def get_args_str(cls) -> str:
         """
         自动检查 `execute` 方法的签名以获取其参数字符串。
         例如，如果 execute(file_path: str, content: str)，此方法将返回 "file_path, content"。
-        这有助于为提示动态生成工具列表。
-        """
-        try:
-            sig = inspect.signature(self.execute)
-            # 筛选出位置或关键字参数，不包括 'self'、'args'、'kwargs'
-            params = [
-                p.name for p in sig.parameters.values()
-                if p.kind == inspect.Parameter.POSITIONAL_OR_KEYWORD and p.name != 'self'
-            ]
-            return ", ".join(params)
-        except Exception:
-            return "" # 如果检查失败，则返回空字符串
+        带默认值的可选参数会附带默认值，例如 "file_path, offset=None"。
+        这有助于为提示动态生成工具列表。结果按工具类缓存。
+        """
+        if cls not in _args_cache:
+            try:
+                params = [
+                    p.name if p.default is inspect.Parameter.empty else f"{p.name}={p.default!r}"
+                    for p in cls._execute_params()
+                ]
+                _args_cache[cls] = ", ".join(params)
+            except Exception:
+                _args_cache[cls] = "" # 如果检查失败，则返回空字符串
+        return _args_cache[cls]
+
+    @classmethod
+    def get_tool_schema(cls) -> dict:
+        """
+        生成 OpenAI 函数调用 (`tools` 参数) 所需的工具定义。
+        参数的 JSON Schema 由 `execute` 的签名自动生成：类型取自类型注解或默认值，
+        说明取自文档字符串的“参数:”部分，没有默认值的参数为必填。结果按工具类缓存，调用方不应修改。
+        """
+        if cls in _schema_cache:
+            return _schema_cache[cls]
+        descriptions = _arg_descriptions(cls.execute)
+        properties, required = {}, []
+        for p in cls._execute_params():
+            prop = {"type": _json_type(p.annotation, p.default)}
+            if p.name in descriptions:
+                prop["description"] = descriptions[p.name]
+            if p.default is inspect.Parameter.empty:
+                required.append(p.name)
+            elif p.default is not None:
+                prop["default"] = p.default
+            properties[p.name] = prop
+        schema = _schema_cache[cls] = {
+            "type": "function",
+            "function": {
+                "name": cls.name,
+                "description": cls.description,
+                "parameters": {"type": "object", "properties": properties, "required": required},
+            },
+        }
+        return schema
+
+    @classmethod
+    def metadata(cls) -> dict:
+        """返回工具的元数据：名称、描述、参数的 JSON Schema、副作用类别、开销提示以及是否只读"""
+        return {
+            "name": cls.name,
+            "description": cls.description,
+            "parameters": cls.get_tool_schema()["function"]["parameters"],
+            "side_effect": cls.side_effect,
+            "cost": cls.cost,
+            "read_only": cls.read_only,
+        }
@@ -1,7 +1,14 @@
 # -*- coding: utf-8 -*-
+import fnmatch
+import mmap
 import os
-from tools.base_tool import BaseTool
-from config import AppConfig # 已修正：导入 AppConfig 实例
+import re
+import tempfile
+import time
+from typing import Optional
+from config import AppConfig
+from core.artifacts import is_artifacts_dir
+from tools.base_tool import BaseTool, ToolResult
 
 def _secure_join(base: str, path: str) -> str:
     """
@@ -9,57 +16,311 @@ def _secure_join(base: str, path: str) -> str:
     这可以防止目录遍历攻击（例如，path = '../...'）。
     """
     abs_path = os.path.normpath(os.path.join(base, path))
-    if os.path.commonprefix([abs_path, os.path.realpath(base)]) != os.path.realpath(base):
+    base_path = os.path.realpath(base)
+    # 按路径组成部分比较：逐字符比较时，批量运行中 "t-1234" 的兄弟工作区 "t-1234-5678" 也会被当作在其内部
+    if os.path.commonpath([abs_path, base_path]) != base_path:
         raise ValueError("检测到路径遍历攻击。")
     return abs_path
 
+def _to_int(value, name: str) -> Optional[int]:
+    """LLM 传来的数字参数可能是字符串，统一转换为整数"""
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"参数 '{name}' 必须是整数，收到的是 {value!r}。")
+
+def _to_bool(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "1", "yes", "y")
+    return bool(value)
+
+def _format_size(size: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+def _is_binary(path: str) -> bool:
+    """前 8KB 中出现 NUL 字节即视为二进制文件"""
+    with open(path, "rb") as f:
+        return b"\0" in f.read(8192)
+
+def _line_range(data, start_line: int, end_line: Optional[int]):
+    """
+    在 bytes 或 mmap 上定位第 start_line 到 end_line 行 (从 1 开始，包含两端) 的字节范围。
+    只扫描换行符，不会把整个文件切分成行列表。
+    """
+    pos, line = 0, 1
+    while line < start_line:
+        pos = data.find(b"\n", pos) + 1
+        if pos == 0:
+            return len(data), len(data)
+        line += 1
+    start = pos
+    if end_line is None:
+        return start, len(data)
+    while line <= end_line:
+        pos = data.find(b"\n", pos) + 1
+        if pos == 0:
+            return start, len(data)
+        line += 1
+    return start, pos
+
+def _walk_files(root: str, workspace: str):
+    """逐个目录遍历 root 下的所有文件 (名称有序)，跳过工作区的工件目录"""
+    for directory, dirnames, names in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not is_artifacts_dir(os.path.join(directory, d), workspace))
+        for name in sorted(names):
+            yield os.path.join(directory, name)
+
 class ListFilesTool(BaseTool):
     name = "list_files"
-    description = "列出工作区目录中的所有文件和文件夹。"
+    read_only = True
+    side_effect = "none"
+    description = (
+        "列出工作区目录中的文件和文件夹，包括大小和修改时间。"
+        "可选参数: path (要列出的子目录，默认为工作区根目录)、recursive (是否递归列出子目录，默认 false)、"
+        "pattern (glob 过滤，例如 '*.csv')、max_entries (最多列出的条目数)。"
+    )
+
+    def execute(self, path: str = ".", recursive: bool = False, pattern: Optional[str] = None,
+                max_entries: Optional[int] = None, **kwargs) -> ToolResult:
+        """
+        列出工作区中的文件。
 
-    def execute(self, **kwargs) -> str:
-        """列出工作区中的文件。"""
+        参数:
+            path (str): 要列出的目录 (相对于工作区)。
+            recursive (bool): 是否递归列出子目录。
+            pattern (Optional[str]): 按文件名或相对路径过滤的 glob 模式，例如 '*.csv'。
+            max_entries (Optional[int]): 最多列出的条目数。
+        """
         try:
-            # 已修正：使用 AppConfig.WORKSPACE_PATH
-            files = os.listdir(AppConfig.WORKSPACE_PATH)
-            if not files:
-                return "工作区是空的。"
-            return "工作区文件列表:\n- " + "\n- ".join(files)
+            root = _secure_join(self.workspace, path or ".")
+            if not os.path.isdir(root):
+                return ToolResult.error(f"错误：目录 '{path}' 未找到。")
+            recursive = _to_bool(recursive)
+            limit = _to_int(max_entries, "max_entries") or AppConfig.FILE_LIST_MAX_ENTRIES
+
+            entries, truncated = [], False
+            pending = [root]
+            while pending and not truncated:
+                directory = pending.pop(0)
+                with os.scandir(directory) as it:
+                    for entry in sorted(it, key=lambda e: e.name):
+                        if is_artifacts_dir(entry.path, self.workspace):
+                            continue
+                        rel = os.path.relpath(entry.path, root)
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        if recursive and is_dir:
+                            pending.append(entry.path)
+                        if pattern and not (fnmatch.fnmatch(entry.name, pattern) or fnmatch.fnmatch(rel, pattern)):
+                            continue
+                        if len(entries) >= limit:
+                            truncated = True
+                            break
+                        stat = entry.stat(follow_symlinks=False)
+                        mtime = time.strftime("%Y-%m-%d %H:%M", time.localtime(stat.st_mtime))
+                        if is_dir:
+                            entries.append(f"{rel}/ (目录, {mtime})")
+                        else:
+                            entries.append(f"{rel} ({_format_size(stat.st_size)}, {mtime})")
+
+            if not entries:
+                return ToolResult.ok("没有匹配的文件。" if pattern else "工作区是空的。")
+            result = "工作区文件列表:\n- " + "\n- ".join(entries)
+            if truncated:
+                result += f"\n(已达到 {limit} 个条目的上限，还有更多条目未列出。请使用 path 或 pattern 缩小范围。)"
+            return ToolResult.ok(result)
+        except ValueError as e:
+            return ToolResult.error(f"错误：无效的参数。{e}")
         except Exception as e:
-            return f"列出文件时出错：{e}"
+            return ToolResult.error(f"列出文件时出错：{e}")
 
 class ReadFileTool(BaseTool):
     name = "read_file"
-    description = "从工作区读取指定文件的内容。"
+    read_only = True
+    side_effect = "none"
+    description = (
+        "从工作区读取指定文件的内容。大文件只返回一部分，可以分段读取。"
+        "可选参数: start_line / end_line (按行号读取，从 1 开始，包含两端)、"
+        "offset / length (按字节范围读取)、max_bytes (最多返回的字节数)。"
+    )
+
+    def execute(self, file_path: str, offset: Optional[int] = None, length: Optional[int] = None,
+                start_line: Optional[int] = None, end_line: Optional[int] = None,
+                max_bytes: Optional[int] = None, **kwargs) -> ToolResult:
+        """
+        读取文件的内容 (或其中一段)。
 
-    def execute(self, file_path: str, **kwargs) -> str:
-        """读取文件的内容。"""
+        参数:
+            file_path (str): 要读取的文件路径 (相对于工作区)。
+            offset (Optional[int]): 起始字节位置。
+            length (Optional[int]): 读取的字节数。
+            start_line (Optional[int]): 起始行号 (从 1 开始)，指定后按行读取。
+            end_line (Optional[int]): 结束行号 (包含)。
+            max_bytes (Optional[int]): 最多返回的字节数。
+        """
         try:
-            # 已修正：使用 AppConfig.WORKSPACE_PATH
-            secure_path = _secure_join(AppConfig.WORKSPACE_PATH, file_path)
+            secure_path = _secure_join(self.workspace, file_path)
             if not os.path.exists(secure_path):
-                return f"错误：文件 '{file_path}' 未找到。"
-            with open(secure_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            return f"成功读取文件 '{file_path}':\n---\n{content}\n---"
+                return ToolResult.error(f"错误：文件 '{file_path}' 未找到。")
+            offset = _to_int(offset, "offset") or 0
+            length = _to_int(length, "length")
+            start_line = _to_int(start_line, "start_line")
+            end_line = _to_int(end_line, "end_line")
+            cap = min(_to_int(max_bytes, "max_bytes") or AppConfig.FILE_READ_MAX_BYTES, AppConfig.FILE_READ_MAX_BYTES)
+
+            size = os.path.getsize(secure_path)
+            with open(secure_path, 'rb') as f:
+                if size == 0:
+                    return ToolResult.ok(f"成功读取文件 '{file_path}':\n---\n\n---")
+                # 大文件使用 mmap，只有真正访问到的页面才会被读入内存
+                if size >= AppConfig.FILE_MMAP_THRESHOLD_BYTES:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                else:
+                    data = f.read()
+                try:
+                    if start_line is not None or end_line is not None:
+                        start, end = _line_range(data, max(start_line or 1, 1), end_line)
+                    else:
+                        start = min(max(offset, 0), size)
+                        end = size if length is None else min(start + max(length, 0), size)
+                    shown_end = min(end, start + cap)
+                    content = data[start:shown_end].decode('utf-8', errors='replace')
+                finally:
+                    if isinstance(data, mmap.mmap):
+                        data.close()
+
+            if start == 0 and shown_end == size:
+                return ToolResult.ok(f"成功读取文件 '{file_path}':\n---\n{content}\n---")
+            note = f"字节 {start}-{shown_end} / 共 {size} 字节"
+            if shown_end < end:
+                note += f"；已达到 {cap} 字节的上限，可使用 offset={shown_end} 继续读取"
+            return ToolResult.ok(f"成功读取文件 '{file_path}' ({note}):\n---\n{content}\n---")
         except ValueError as e:
-            return f"错误：无效的文件路径。{e}"
+            return ToolResult.error(f"错误：无效的参数。{e}")
         except Exception as e:
-            return f"读取文件 '{file_path}' 时出错：{e}"
+            return ToolResult.error(f"读取文件 '{file_path}' 时出错：{e}")
+
+class GrepFileTool(BaseTool):
+    name = "grep_file"
+    read_only = True
+    side_effect = "none"
+    description = (
+        "在工作区的文件中搜索匹配正则表达式的行，返回文件名、行号和该行内容。"
+        "适合在大文件中查找需要的部分，再用 read_file 按行号读取。"
+        "可选参数: path (要搜索的文件或目录，默认为整个工作区)、ignore_case (是否忽略大小写)、"
+        "max_matches (最多返回的匹配数)。"
+    )
+
+    def execute(self, pattern: str, path: str = ".", ignore_case: bool = False,
+                max_matches: Optional[int] = None, **kwargs) -> ToolResult:
+        """
+        逐行流式扫描文件，返回匹配的行。
+
+        参数:
+            pattern (str): 要搜索的正则表达式 (不合法时按普通文本搜索)。
+            path (str): 要搜索的文件或目录 (相对于工作区)。
+            ignore_case (bool): 是否忽略大小写。
+            max_matches (Optional[int]): 最多返回的匹配数。
+        """
+        if not pattern:
+            return ToolResult.error("错误：搜索模式不能为空。")
+        try:
+            root = _secure_join(self.workspace, path or ".")
+            if not os.path.exists(root):
+                return ToolResult.error(f"错误：路径 '{path}' 未找到。")
+            limit = _to_int(max_matches, "max_matches") or AppConfig.FILE_GREP_MAX_MATCHES
+            flags = re.IGNORECASE if _to_bool(ignore_case) else 0
+            try:
+                regex = re.compile(pattern, flags)
+            except re.error:
+                regex = re.compile(re.escape(pattern), flags)  # 不是合法的正则表达式时按普通文本搜索
+
+            if os.path.isfile(root):
+                files = [root]
+            else:
+                files = _walk_files(root, self.workspace)
+
+            matches, scanned, truncated = [], 0, False
+            for file in files:
+                if _is_binary(file):
+                    continue
+                scanned += 1
+                rel = os.path.relpath(file, self.workspace)
+                with open(file, 'r', encoding='utf-8', errors='replace') as f:
+                    for line_no, line in enumerate(f, 1):
+                        if regex.search(line):
+                            if len(matches) >= limit:
+                                truncated = True
+                                break
+                            line = line.rstrip("\n")
+                            if len(line) > 300:
+                                line = line[:300] + "…"
+                            matches.append(f"{rel}:{line_no}: {line}")
+                if truncated:
+                    break
+
+            if not matches:
+                return ToolResult.ok(f"在 {scanned} 个文件中没有找到匹配 '{pattern}' 的行。")
+            result = f"找到 {len(matches)} 处匹配:\n" + "\n".join(matches)
+            if truncated:
+                result += f"\n(已达到 {limit} 处匹配的上限，请使用更具体的模式或 path 缩小范围。)"
+            return ToolResult.ok(result)
+        except ValueError as e:
+            return ToolResult.error(f"错误：无效的参数。{e}")
+        except Exception as e:
+            return ToolResult.error(f"搜索文件时出错：{e}")
 
 class WriteFileTool(BaseTool):
     name = "write_file"
-    description = "将内容写入工作区中的指定文件。如果文件已存在，则会覆盖它。"
+    side_effect = "workspace"
+    description = (
+        "将内容写入工作区中的指定文件。如果文件已存在，则会覆盖它。"
+        "可选参数: mode ('overwrite' 覆盖写入，默认；'append' 追加到文件末尾)。"
+    )
 
-    def execute(self, file_path: str, content: str, **kwargs) -> str:
-        """将内容写入文件。"""
+    def execute(self, file_path: str, content: str, mode: str = "overwrite", **kwargs) -> ToolResult:
+        """
+        将内容写入文件。覆盖写入时先写临时文件再原子替换，不会留下写了一半的文件。
+
+        参数:
+            file_path (str): 要写入的文件路径 (相对于工作区)。
+            content (str): 要写入的内容。
+            mode (str): 'overwrite' 覆盖写入，或 'append' 追加到文件末尾。
+        """
+        mode = mode or "overwrite"
+        if mode not in ("overwrite", "append"):
+            # 拼错的模式不能按覆盖写入处理，否则会清空原有内容
+            return ToolResult.error(f"错误：无效的写入模式 '{mode}'，只能是 'overwrite' 或 'append'。")
         try:
-            # 已修正：使用 AppConfig.WORKSPACE_PATH
-            secure_path = _secure_join(AppConfig.WORKSPACE_PATH, file_path)
-            with open(secure_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            return f"内容已成功写入文件 '{file_path}'。"
+            secure_path = _secure_join(self.workspace, file_path)
+            directory = os.path.dirname(secure_path)
+            os.makedirs(directory, exist_ok=True)
+
+            if mode == "append":
+                with open(secure_path, 'a', encoding='utf-8') as f:
+                    f.write(content)
+                return ToolResult.ok(f"内容已成功追加到文件 '{file_path}'。")
+
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(secure_path))
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(content)
+                    f.flush()
+                    os.fsync(f.fileno())
+                mode_bits = os.stat(secure_path).st_mode if os.path.exists(secure_path) else 0o644
+                os.chmod(tmp_path, mode_bits & 0o7777)
+                os.replace(tmp_path, secure_path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            return ToolResult.ok(f"内容已成功写入文件 '{file_path}'。")
         except ValueError as e:
-            return f"错误：无效的文件路径。{e}"
+            return ToolResult.error(f"错误：无效的文件路径。{e}")
         except Exception as e:
-            return f"写入文件 '{file_path}' 时出错：{e}"
+            return ToolResult.error(f"写入文件 '{file_path}' 时出错：{e}")
@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
-from tools.base_tool import BaseTool
+from tools.base_tool import BaseTool, ToolResult
 
 class FinishTool(BaseTool):
     name = "finish"
+    side_effect = "control"
     description = "当您认为整个任务已完成时，调用此工具并提供最终摘要以结束流程。"
 
-    def execute(self, summary: str, **kwargs) -> str:
+    def execute(self, summary: str, **kwargs) -> ToolResult:
         """
         标志着任务已完成。
 
@@ -13,8 +14,27 @@ class FinishTool(BaseTool):
             summary (str): 对已完成任务的最终摘要或最终结果。
 
         返回:
-            str: 确认任务已完成的消息。
+            ToolResult: 确认任务已完成的消息。
         """
         if not summary:
-            return "任务已完成，但未提供摘要。"
-        return f"任务成功完成。最终摘要：{summary}"
\ No newline at end of file
+            return ToolResult.ok("任务已完成，但未提供摘要。")
+        return ToolResult.ok(f"任务成功完成。最终摘要：{summary}")
+
+class StepCompleteTool(BaseTool):
+    name = "step_complete"
+    description = "当前计划步骤的目标已经达成时，调用此工具并简要说明结果，以进入计划的下一步。"
+    read_only = True
+    side_effect = "control"
+
+    def execute(self, summary: str = "", **kwargs) -> ToolResult:
+        """
+        标志着当前计划步骤已完成。
+
+        参数:
+            summary (str): 本步骤得到的结果 (文件名、数值、结论等)。
+
+        返回:
+            ToolResult: 确认步骤已完成的消息。
+        """
+        message = f"当前步骤已完成。结果：{summary}" if summary else "当前步骤已完成。"
+        return ToolResult.ok(message, step_complete=True)
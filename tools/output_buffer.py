@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from collections import deque
+
+
+class HeadTailBuffer:
+    """
+    有上限的输出缓冲区。
+    保留最先写入的 head 部分和最后写入的 tail 部分，中间超出上限的内容只计数不保存，
+    因此无论输出多大，内存占用都是固定的。
+    """
+    def __init__(self, max_bytes: int):
+        """
+        参数:
+            max_bytes (int): 保留的最大字节数，头尾各占一半
+        """
+        self.head_limit = max_bytes // 2
+        self.tail_limit = max_bytes - self.head_limit
+        self.head = bytearray()
+        self.tail = deque()
+        self.tail_size = 0
+        self.total_bytes = 0
+
+    def write(self, data: bytes):
+        self.total_bytes += len(data)
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if not data or self.tail_limit <= 0:
+            return
+        self.tail.append(data)
+        self.tail_size += len(data)
+        # 丢弃超出尾部上限的最早数据
+        while self.tail_size - len(self.tail[0]) >= self.tail_limit:
+            self.tail_size -= len(self.tail.popleft())
+
+    @property
+    def dropped_bytes(self) -> int:
+        """被截掉 (未保留) 的字节数"""
+        kept_tail = min(self.tail_size, self.tail_limit)
+        return self.total_bytes - len(self.head) - kept_tail
+
+    def getvalue(self, encoding: str = "utf-8") -> str:
+        """返回保留的内容；如有截断，在头尾之间插入省略标记"""
+        tail = b"".join(self.tail)[-self.tail_limit:] if self.tail_limit > 0 else b""
+        head_text = bytes(self.head).decode(encoding, errors="replace")
+        tail_text = tail.decode(encoding, errors="replace")
+        if self.dropped_bytes:
+            return f"{head_text}\n...[已截断 {self.dropped_bytes} 字节]...\n{tail_text}"
+        return head_text + tail_text
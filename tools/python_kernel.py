@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+import atexit
+import json
+import logging
+import os
+import selectors
+import signal
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+from tools.output_buffer import HeadTailBuffer
+
+_WORKER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "_kernel_worker.py")
+
+
+@dataclass
+class KernelResult:
+    """
+    一次代码执行的结果。
+
+    属性:
+        ok (bool): 代码是否无异常地执行完毕
+        output (str): 捕获的输出 (超出上限时保留头尾)
+        error (Optional[str]): 异常信息
+        timed_out (bool): 是否超出了墙钟时间限制
+        restarted (bool): 内核是否因超时或崩溃被终止，之前的变量已丢失
+        dropped_bytes (int): 被截断的输出字节数
+        duration (float): 执行耗时 (秒)
+    """
+    ok: bool
+    output: str
+    error: Optional[str] = None
+    timed_out: bool = False
+    restarted: bool = False
+    dropped_bytes: int = 0
+    duration: float = 0.0
+
+
+class PythonKernel:
+    """
+    一个长期运行的 Python 内核子进程。
+    变量和导入在多次调用之间保留；通过 rlimit 限制内存和 CPU 时间，
+    超出墙钟时间时先中断执行，无响应则终止整个进程组。
+    """
+    def __init__(self, memory_mb: int = 0, prewarm_imports: Optional[List[str]] = None, startup_timeout: float = 30):
+        self.proc = subprocess.Popen(
+            [sys.executable, "-u", _WORKER_PATH],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            start_new_session=True,  # 独立进程组，超时时可以连同子进程一起终止
+        )
+        self._buffer = b""
+        self._send({"memory_mb": memory_mb, "prewarm_imports": prewarm_imports or []})
+        message = self._read_message(time.monotonic() + startup_timeout)
+        if not message or message.get("type") != "ready":
+            self.shutdown()
+            raise RuntimeError("Python 内核启动失败。")
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def _send(self, message: dict):
+        self.proc.stdin.write((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+        self.proc.stdin.flush()
+
+    def _read_message(self, deadline: float) -> Optional[dict]:
+        """读取一条协议消息；超过截止时间或进程退出时返回 None"""
+        fd = self.proc.stdout.fileno()
+        with selectors.DefaultSelector() as selector:
+            selector.register(fd, selectors.EVENT_READ)
+            while b"\n" not in self._buffer:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not selector.select(remaining):
+                    return None
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    return None
+                self._buffer += chunk
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return json.loads(line)
+
+    def _signal(self, sig):
+        try:
+            os.killpg(self.proc.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def chdir(self, path: str):
+        """切换内核的工作目录；失败时抛出 RuntimeError，避免代码在错误的目录中运行"""
+        self._send({"op": "chdir", "path": path})
+        message = self._read_message(time.monotonic() + 10)
+        if not message or not message.get("ok"):
+            reason = message.get("error") if message else "内核没有响应"
+            raise RuntimeError(f"无法切换到工作目录 '{path}'：{reason}")
+
+    def execute(self, code: str, timeout: float, cpu_seconds: float = 0, max_output_bytes: int = 20000,
+                interrupt_grace: float = 2.0) -> KernelResult:
+        """
+        在内核中执行代码。
+
+        参数:
+            code (str): 要执行的代码
+            timeout (float): 墙钟时间限制 (秒)
+            cpu_seconds (float): CPU 时间限制 (秒)，0 表示不限制
+            max_output_bytes (int): 保留在结果中的最大输出字节数
+            interrupt_grace (float): 超时后发送中断信号到强制终止之间的等待时间 (秒)
+        """
+        start = time.monotonic()
+        output = HeadTailBuffer(max_output_bytes)
+        # 内核最多传回 10 倍于保留上限的输出，避免刷屏的代码塞满管道
+        self._send({"op": "exec", "code": code, "cpu_seconds": cpu_seconds,
+                    "max_stream_bytes": max_output_bytes * 10})
+
+        deadline = start + timeout
+        interrupted = False
+        while True:
+            message = self._read_message(deadline)
+            if message is None:
+                if self.alive and not interrupted:
+                    # 先尝试中断，保留内核状态
+                    interrupted = True
+                    self._signal(signal.SIGINT)
+                    deadline = time.monotonic() + interrupt_grace
+                    continue
+                self.shutdown()
+                return KernelResult(
+                    ok=False, output=output.getvalue(), timed_out=interrupted,
+                    error="执行超时，内核已被终止。" if interrupted else "内核进程意外退出 (可能超出了内存或 CPU 限制)。",
+                    restarted=True, dropped_bytes=output.dropped_bytes, duration=time.monotonic() - start,
+                )
+            if message["type"] == "output":
+                output.write(message["data"].encode("utf-8", errors="replace"))
+            elif message["type"] == "result":
+                return KernelResult(
+                    ok=message["ok"], output=output.getvalue(), error=message["error"], timed_out=interrupted,
+                    dropped_bytes=output.dropped_bytes + message.get("dropped", 0),
+                    duration=time.monotonic() - start,
+                )
+
+    def shutdown(self):
+        """关闭内核进程"""
+        if self.proc.poll() is None:
+            try:
+                self.proc.stdin.close()
+                self.proc.wait(timeout=1)
+            except (OSError, subprocess.TimeoutExpired):
+                self._signal(signal.SIGKILL)
+                self.proc.wait()
+
+
+class KernelPool:
+    """
+    预热内核池。
+    后台始终保持若干个已完成启动和常用模块导入的空闲内核，
+    新会话获取内核时无需等待解释器启动。每个会话独占一个内核，用完即关闭。
+    """
+    def __init__(self, size: int, memory_mb: int, prewarm_imports: List[str]):
+        self.size = size
+        self.memory_mb = memory_mb
+        self.prewarm_imports = prewarm_imports
+        self._idle: List[PythonKernel] = []
+        self._lock = threading.Lock()
+        self._refill()
+
+    def _spawn(self) -> PythonKernel:
+        return PythonKernel(memory_mb=self.memory_mb, prewarm_imports=self.prewarm_imports)
+
+    def _refill(self):
+        """在后台线程中补足空闲内核"""
+        def fill():
+            while True:
+                with self._lock:
+                    if len(self._idle) >= self.size:
+                        return
+                try:
+                    kernel = self._spawn()
+                except Exception as e:
+                    logging.warning(f"⚠️ 预热 Python 内核失败：{e}")
+                    return
+                with self._lock:
+                    self._idle.append(kernel)
+
+        if self.size > 0:
+            threading.Thread(target=fill, daemon=True, name="kernel-prewarm").start()
+
+    def acquire(self, cwd: str) -> PythonKernel:
+        """获取一个内核并切换到指定工作目录"""
+        kernel = None
+        with self._lock:
+            while self._idle and kernel is None:
+                candidate = self._idle.pop()
+                if candidate.alive:
+                    kernel = candidate
+        if kernel is None:
+            kernel = self._spawn()
+        self._refill()
+        try:
+            kernel.chdir(cwd)
+        except Exception:
+            kernel.shutdown()  # 工作目录不对的内核不能再交给任何会话
+            raise
+        return kernel
+
+    def shutdown(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for kernel in idle:
+            kernel.shutdown()
+
+
+_pool: Optional[KernelPool] = None
+_pool_lock = threading.Lock()
+
+def get_kernel_pool() -> KernelPool:
+    """返回全局共享的内核池 (首次使用时按配置创建)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            from config import AppConfig
+            _pool = KernelPool(
+                size=AppConfig.PYTHON_POOL_SIZE,
+                memory_mb=AppConfig.PYTHON_MEMORY_MB,
+                prewarm_imports=AppConfig.PYTHON_PREWARM_IMPORTS,
+            )
+            atexit.register(_pool.shutdown)
+        return _pool
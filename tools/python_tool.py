@@ -1,48 +1,72 @@
 # -*- coding: utf-8 -*-
 import logging
-import io
-import contextlib
-from tools.base_tool import BaseTool
+import threading
+from config import AppConfig
+from tools.base_tool import BaseTool, ToolResult
+from tools.python_kernel import get_kernel_pool
 
 class PythonTool(BaseTool):
     name = "python"
+    side_effect = "execute"
+    cost = "medium"
     description = (
-        "执行一段 Python 代码并返回其输出。"
-        "⚠️ 警告：此工具在当前进程中直接执行代码，没有沙箱环境。请极其谨慎使用。"
-        "您可以使用 `logging.info()` 来输出结果。代码无法访问外部变量，但可以导入标准库。"
+        "在持久的 Python 内核中执行一段代码并返回其输出。"
+        "变量和导入会在多次调用之间保留，无需重复导入或重新计算。"
+        "请使用 `print()` 输出结果。代码在工作区目录中运行，并受 CPU、内存和执行时间限制。"
+        "⚠️ 警告：内核是本机上的独立子进程，不是完整的沙箱。请谨慎使用。"
     )
 
-    def execute(self, code: str, **kwargs) -> str:
+    def __init__(self, workspace=None):
+        super().__init__(workspace)
+        # 每个工具实例 (即每个任务会话) 独占一个内核，首次执行时从预热池中获取
+        self._kernel = None
+        self._lock = threading.Lock()
+
+    def execute(self, code: str, **kwargs) -> ToolResult:
         """
-        执行一个 Python 代码字符串。
+        在本会话的 Python 内核中执行一个代码字符串。
 
         参数:
             code (str): 要执行的 Python 代码。
 
         返回:
-            str: 从代码执行中捕获的标准输出和标准错误。
+            ToolResult: 从代码执行中捕获的标准输出和标准错误；代码抛出异常时状态为失败。
         """
         if not code:
-            return "错误：代码不能为空。"
+            return ToolResult.error("错误：代码不能为空。")
 
         logging.info(f"正在执行 python 代码:\n---\n{code}\n---")
 
-        # 创建一个字符串流来捕获 stdout 和 stderr
-        output_stream = io.StringIO()
-
-        try:
-            # 使用 contextlib.redirect_stdout 和 redirect_stderr 来捕获所有输出
-            with contextlib.redirect_stdout(output_stream), contextlib.redirect_stderr(output_stream):
-                # 使用 exec 来执行代码。
-                # 提供空的 globals 和 locals 字典来创建一个某种程度上隔离的作用域，
-                # 尽管它不是一个真正的沙箱。
-                exec(code, {}, {})
-
-            output = output_stream.getvalue()
-            if not output:
-                return "代码成功执行，没有输出。"
-            return f"代码执行输出:\n{output.strip()}"
-
-        except Exception as e:
-            # 同时捕获异常发生前产生的任何输出
-            return f"代码执行期间发生错误: {e}\n捕获的输出:\n{output_stream.getvalue().strip()}"
+        # 并发执行的步骤共享同一个会话内核，需要串行访问
+        with self._lock:
+            try:
+                if self._kernel is None or not self._kernel.alive:
+                    self._kernel = get_kernel_pool().acquire(self.workspace)
+                result = self._kernel.execute(
+                    code,
+                    timeout=AppConfig.PYTHON_TIMEOUT_SECONDS,
+                    cpu_seconds=AppConfig.PYTHON_CPU_SECONDS,
+                    max_output_bytes=AppConfig.PYTHON_MAX_OUTPUT_BYTES,
+                )
+            except Exception as e:
+                return ToolResult.error(f"启动或访问 Python 内核时出错: {e}")
+
+        output = result.output.strip()
+        notes = ""
+        if result.dropped_bytes:
+            notes += f"\n(输出过长，已截断 {result.dropped_bytes} 字节)"
+        if result.restarted:
+            notes += "\n⚠️ 内核已被终止，之前定义的变量和导入已丢失。"
+
+        if not result.ok:
+            return ToolResult.error(f"代码执行期间发生错误: {result.error}\n捕获的输出:\n{output}{notes}")
+        if not output:
+            return ToolResult.ok(f"代码成功执行，没有输出。{notes}")
+        return ToolResult.ok(f"代码执行输出:\n{output}{notes}")
+
+    def close(self):
+        """关闭本会话的内核"""
+        with self._lock:
+            if self._kernel is not None:
+                self._kernel.shutdown()
+                self._kernel = None
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from importlib.metadata import EntryPoint, entry_points
+from typing import Dict, List, Optional, Type
+
+from config import AppConfig
+from tools.base_tool import BaseTool
+
+# 第三方工具通过该入口点组注册，例如在其 pyproject.toml 中：
+#   [project.entry-points."openmanus_lite.tools"]
+#   web_search = "my_package.search:WebSearchTool"
+ENTRY_POINT_GROUP = "openmanus_lite.tools"
+
+# 内置工具：名称 -> "模块:类名"，按提供给智能体的顺序排列。
+# 工具模块只在第一次用到时才导入，导入编排器本身不会加载任何工具模块 (及其依赖)。
+BUILTIN_TOOLS: Dict[str, str] = {
+    "read_file": "tools.file_tools:ReadFileTool",
+    "write_file": "tools.file_tools:WriteFileTool",
+    "list_files": "tools.file_tools:ListFilesTool",
+    "grep_file": "tools.file_tools:GrepFileTool",
+    "read_artifact": "tools.artifact_tool:ReadArtifactTool",
+    "shell": "tools.shell_tool:ShellTool",
+    "python": "tools.python_tool:PythonTool",
+    "step_complete": "tools.finish_tool:StepCompleteTool",
+    "finish": "tools.finish_tool:FinishTool",
+}
+
+# 控制执行流程的工具，无论选择哪些工具子集都会提供给智能体
+ALWAYS_ENABLED = ["step_complete", "finish"]
+# 读取历史中工件句柄所指内容的工具，只在启用工件存储时提供，此时同样总是可用
+ARTIFACT_TOOL = "read_artifact"
+
+
+@dataclass(frozen=True)
+class ToolSpec:
+    """
+    一个已注册 (尚未导入) 的工具。
+
+    属性:
+        name (str): 工具名称
+        target (str): 工具类的位置，"模块:类名"
+        source (str): 提供该工具的来源，"builtin" 或第三方发行包的名称
+    """
+    name: str
+    target: str
+    source: str = "builtin"
+
+
+@dataclass(frozen=True)
+class ToolsetPrompt:
+    """
+    一组工具渲染后的提示片段和函数调用定义，按工具集指纹缓存，同一组工具的所有智能体共享。
+
+    属性:
+        fingerprint (str): 工具集指纹 (工具名称及其类的哈希)
+        description (str): 系统提示中的工具描述
+        tools_list (str): 用户提示中包含参数的工具列表
+        schemas (List[dict]): 原生函数调用的工具定义
+    """
+    fingerprint: str
+    description: str
+    tools_list: str
+    schemas: List[dict]
+
+
+_specs: Optional[Dict[str, ToolSpec]] = None
+_classes: Dict[str, Type[BaseTool]] = {}
+_prompts: Dict[str, ToolsetPrompt] = {}
+_lock = threading.Lock()
+
+
+def _discover() -> Dict[str, ToolSpec]:
+    """内置工具加上通过入口点注册的第三方工具；同名时内置工具优先"""
+    specs = {name: ToolSpec(name, target) for name, target in BUILTIN_TOOLS.items()}
+    if not AppConfig.TOOLS_DISCOVER_PLUGINS:
+        return specs
+    try:
+        plugins = entry_points(group=ENTRY_POINT_GROUP)
+    except Exception as e:
+        logging.warning(f"⚠️ 读取工具入口点失败：{e}")
+        return specs
+    for ep in plugins:
+        source = ep.dist.name if getattr(ep, "dist", None) else "unknown"
+        if ep.name in specs:
+            logging.warning(f"⚠️ {source} 注册的工具 '{ep.name}' 与已有工具同名，已忽略。")
+            continue
+        specs[ep.name] = ToolSpec(ep.name, ep.value, source)
+    return specs
+
+
+def registered_tools() -> Dict[str, ToolSpec]:
+    """返回所有已注册的工具 {名称: ToolSpec}；只读取入口点，不导入任何工具模块"""
+    global _specs
+    if _specs is None:
+        with _lock:
+            if _specs is None:
+                _specs = _discover()
+    return _specs
+
+
+def tool_names() -> List[str]:
+    """返回所有已注册工具的名称 (不导入任何工具模块)"""
+    return list(registered_tools())
+
+
+def get_tool_class(name: str) -> Type[BaseTool]:
+    """
+    返回工具类，第一次调用时导入其所在模块。
+
+    参数:
+        name (str): 工具名称
+
+    返回:
+        Type[BaseTool]: 工具类
+    """
+    cls = _classes.get(name)
+    if cls is not None:
+        return cls
+    spec = registered_tools().get(name)
+    if spec is None:
+        raise KeyError(f"未注册的工具: {name}")
+    with _lock:
+        cls = _classes.get(name)
+        if cls is None:
+            cls = EntryPoint(name, spec.target, ENTRY_POINT_GROUP).load()
+            if not (isinstance(cls, type) and issubclass(cls, BaseTool)):
+                raise TypeError(f"{spec.target} 不是 BaseTool 的子类")
+            if not isinstance(cls.name, str) or not isinstance(cls.description, str):
+                raise TypeError(f"{spec.target} 的 name 和 description 必须是类属性 (提示片段和定义按类生成并缓存)")
+            if cls.name != name:
+                raise TypeError(f"{spec.target} 的工具名称为 '{cls.name}'，与注册的名称 '{name}' 不一致")
+            _classes[name] = cls
+    return cls
+
+
+def resolve_names(names: Optional[List[str]] = None) -> List[str]:
+    """
+    确定要提供给智能体的工具名称。
+
+    参数:
+        names (Optional[List[str]]): 工具子集；为空时使用全部已注册的工具
+
+    返回:
+        List[str]: 按注册顺序排列的工具名称，总是包含 ALWAYS_ENABLED 中的工具；
+            启用工件存储时总是包含 read_artifact，未启用时不包含
+    """
+    registered = tool_names()
+    unknown = [n for n in names or [] if n not in registered]
+    if unknown:
+        raise KeyError(f"未注册的工具: {', '.join(unknown)}")
+    wanted = set(names or registered) | set(ALWAYS_ENABLED)
+    if AppConfig.ARTIFACTS_ENABLED:
+        wanted.add(ARTIFACT_TOOL)
+    else:
+        wanted.discard(ARTIFACT_TOOL)  # 没有工件存储时该工具只会失败
+    return [n for n in registered if n in wanted]
+
+
+def create_tools(workspace: Optional[str] = None, names: Optional[List[str]] = None) -> List[BaseTool]:
+    """
+    创建一组工具实例。未指定子集时，无法加载的第三方工具会被跳过；明确指定的工具无法加载时抛出异常。
+
+    参数:
+        workspace (Optional[str]): 工具操作的工作区目录，默认使用全局配置的工作区
+        names (Optional[List[str]]): 要创建的工具子集，默认创建全部已注册的工具
+
+    返回:
+        List[BaseTool]: 按注册顺序排列的工具实例
+    """
+    tools = []
+    for name in resolve_names(names):
+        try:
+            cls = get_tool_class(name)
+        except Exception as e:
+            if names or registered_tools()[name].source == "builtin":
+                raise
+            logging.error(f"❌ 加载工具 '{name}' 失败，已跳过：{e}")
+            continue
+        tools.append(cls(workspace))
+    return tools
+
+
+def render_toolset(tools: List[BaseTool]) -> ToolsetPrompt:
+    """
+    渲染一组工具的提示片段和函数调用定义。
+    结果按工具集指纹缓存，批量运行时为每个任务创建的智能体不必重复生成。
+    """
+    classes = [type(tool) for tool in tools]
+    key = json.dumps([[cls.name, f"{cls.__module__}.{cls.__qualname__}"] for cls in classes])
+    fingerprint = hashlib.sha256(key.encode("utf-8")).hexdigest()[:12]
+    prompt = _prompts.get(fingerprint)
+    if prompt is None:
+        prompt = _prompts[fingerprint] = ToolsetPrompt(
+            fingerprint=fingerprint,
+            description="\n".join(f"- {cls.name}: {cls.description}" for cls in classes),
+            tools_list="\n".join(f"  - {cls.name}({cls.get_args_str()}): {cls.description}" for cls in classes),
+            schemas=[cls.get_tool_schema() for cls in classes],
+        )
+    return prompt
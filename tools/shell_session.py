@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+import os
+import selectors
+import shutil
+import signal
+import subprocess
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from tools.output_buffer import HeadTailBuffer
+
+_SHELL = shutil.which("bash") or "/bin/sh"
+
+
+@dataclass
+class ShellResult:
+    """
+    一次 shell 命令执行的结果。
+
+    属性:
+        exit_code (Optional[int]): 退出码，超时被终止时为 None
+        stdout (str): 捕获的标准输出 (超出上限时保留头尾)
+        stderr (str): 捕获的标准错误 (超出上限时保留头尾)
+        timed_out (bool): 是否超出了时间限制
+        duration (float): 执行耗时 (秒)
+        stdout_dropped (int): 被截断的标准输出字节数
+        stderr_dropped (int): 被截断的标准错误字节数
+        session_reset (bool): 持久会话是否已结束，工作目录和环境变量已丢失
+    """
+    exit_code: Optional[int]
+    stdout: str
+    stderr: str
+    timed_out: bool = False
+    duration: float = 0.0
+    stdout_dropped: int = 0
+    stderr_dropped: int = 0
+    session_reset: bool = False
+
+
+def _kill_group(proc: subprocess.Popen, grace: float = 1.0):
+    """终止整个进程组：先发送 SIGTERM，宽限期后发送 SIGKILL，确保命令派生的子进程也被清理"""
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        return
+    try:
+        proc.wait(timeout=grace)
+    except subprocess.TimeoutExpired:
+        pass
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+    proc.wait()
+
+
+def run_command(command: str, cwd: str, timeout: float, max_output_bytes: int) -> ShellResult:
+    """
+    在独立进程组中执行一条命令，增量读取输出。
+
+    参数:
+        command (str): 要执行的 shell 命令
+        cwd (str): 工作目录
+        timeout (float): 时间限制 (秒)，超时后终止整个进程组
+        max_output_bytes (int): stdout 和 stderr 各自保留的最大字节数
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    proc = subprocess.Popen(
+        command,
+        shell=True,
+        cwd=cwd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+    )
+    stdout, stderr = HeadTailBuffer(max_output_bytes), HeadTailBuffer(max_output_bytes)
+    buffers = {proc.stdout.fileno(): stdout, proc.stderr.fileno(): stderr}
+
+    timed_out = False
+    with selectors.DefaultSelector() as selector:
+        for fd in buffers:
+            selector.register(fd, selectors.EVENT_READ)
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                break
+            events = selector.select(min(remaining, 0.2))
+            if not events and proc.poll() is not None:
+                break  # 命令已退出，但其后台子进程仍持有管道，不再等待
+            for key, _ in events:
+                chunk = os.read(key.fd, 65536)
+                if chunk:
+                    buffers[key.fd].write(chunk)
+                else:
+                    selector.unregister(key.fd)
+
+    if not timed_out:
+        try:
+            proc.wait(timeout=max(deadline - time.monotonic(), 0))
+        except subprocess.TimeoutExpired:
+            timed_out = True
+    if timed_out:
+        _kill_group(proc)
+    proc.stdout.close()
+    proc.stderr.close()
+
+    return ShellResult(
+        exit_code=None if timed_out else proc.returncode,
+        stdout=stdout.getvalue(),
+        stderr=stderr.getvalue(),
+        timed_out=timed_out,
+        duration=time.monotonic() - start,
+        stdout_dropped=stdout.dropped_bytes,
+        stderr_dropped=stderr.dropped_bytes,
+    )
+
+
+class _MarkerReader:
+    """把会话输出写入有上限的缓冲区，直到读到结束标记；标记之后的内容 (退出码) 单独保存"""
+    def __init__(self, marker: bytes, max_bytes: int):
+        self.marker = b"\n" + marker
+        self.buffer = HeadTailBuffer(max_bytes)
+        self.pending = b""
+        self.trailer: Optional[bytes] = None
+
+    def feed(self, data: bytes):
+        if self.trailer is not None:
+            self.trailer += data
+            return
+        self.pending += data
+        index = self.pending.find(self.marker)
+        if index >= 0:
+            self.buffer.write(self.pending[:index])
+            self.trailer = self.pending[index + len(self.marker):]
+            self.pending = b""
+            return
+        # 保留可能是标记开头的末尾部分，其余写入缓冲区
+        keep = len(self.marker) - 1
+        if len(self.pending) > keep:
+            self.buffer.write(self.pending[:-keep])
+            self.pending = self.pending[-keep:]
+
+    @property
+    def done(self) -> bool:
+        return self.trailer is not None and b"\n" in self.trailer
+
+
+class ShellSession:
+    """
+    持久的 shell 会话。
+    所有命令在同一个 shell 进程中执行，因此 `cd`、`export` 等状态在多次调用之间保留。
+    每条命令之后输出一个随机结束标记 (附带退出码)，据此判断命令何时结束。
+    """
+    def __init__(self, cwd: str):
+        self.marker = f"__OPENMANUS_DONE_{uuid.uuid4().hex}__"
+        args = [_SHELL, "--noprofile", "--norc"] if os.path.basename(_SHELL) == "bash" else [_SHELL]
+        self.proc = subprocess.Popen(
+            args,
+            cwd=cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def run(self, command: str, timeout: float, max_output_bytes: int) -> ShellResult:
+        """
+        在会话中执行一条命令。超时或会话意外退出时，整个会话会被终止，下次调用时重新创建。
+
+        参数:
+            command (str): 要执行的 shell 命令
+            timeout (float): 时间限制 (秒)
+            max_output_bytes (int): stdout 和 stderr 各自保留的最大字节数
+        """
+        start = time.monotonic()
+        # 先做语法检查：未闭合的引号会让会话吞掉结束标记，只能等到超时
+        check = subprocess.run([_SHELL, "-n", "-c", command], capture_output=True, timeout=10)
+        if check.returncode != 0:
+            return ShellResult(
+                exit_code=check.returncode, stdout="",
+                stderr=check.stderr.decode("utf-8", errors="replace"),
+                duration=time.monotonic() - start,
+            )
+
+        # 命令的标准输入指向 /dev/null，避免它读走后续写入会话的内容
+        script = (
+            f"{{ {command}\n}} < /dev/null\n"
+            f"printf '\\n%s %d\\n' '{self.marker}' \"$?\"\n"
+            f"printf '\\n%s\\n' '{self.marker}' >&2\n"
+        )
+        marker = self.marker.encode()
+        stdout = _MarkerReader(marker, max_output_bytes)
+        stderr = _MarkerReader(marker, max_output_bytes)
+        readers: Dict[int, _MarkerReader] = {self.proc.stdout.fileno(): stdout, self.proc.stderr.fileno(): stderr}
+
+        timed_out = session_lost = False
+        try:
+            self.proc.stdin.write(script.encode("utf-8"))
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError):
+            session_lost = True
+
+        deadline = start + timeout
+        with selectors.DefaultSelector() as selector:
+            for fd in readers:
+                selector.register(fd, selectors.EVENT_READ)
+            while not session_lost and not (stdout.done and stderr.done):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    timed_out = True
+                    break
+                events = selector.select(min(remaining, 0.2))
+                if not events and not self.alive:
+                    # 命令执行了 exit，或会话被外部终止 (后台子进程可能仍持有管道，读不到 EOF)
+                    session_lost = True
+                for key, _ in events:
+                    chunk = os.read(key.fd, 65536)
+                    if not chunk:
+                        session_lost = True
+                        break
+                    readers[key.fd].feed(chunk)
+
+        exit_code = None
+        if timed_out or session_lost:
+            self.close()
+            # 会话结束时尚未输出的内容也保留下来
+            for reader in readers.values():
+                if reader.trailer is None and reader.pending:
+                    reader.buffer.write(reader.pending)
+            if session_lost:
+                exit_code = self.proc.returncode
+        else:
+            try:
+                exit_code = int(stdout.trailer.split()[0])
+            except (ValueError, IndexError):
+                exit_code = None
+
+        return ShellResult(
+            exit_code=exit_code,
+            stdout=stdout.buffer.getvalue(),
+            stderr=stderr.buffer.getvalue(),
+            timed_out=timed_out,
+            duration=time.monotonic() - start,
+            stdout_dropped=stdout.buffer.dropped_bytes,
+            stderr_dropped=stderr.buffer.dropped_bytes,
+            session_reset=timed_out or session_lost,
+        )
+
+    def close(self):
+        """终止会话及其派生的所有进程"""
+        if self.proc.stdin and not self.proc.stdin.closed:
+            try:
+                self.proc.stdin.close()
+            except OSError:
+                pass
+        if self.proc.poll() is None:
+            _kill_group(self.proc, grace=0.5)
+        else:
+            # 会话进程已退出，仍清理可能残留的后台子进程
+            try:
+                os.killpg(self.proc.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+        self.proc.stdout.close()
+        self.proc.stderr.close()
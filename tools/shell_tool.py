@@ -1,18 +1,85 @@
 # -*- coding: utf-8 -*-
-import subprocess
 import logging
-from tools.base_tool import BaseTool
+import re
+import shlex
+import threading
 from config import AppConfig
+from tools.base_tool import BaseTool, ToolResult
+from tools.shell_session import ShellSession, run_command
+
+# 不修改任何状态、也不会执行其他命令的常用命令；只由这些命令 (及管道) 组成的调用可以与其他只读行动并发执行
+_READ_ONLY_COMMANDS = {
+    "ls", "cat", "head", "tail", "wc", "grep", "egrep", "fgrep", "rg", "find", "pwd", "echo",
+    "du", "df", "stat", "file", "sort", "cut", "tr", "diff", "cmp", "md5sum", "sha256sum",
+    "which", "whoami", "printenv", "uname", "tree", "jq", "nl", "basename", "dirname",
+}
+# 这些参数会让上面的命令写文件或执行其他命令
+_WRITE_FLAGS = {"-delete", "-exec", "-execdir", "-ok", "-okdir", "-fprint", "-fprint0", "-fprintf", "-fls"}
+# 以这些前缀开头的参数同样有副作用 (-o x.txt、-ox.txt、--output=x.txt、rg --pre=cmd、sort --compress-program=cmd)
+_WRITE_PREFIXES = ("-o", "--output", "--pre", "--compress-program")
+# 这些命令的组合短选项 (例如 sort -uo x.txt) 中出现这些字母时有副作用
+_WRITE_SHORT_OPTIONS = {"sort": "o", "tree": "o", "file": "C"}
+
+
+def _is_read_only_segment(words: list) -> bool:
+    """管道中的一段命令是否只读；无法确定时视为有副作用"""
+    if not words or words[0] not in _READ_ONLY_COMMANDS:
+        return False
+    short_options = _WRITE_SHORT_OPTIONS.get(words[0], "")
+    for word in words[1:]:
+        if word in _WRITE_FLAGS or word.startswith(_WRITE_PREFIXES):
+            return False
+        if short_options and re.match(r"-[^-]", word) and any(ch in word for ch in short_options):
+            return False
+    return True
 
 class ShellTool(BaseTool):
     name = "shell"
+    side_effect = "execute"
+    cost = "medium"
     description = (
         "在本地系统上执行 shell 命令。"
         "⚠️ 警告：此工具直接在主机上执行命令，没有沙箱环境。请极其谨慎使用。"
         "所有命令都在代理的工作区目录中执行。"
+        "输出过长时只保留开头和结尾部分，请尽量用 head、tail、grep 等命令缩小输出范围。"
     )
 
-    def execute(self, command: str, **kwargs) -> str:
+    def __init__(self, workspace=None):
+        super().__init__(workspace)
+        # 启用持久会话时，每个工具实例 (即每个任务会话) 独占一个 shell 进程
+        self._session = None
+        self._lock = threading.Lock()
+
+    def is_read_only(self, args: dict) -> bool:
+        """
+        保守地判断命令是否只读：不能含有重定向、命令替换、换行或后台执行，
+        每个管道段都必须是已知的只读命令且不带有副作用的参数；无法确定时一律串行执行。持久会话中的命令可能依赖或改变会话状态，一律视为有副作用。
+        """
+        command = args.get("command")
+        if not isinstance(command, str) or not command.strip() or AppConfig.SHELL_PERSISTENT_SESSION:
+            return False
+        if re.search(r"`|\$\(|[\r\n]", command):
+            return False  # 命令替换，或用换行分隔的多条命令
+        try:
+            lexer = shlex.shlex(command, posix=True, punctuation_chars=True)
+            lexer.whitespace_split = True
+            tokens = list(lexer)
+        except ValueError:
+            return False
+
+        segments, current = [], []
+        for token in tokens:
+            if token in ("|", "||", "&&", ";"):
+                segments.append(current)
+                current = []
+            elif token and all(ch in "();<>|&" for ch in token):
+                return False  # 重定向、后台执行或子 shell
+            else:
+                current.append(token)
+        segments.append(current)
+        return all(_is_read_only_segment(words) for words in segments)
+
+    def execute(self, command: str, **kwargs) -> ToolResult:
         """
         执行 shell 命令。
 
@@ -20,35 +87,54 @@ class ShellTool(BaseTool):
             command (str): 要执行的 shell 命令。
 
         返回:
-            str: 命令的输出（包括 stdout 和 stderr）。
+            ToolResult: 命令的输出（包括 stdout 和 stderr）以及退出码和耗时；超时或退出码非零时状态为失败。
         """
         if not command:
-            return "错误：命令不能为空。"
+            return ToolResult.error("错误：命令不能为空。")
 
-        workspace = AppConfig.WORKSPACE_PATH
+        workspace = self.workspace
+        timeout = AppConfig.SHELL_TIMEOUT_SECONDS
         logging.info(f"正在执行 shell 命令: `{command}` (在 `{workspace}` 中)")
         try:
-            result = subprocess.run(
-                command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                cwd=workspace, # 已修正：使用 workspace 变量
-                timeout=60
-            )
-
-            output = ""
-            if result.stdout:
-                output += f"STDOUT:\n{result.stdout.strip()}\n"
-            if result.stderr:
-                output += f"STDERR:\n{result.stderr.strip()}\n"
-
-            if not output:
-                return f"命令 '{command}' 成功执行，没有输出。"
-
-            return output.strip()
-
-        except subprocess.TimeoutExpired:
-            return f"错误：命令 '{command}' 在 60 秒后超时。"
+            if AppConfig.SHELL_PERSISTENT_SESSION:
+                # 并发执行的步骤共享同一个会话，需要串行访问
+                with self._lock:
+                    if self._session is None or not self._session.alive:
+                        self._session = ShellSession(workspace)
+                    result = self._session.run(command, timeout, AppConfig.SHELL_MAX_OUTPUT_BYTES)
+            else:
+                result = run_command(command, workspace, timeout, AppConfig.SHELL_MAX_OUTPUT_BYTES)
         except Exception as e:
-            return f"执行命令 '{command}' 时出错：{e}"
+            return ToolResult.error(f"执行命令 '{command}' 时出错：{e}")
+
+        output = ""
+        if result.stdout.strip():
+            output += f"STDOUT:\n{result.stdout.strip()}\n"
+        if result.stderr.strip():
+            output += f"STDERR:\n{result.stderr.strip()}\n"
+
+        notes = []
+        if result.stdout_dropped:
+            notes.append(f"(STDOUT 输出过长，已截断 {result.stdout_dropped} 字节)")
+        if result.stderr_dropped:
+            notes.append(f"(STDERR 输出过长，已截断 {result.stderr_dropped} 字节)")
+        if result.session_reset:
+            notes.append("⚠️ shell 会话已结束，工作目录和环境变量已重置。")
+        notes.append(f"(退出码: {result.exit_code}，耗时 {result.duration:.2f} 秒)")
+        notes = "\n".join(notes)
+
+        if result.timed_out:
+            return ToolResult.error(f"错误：命令 '{command}' 在 {timeout} 秒后超时，已终止其进程组。\n{output}{notes}")
+        if not output:
+            if result.exit_code == 0:
+                return ToolResult.ok(f"命令 '{command}' 成功执行，没有输出。\n{notes}")
+            return ToolResult.error(f"命令 '{command}' 执行结束，没有输出。\n{notes}")
+        # 非零退出码视为失败，输出仍完整返回给 LLM
+        return ToolResult(f"{output}{notes}", ToolResult.SUCCESS if result.exit_code == 0 else ToolResult.ERROR)
+
+    def close(self):
+        """关闭本会话的 shell 进程"""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None